@@ -0,0 +1,77 @@
+"""Scaling benchmark: adjacency-based deadlock detection vs. the original scan.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_detection --sizes 1000 10000 100000
+
+The original implementation scans every resource for each process and every
+process for each requested resource. It is skipped above ``--legacy-limit``
+nodes, where a single run takes far too long to be useful.
+"""
+
+import argparse
+import time
+
+import networkx as nx
+
+from benchmarks.generators import bipartite as random_engine
+
+
+def legacy_wait_for_graph(graph):
+    # The pre-engine implementation from sim_2.0.py, kept verbatim for comparison
+    processes = [n for n, attr in graph.nodes(data=True) if attr.get('type') == 'process']
+    resources = [n for n, attr in graph.nodes(data=True) if attr.get('type') == 'resource']
+    dependency_graph = nx.DiGraph()
+    for p in processes:
+        requested_resources = [r for r in resources if graph.has_edge(p, r)]
+        for req_resource in requested_resources:
+            resource_holders = [p2 for p2 in processes if graph.has_edge(req_resource, p2)]
+            for holder in resource_holders:
+                if holder != p:
+                    dependency_graph.add_edge(p, holder)
+    return dependency_graph
+
+
+def legacy_check_deadlock(graph):
+    try:
+        return list(nx.find_cycle(legacy_wait_for_graph(graph), orientation='original'))
+    except nx.NetworkXNoCycle:
+        return None
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--legacy-limit', type=int, default=10000,
+                        help="largest graph (in nodes) to run the original implementation on")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'nodes':>8} {'edges':>8} {'adjacency (s)':>14} {'original (s)':>14} {'speedup':>9}")
+    for n in args.sizes:
+        engine = random_engine(n, seed=args.seed)
+        new_time, new_cycle = best_of(engine.check_deadlock, args.repeat)
+        if n <= args.legacy_limit:
+            old_time, old_cycle = best_of(lambda: legacy_check_deadlock(engine.graph), 1)
+            assert (new_cycle is None) == (old_cycle is None)
+            old_col = f"{old_time:14.4f}"
+            speedup = f"{old_time / new_time:8.1f}x"
+        else:
+            old_col = f"{'skipped':>14}"
+            speedup = f"{'-':>9}"
+        print(f"{n:>8} {engine.graph.number_of_edges():>8} {new_time:14.4f} {old_col} {speedup}")
+
+
+if __name__ == '__main__':
+    main()
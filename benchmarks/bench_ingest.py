@@ -0,0 +1,94 @@
+"""Ingestion throughput: many socket clients streaming events into one engine.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_ingest --clients 16 --events 50000
+
+Each client plays a lock manager for its own processes and resources: a
+process requests and is granted a lock, another process queues behind it
+and gives up, and the lock is released. The server runs on a background
+thread; with ``--drain`` the events are applied the way the GUI applies
+them, by polling :meth:`IngestServer.drain` from the main thread.
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+from rag.engine import RAGEngine
+from rag.server import IngestServer
+
+
+def client_events(client, count, processes=8, resources=8):
+    # One lock round is five events; every event is valid on its own engine
+    events = []
+    for i in range(count // 5):
+        p = f'C{client}P{i % processes}'
+        q = f'C{client}P{(i + 1) % processes}'
+        r = f'C{client}R{i % resources}'
+        events += [
+            {'op': 'request', 'process': p, 'resource': r},
+            {'op': 'allocate', 'process': p, 'resource': r},
+            {'op': 'request', 'process': q, 'resource': r},
+            {'op': 'cancel', 'process': q, 'resource': r},
+            {'op': 'release', 'process': p, 'resource': r},
+        ]
+    return b''.join((json.dumps(e) + '\n').encode() for e in events)
+
+
+async def send(address, payload):
+    reader, writer = await asyncio.open_connection(*address)
+    writer.write(payload)
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_clients(address, payloads):
+    await asyncio.gather(*(send(address, payload) for payload in payloads))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--events', type=int, default=50000, help="events per client")
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--drain', action='store_true', help="apply from the main thread, as the GUI does")
+    args = parser.parse_args(argv)
+
+    payloads = [client_events(c, args.events) for c in range(args.clients)]
+    total = sum(payload.count(b'\n') for payload in payloads)
+    engine = RAGEngine()
+    server = IngestServer(engine, batch_size=args.batch_size)
+
+    if args.drain:
+        server.start_thread(port=0)
+    else:
+        started = threading.Event()
+        thread = threading.Thread(target=asyncio.run, daemon=True,
+                                  args=(server.serve(port=0, ready=started.set),))
+        thread.start()
+        started.wait()
+
+    start = time.perf_counter()
+    clients = threading.Thread(target=asyncio.run, args=(run_clients(server.address, payloads),))
+    clients.start()
+    while server.stats['applied'] + server.stats['errors'] < total:
+        if args.drain:
+            server.drain(budget=0.05)
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    clients.join()
+    server.stop()
+
+    stats = dict(server.stats)
+    stats['seconds'] = round(elapsed, 3)
+    stats['events_per_sec'] = round(total / elapsed, 1)
+    stats['nodes'] = engine.graph.number_of_nodes()
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
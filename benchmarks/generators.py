@@ -0,0 +1,105 @@
+"""Seeded graph generators for the benchmarks.
+
+Every generator takes a target node count and a seed and returns a fresh
+:class:`~rag.engine.RAGEngine`; the same arguments always build the same
+graph. Processes are named ``P<i>`` and resources ``R<i>``.
+"""
+
+import random
+
+from rag.engine import RAGEngine
+
+
+def bipartite(n_nodes, seed=0, request_p=0.5, allocation_p=0.8):
+    """Random allocation graph: half processes, half single-instance
+    resources, random allocations and requests (sparse, few cycles)."""
+    rng = random.Random(seed)
+    engine = RAGEngine()
+    n_proc = n_nodes // 2
+    processes = [f'P{i}' for i in range(n_proc)]
+    resources = [f'R{i}' for i in range(n_nodes - n_proc)]
+    for p in processes:
+        engine.add_process(p)
+    for r in resources:
+        engine.add_resource(r)
+    for r in resources:
+        if rng.random() < allocation_p:
+            engine.add_allocation_edge(r, rng.choice(processes))
+    for p in processes:
+        if rng.random() < request_p:
+            engine.add_request_edge(p, rng.choice(resources))
+    return engine
+
+
+def chains(n_nodes, seed=0, mean_length=50):
+    """Long wait chains ``P0 -> R0 -> P1 -> R1 -> ...`` that never close,
+    so detection has to walk every one of them."""
+    rng = random.Random(seed)
+    engine = RAGEngine()
+    i = 0
+    while 2 * i < n_nodes:
+        length = max(2, min(int(rng.expovariate(1 / mean_length)), (n_nodes - 2 * i) // 2))
+        _chain(engine, range(i, i + length), closed=False)
+        i += length
+    return engine
+
+
+def small_cycles(n_nodes, seed=0, low=2, high=4):
+    """Many disjoint deadlocks of ``low`` to ``high`` processes each."""
+    rng = random.Random(seed)
+    engine = RAGEngine()
+    i = 0
+    while 2 * i < n_nodes:
+        size = min(rng.randint(low, high), max((n_nodes - 2 * i) // 2, 1))
+        _chain(engine, range(i, i + size), closed=size > 1)
+        i += size
+    return engine
+
+
+def giant_cycle(n_nodes, seed=0):
+    """One deadlock running through every process."""
+    engine = RAGEngine()
+    _chain(engine, range(max(n_nodes // 2, 2)), closed=True)
+    return engine
+
+
+def contention(n_nodes, seed=0, instances=4, holds=3, requests=2):
+    """Dense contention: few multi-instance resources (about one per 20
+    processes), each process holding some and waiting for others."""
+    rng = random.Random(seed)
+    engine = RAGEngine()
+    n_res = max(n_nodes // 21, 2)
+    resources = [f'R{j}' for j in range(n_res)]
+    for r in resources:
+        engine.add_resource(r, instances)
+    free = {r: instances for r in resources}
+    for i in range(n_nodes - n_res):
+        p = f'P{i}'
+        engine.add_process(p)
+        for r in rng.sample(resources, min(holds + requests, n_res)):
+            if free[r] and rng.random() < holds / (holds + requests):
+                free[r] -= 1
+                engine.add_allocation_edge(r, p)
+            else:
+                engine.add_request_edge(p, r)
+    return engine
+
+
+def _chain(engine, ids, closed):
+    # P_k holds R_k and waits for R_{k+1}; a closed chain wraps around
+    ids = list(ids)
+    for k in ids:
+        engine.add_process(f'P{k}')
+        engine.add_resource(f'R{k}')
+        engine.add_allocation_edge(f'R{k}', f'P{k}')
+    for a, b in zip(ids, ids[1:] + ids[:1] if closed else ids[1:]):
+        engine.add_request_edge(f'P{a}', f'R{b}')
+
+
+GENERATORS = {
+    'bipartite': bipartite,
+    'chains': chains,
+    'small_cycles': small_cycles,
+    'giant_cycle': giant_cycle,
+    'contention': contention,
+}
@@ -0,0 +1,184 @@
+"""Benchmark suite: detection, layout and headless rendering across graph shapes.
+
+Run from the repository root::
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+
+Each generator in :mod:`benchmarks.generators` is built at every size with a
+fixed seed, and every measurement is the best of ``--repeat`` runs. Results
+are written as JSON (one record per generator, size and measurement, plus
+the library versions they were taken with). With ``--baseline`` every
+measurement is compared with the saved one and the exit status is 1 if any
+got slower by more than ``--tolerance``; differences under ``--noise``
+seconds are never counted, so tiny timings do not flap.
+
+Quadratic steps are skipped above a size limit: the spring layout above
+``--layout-limit`` nodes and the Banker's matrix check when the dense
+process x resource matrix would exceed ``--matrix-limit`` cells.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+from benchmarks.generators import GENERATORS
+from rag.analysis import cycle_edges
+from rag.compact import CompactGraph
+from rag.incremental import IncrementalDeadlockDetector
+from rag.layout import LayoutCache
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measurements(engine, args, render):
+    """Yield ``(name, callable)`` for everything worth timing on ``engine``."""
+    graph = engine.graph
+    n_nodes = len(graph)
+    yield 'detect', engine.check_deadlock
+    yield 'analyze', engine.analyze_deadlocks
+    compact = CompactGraph.from_engine(engine)
+    yield 'detect_compact', compact.check_deadlock
+    yield 'detect_incremental', lambda: IncrementalDeadlockDetector(engine).detach()
+    if len(engine.processes()) * len(engine.resources()) <= args.matrix_limit:
+        yield 'detect_matrix', engine.deadlocked_processes
+    if n_nodes <= args.layout_limit:
+        yield 'layout_spring', lambda: LayoutCache('spring').relayout(graph)
+    yield 'layout_bipartite', lambda: LayoutCache('bipartite').update(graph)
+    if render is not None and n_nodes <= args.render_limit:
+        pos = LayoutCache('bipartite').update(graph)
+        yield 'render', lambda: render(graph, pos)
+        cycle = engine.check_deadlock()
+        if cycle:
+            # What highlight_cycle does in the GUI
+            nodes = {edge[0] for edge in cycle}
+            yield 'render_highlight', lambda: render(graph, pos, nodes, cycle_edges(engine, nodes))
+
+
+def headless_renderer():
+    # A plain Agg figure: no Tk and no pyplot state
+    try:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        from rag.render import GraphRenderer
+    except ImportError:
+        return None
+    figure = Figure(figsize=(8, 6))
+    canvas = FigureCanvasAgg(figure)
+    renderer = GraphRenderer(figure.add_subplot())
+
+    def render(graph, pos, highlight_nodes=(), highlight_edges=()):
+        renderer.render(graph, pos, highlight_nodes, highlight_edges)
+        canvas.buffer_rgba()
+
+    return render
+
+
+def environment():
+    versions = {'python': platform.python_version(), 'platform': platform.platform()}
+    for module in ('networkx', 'numpy', 'matplotlib'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return versions
+
+
+def run(args):
+    render = None if args.no_render else headless_renderer()
+    results = []
+    for name in args.generators:
+        for size in args.sizes:
+            start = time.perf_counter()
+            engine = GENERATORS[name](size, seed=args.seed)
+            build = time.perf_counter() - start
+            base = {'generator': name, 'nodes': len(engine.graph), 'edges': engine.graph.number_of_edges()}
+            results.append(dict(base, measure='build', seconds=build))
+            for measure, fn in measurements(engine, args, render):
+                results.append(dict(base, measure=measure, seconds=best_of(fn, args.repeat)))
+                print(f"{name:>13} {size:>8} {measure:>20} {results[-1]['seconds']:10.4f}s",
+                      file=sys.stderr, flush=True)
+    return {'environment': environment(), 'seed': args.seed, 'repeat': args.repeat, 'results': results}
+
+
+def compare(report, baseline, tolerance, noise):
+    """Pair every result with the baseline; returns the regressed pairs."""
+    saved = {(r['generator'], r['nodes'], r['measure']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    print(f"{'generator':>13} {'nodes':>8} {'measure':>20} {'baseline':>10} {'now':>10} {'ratio':>7}",
+          file=sys.stderr)
+    for result in report['results']:
+        key = (result['generator'], result['nodes'], result['measure'])
+        if key not in saved:
+            continue
+        before, now = saved[key], result['seconds']
+        ratio = now / before if before > 0 else float('inf')
+        slower = ratio > 1 + tolerance and now - before > noise
+        result['baseline'] = before
+        result['ratio'] = round(ratio, 3)
+        if slower:
+            regressions.append(result)
+        print(f"{key[0]:>13} {key[1]:>8} {key[2]:>20} {before:10.4f} {now:10.4f} {ratio:6.2f}x"
+              f"{'  REGRESSION' if slower else ''}", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--generators', nargs='+', choices=list(GENERATORS), default=list(GENERATORS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--layout-limit', type=int, default=2000,
+                        help="largest graph (in nodes) to run the spring layout on")
+    parser.add_argument('--matrix-limit', type=int, default=25_000_000,
+                        help="largest process x resource matrix for the Banker's check")
+    parser.add_argument('--render-limit', type=int, default=100000,
+                        help="largest graph (in nodes) to render")
+    parser.add_argument('--no-render', action='store_true', help="skip headless rendering")
+    parser.add_argument('--output', help="write the results here instead of stdout")
+    parser.add_argument('--save-baseline', metavar='PATH', help="also save the results as a baseline")
+    parser.add_argument('--baseline', metavar='PATH', help="compare against a saved baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown before a result counts as a regression (default: 0.25)")
+    parser.add_argument('--noise', type=float, default=0.005,
+                        help="ignore differences smaller than this many seconds")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = run(args)
+    regressions = compare(report, baseline, args.tolerance, args.noise) if baseline else []
+    report['regressions'] = len(regressions)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if regressions:
+        print(f"{len(regressions)} measurement(s) regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""Headless Resource Allocation Graph engine.
+
+Submodules are imported lazily so that ``import rag`` stays cheap and never
+pulls in tkinter or matplotlib.
+"""
+
+import importlib
+
+_LAZY = {
+    'RAGEngine': 'rag.engine',
+    'IncrementalDeadlockDetector': 'rag.incremental',
+    'CompactGraph': 'rag.compact',
+    'MappedGraph': 'rag.columnar',
+    'DeadlockReport': 'rag.analysis',
+    'RecoveryPlan': 'rag.recovery',
+    'AvoidanceManager': 'rag.avoidance',
+    'EventLog': 'rag.eventlog',
+    'LogReplayer': 'rag.eventlog',
+    'IngestServer': 'rag.server',
+    'LayoutCache': 'rag.layout',
+    'GraphRenderer': 'rag.render',
+    'OffscreenRenderer': 'rag.render',
+    'BackgroundWorker': 'rag.background',
+    'ContentionIndex': 'rag.views',
+    'WaitAnalytics': 'rag.analytics',
+    'Metrics': 'rag.metrics',
+    'WorkloadSimulator': 'rag.workload',
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'rag' has no attribute {name!r}")
@@ -0,0 +1,84 @@
+"""Whole-system deadlock analysis.
+
+``RAGEngine.check_deadlock`` stops at the first cycle. :func:`analyze`
+instead finds every strongly connected component of the wait-for graph in
+linear time, so a single pass yields
+
+* ``clusters`` -- independent deadlocks, one sorted list of processes per
+  non-trivial SCC;
+* ``deadlocked`` -- every process that sits on a wait-for cycle;
+* ``blocked`` -- processes that are not on a cycle but transitively wait for
+  a deadlocked one, and so can never proceed either;
+* ``cycles`` -- up to ``max_cycles`` elementary cycles (node lists), only
+  enumerated when asked for since their number can be exponential.
+
+A cycle only proves a deadlock when every resource on it has one instance.
+With multi-instance resources :func:`analyze` defers to
+:func:`rag.parallel.analyze` in-process, which checks each weakly connected
+component holding such a resource by graph reduction and the rest by SCC,
+so the report is the same whatever the number of jobs.
+"""
+
+from collections import deque, namedtuple
+from itertools import islice
+
+import networkx as nx
+
+DeadlockReport = namedtuple('DeadlockReport', 'clusters deadlocked blocked cycles')
+
+
+def is_deadlock(wait_for, component):
+    """Whether a strongly connected ``component`` of ``wait_for`` holds a
+    cycle: more than one process, or one that waits for itself."""
+    if len(component) > 1:
+        return True
+    p = next(iter(component))
+    return wait_for.has_edge(p, p)
+
+
+def analyze_wait_for(wait_for, max_cycles=0):
+    clusters = [sorted(c, key=str) for c in nx.strongly_connected_components(wait_for)
+                if is_deadlock(wait_for, c)]
+    clusters.sort(key=lambda c: (-len(c), str(c[0])))
+    deadlocked = set().union(*clusters) if clusters else set()
+
+    # Reverse BFS from the cycles finds everyone stuck behind them
+    blocked = set()
+    queue = deque(deadlocked)
+    pred = wait_for.pred
+    while queue:
+        node = queue.popleft()
+        for waiter in pred[node]:
+            if waiter not in deadlocked and waiter not in blocked:
+                blocked.add(waiter)
+                queue.append(waiter)
+
+    cycles = []
+    if max_cycles:
+        for cluster in clusters:
+            remaining = max_cycles - len(cycles)
+            if remaining <= 0:
+                break
+            cycles.extend(islice(nx.simple_cycles(wait_for.subgraph(cluster)), remaining))
+    return DeadlockReport(clusters, deadlocked, blocked, cycles)
+
+
+def analyze(engine, max_cycles=0):
+    if engine.is_multi_instance():
+        from rag import parallel
+        return parallel.analyze(engine, jobs=1, max_cycles=max_cycles)
+    return analyze_wait_for(engine.wait_for_graph(), max_cycles)
+
+
+def cycle_edges(engine, processes):
+    """Request and allocation edges of the RAG that connect ``processes``
+    through a resource, i.e. the edges that make up their wait-for cycles."""
+    graph = engine.graph
+    edges = set()
+    for p in processes:
+        for r in graph.succ[p]:
+            for holder in graph.succ[r]:
+                if holder != p and holder in processes:
+                    edges.add((p, r))
+                    edges.add((r, holder))
+    return edges
@@ -0,0 +1,227 @@
+"""Wait-chain and contention analytics, maintained on every mutation.
+
+:class:`WaitAnalytics` extends the online deadlock detector, whose persistent
+wait-for graph it already shares, with indexes that answer operational
+questions without rescanning the graph:
+
+* waiters per resource and the most contended resources (a
+  :class:`~rag.views.ContentionIndex` with its lazy top-K heap);
+* the processes that have been waiting longest: a process is stamped when
+  its first request appears and dropped when its last one goes, and since
+  stamps only grow, the oldest waiters are the first entries of an
+  insertion-ordered dict;
+* the depth of the longest wait chain (``P1`` waits for ``P2``, which waits
+  for ``P3``, ... as in Test Set 5). :class:`LongestPathOrder` keeps, for
+  every process in the acyclic part of the wait-for graph, the length of the
+  longest chain starting there, and repairs only the processes whose chains
+  an edge change can affect. Edges that close a cycle are not part of that
+  graph, so a deadlock does not make the depth infinite.
+
+Every query costs time in the size of its answer (plus a logarithmic heap
+factor), not in the size of the graph.
+"""
+
+import itertools
+
+from rag.incremental import DynamicTopologicalOrder, IncrementalDeadlockDetector
+from rag.views import ContentionIndex
+
+
+class LongestPathOrder(DynamicTopologicalOrder):
+    """Dynamic topological order that also knows the longest path (in
+    edges) leaving each node, and the longest path overall."""
+
+    def __init__(self):
+        super().__init__()
+        self.depth = {}
+        self._by_depth = {0: set()}
+        self._max = 0
+        self.tracking = True    # off while bulk loading; see recompute()
+
+    @property
+    def max_depth(self):
+        # Lowered lazily: a depth bucket only empties when nodes move down
+        while self._max and not self._by_depth.get(self._max):
+            self._max -= 1
+        return self._max
+
+    def longest_path(self, limit=None):
+        """The nodes of one longest path (its first ``limit`` nodes), or
+        ``[]`` if there are no edges."""
+        depth = self.max_depth
+        if not depth:
+            return []
+        node = next(iter(self._by_depth[depth]))
+        path = [node]
+        while depth and (limit is None or len(path) < limit):
+            depth -= 1
+            node = next(v for v in self.out[node] if self.depth[v] == depth)
+            path.append(node)
+        return path
+
+    def recompute(self):
+        """Derive every depth in one pass (the order is topological, so
+        successors come first when walking it backwards) and resume
+        tracking."""
+        self._by_depth = {0: set()}
+        self._max = 0
+        for node in sorted(self.ord, key=self.ord.__getitem__, reverse=True):
+            depth = max((self.depth[v] + 1 for v in self.out[node]), default=0)
+            self.depth[node] = depth
+            self._by_depth.setdefault(depth, set()).add(node)
+            self._max = max(self._max, depth)
+        self.tracking = True
+
+    def add_node(self, node):
+        if node not in self.depth:
+            self.depth[node] = 0
+            self._by_depth[0].add(node)
+        return super().add_node(node)
+
+    def remove_node(self, node):
+        if node not in self.ord:
+            return
+        for u in list(self.in_[node]):
+            self.remove_edge(u, node)
+        super().remove_node(node)
+        self._by_depth[self.depth.pop(node)].discard(node)
+
+    def add_edge(self, u, v):
+        path = super().add_edge(u, v)
+        if path is None and self.tracking and self.depth[v] + 1 > self.depth[u]:
+            self._set(u, self.depth[v] + 1)
+            self._propagate([u])
+        return path
+
+    def remove_edge(self, u, v):
+        if u in self.out and v in self.out[u]:
+            super().remove_edge(u, v)
+            if self.tracking and self.depth[u] == self.depth[v] + 1:
+                self._propagate([u], recompute=True)
+
+    def _propagate(self, changed, recompute=False):
+        # Walk back from nodes whose depth may have changed; a predecessor
+        # only needs a look if its depth depended on (or now exceeds) theirs
+        while changed:
+            node = changed.pop()
+            if recompute:
+                new = max((self.depth[v] + 1 for v in self.out[node]), default=0)
+                if new == self.depth[node]:
+                    continue
+                old = self.depth[node]
+                self._set(node, new)
+                changed.extend(u for u in self.in_[node] if self.depth[u] == old + 1)
+            else:
+                for u in self.in_[node]:
+                    if self.depth[node] + 1 > self.depth[u]:
+                        self._set(u, self.depth[node] + 1)
+                        changed.append(u)
+
+    def _set(self, node, depth):
+        self._by_depth[self.depth[node]].discard(node)
+        self._by_depth.setdefault(depth, set()).add(node)
+        self.depth[node] = depth
+        if depth > self._max:
+            self._max = depth
+
+
+class WaitAnalytics(IncrementalDeadlockDetector):
+    """Online deadlock detector plus contention and wait-chain indexes.
+
+    ``clock`` stamps when processes start waiting (default: the engine's).
+    Processes already waiting when the analytics attach are stamped then.
+    """
+
+    def __init__(self, engine=None, on_deadlock=None, clock=None):
+        self.clock = clock
+        super().__init__(engine, on_deadlock)
+
+    def reset(self):
+        super().reset()
+        self._order = LongestPathOrder()
+        self.contention = ContentionIndex()
+        self._requests = {}     # process -> outstanding request edges
+        self._waiting = {}      # process -> time it started waiting, oldest first
+
+    def attach(self, engine):
+        if self.clock is None:
+            self.clock = engine.clock
+        super().attach(engine)
+
+    def rebuild(self):
+        # As the detector does, but depths are derived once at the end
+        # instead of being repaired after every edge
+        self.reset()
+        self._order.tracking = False
+        graph = self.engine.graph
+        for r in self.engine.resources():
+            for waiter in graph.pred[r]:
+                self._request_added(waiter, r)
+                for holder in graph.succ[r]:
+                    if holder != waiter:
+                        self._inc(waiter, holder, report=False)
+        self._order.recompute()
+
+    # Queries
+    def waiters(self, resource):
+        """Number of processes waiting for ``resource``."""
+        return self.contention.waiters.get(resource, 0)
+
+    def most_contended(self, n=5):
+        """``(resource, waiters)`` for the ``n`` most contended resources."""
+        return [(r, self.contention.waiters[r]) for r in self.contention.most_contended(n)]
+
+    def longest_waiting(self, n=5):
+        """``(process, seconds)`` for the ``n`` processes waiting longest."""
+        now = self.clock()
+        return [(p, now - since) for p, since in itertools.islice(self._waiting.items(), n)]
+
+    @property
+    def max_chain_depth(self):
+        """Wait-for edges in the longest wait chain (0 when no process waits
+        for another)."""
+        return self._order.max_depth
+
+    def longest_chain(self, limit=None):
+        """Processes along one longest wait chain, the waiting end first
+        (only the first ``limit`` of them if given)."""
+        return self._order.longest_path(limit)
+
+    def chain_depth(self, process):
+        """Length of the longest wait chain starting at ``process``."""
+        return self._order.depth.get(process, 0)
+
+    def summary(self, n=5, chain_limit=None):
+        """Everything above as one dict (the top ``n`` of each ranking)."""
+        return {
+            'waiting_processes': len(self._waiting),
+            'contended_resources': len(self.contention.waiters),
+            'most_contended': self.most_contended(n),
+            'longest_waiting': self.longest_waiting(n),
+            'max_chain_depth': self.max_chain_depth,
+            'longest_chain': self.longest_chain(chain_limit),
+        }
+
+    # GraphObserver
+    def edge_added(self, u, v, kind):
+        super().edge_added(u, v, kind)
+        if kind == 'request':
+            self._request_added(u, v)
+
+    def edge_removed(self, u, v, kind):
+        super().edge_removed(u, v, kind)
+        if kind == 'request':
+            self.contention.edge_removed(u, v, kind)
+            count = self._requests.get(u, 0) - 1
+            if count > 0:
+                self._requests[u] = count
+            else:
+                self._requests.pop(u, None)
+                self._waiting.pop(u, None)
+
+    def _request_added(self, p, r):
+        self.contention.edge_added(p, r, 'request')
+        count = self._requests.get(p, 0)
+        self._requests[p] = count + 1
+        if not count:
+            self._waiting[p] = self.clock()
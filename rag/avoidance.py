@@ -0,0 +1,303 @@
+"""Deadlock avoidance: decide every request before anything is allocated.
+
+:class:`AvoidanceManager` sits between callers and a
+:class:`~rag.engine.RAGEngine`. A request is granted only if the state stays
+safe; otherwise it is denied, or queued as a request edge and retried
+whenever something is released.
+
+* With single-instance resources, claims are edges ``p -> r`` of a claim
+  graph whose allocation edges point ``r -> p``. A grant turns a claim edge
+  around, and the state is safe as long as that graph stays acyclic. The
+  graph is kept in a :class:`~rag.incremental.DynamicTopologicalOrder`, so
+  a grant that agrees with the order is accepted in O(1) and otherwise only
+  the affected slice of the order is searched.
+* With multi-instance resources, the Banker's matrices are cached and
+  updated in place on each grant, and the last safe sequence is re-checked
+  in one vectorised pass before falling back to the full safety search.
+
+Processes may declare claims with :meth:`AvoidanceManager.claim`; an
+undeclared request counts as a claim for what it asks. The caches follow the
+manager's own grants, releases, withdrawn requests and finished processes.
+Any other change to the engine (seen through ``engine.version``) makes them
+rebuild on the next call, and drops queued requests whose request edge is
+gone.
+"""
+
+from collections import deque
+
+from rag.incremental import DynamicTopologicalOrder
+
+GRANTED = 'granted'
+QUEUED = 'queued'
+DENIED = 'denied'
+POLICIES = ('deny', 'queue')
+
+
+class AvoidanceManager:
+
+    def __init__(self, engine, policy='queue'):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown avoidance policy '{policy}'")
+        self.engine = engine
+        self.policy = policy
+        self.queue = deque()   # (process, resource, count) waiting for a safe grant
+        self._version = None
+        self._order = None     # claim graph, single-instance mode
+        self._state = None     # Banker's matrices, multi-instance mode
+        self._safe_order = None
+
+    # Requests
+    def claim(self, process, resource, count=1):
+        """Declare that ``process`` may hold up to ``count`` of ``resource``.
+        Raises ``ValueError``, leaving the claims as they were, if the claim
+        would make the state unsafe."""
+        engine = self.engine
+        self._sync()
+        with engine.transaction():
+            engine.set_claim(process, resource, count)
+            if self._order is not None:
+                safe = self._holds(process, resource) or self._order.add_edge(process, resource) is None
+            else:
+                i, j = self._index(process, resource)
+                self._state.claim[i, j] = count
+                self._update_need(i, j)
+                safe = self._matrix_safe(j)
+            if not safe:
+                self._version = None
+                raise ValueError(f"Claim {process} -> {resource} would make the state unsafe")
+        self._version = engine.version
+
+    def request(self, process, resource, count=1):
+        """Ask for ``count`` more instances; returns GRANTED, QUEUED or DENIED."""
+        engine = self.engine
+        if engine.node_type(process) != 'process' or engine.node_type(resource) != 'resource':
+            raise ValueError("A request must name a process and a resource")
+        if count < 1:
+            raise ValueError("An edge must carry at least one instance")
+        held = self._held(process, resource)
+        claim = engine.graph.nodes[process].get('claims', {}).get(resource)
+        if claim is not None and held + count > claim:
+            raise ValueError(f"{process} would exceed its claim on {resource}")
+        # Could never be granted, so queueing it would only deadlock; this
+        # includes asking again for a single-instance resource already held
+        if held + count > engine.instances(resource):
+            raise ValueError(f"{process} would hold more of {resource} than its "
+                             f"{engine.instances(resource)} instance(s)")
+        self._sync()
+        # Like the request edge itself, a new request replaces a queued one
+        self.queue = deque(item for item in self.queue if item[:2] != (process, resource))
+        if self._try_grant(process, resource, count):
+            return GRANTED
+        if self.policy == 'deny' or not self._wait(process, resource, count):
+            return DENIED
+        self.queue.append((process, resource, count))
+        return QUEUED
+
+    def release(self, process, resource, count=None):
+        """Give back ``count`` instances (all by default) and retry the queue."""
+        engine = self.engine
+        held = self._held(process, resource)
+        if not held:
+            return False
+        self._sync()
+        count = held if count is None else min(count, held)
+        if count < held:
+            engine.add_allocation_edge(resource, process, held - count)
+        else:
+            engine.remove_edge(resource, process)
+        if self._order is not None:
+            if count == held:
+                self._order.remove_edge(resource, process)
+                if resource in engine.graph.nodes[process].get('claims', {}):
+                    self._order.add_edge(process, resource)
+        else:
+            i, j = self._index(process, resource)
+            self._state.allocation[i, j] -= count
+            self._state.available[j] += count
+            self._update_need(i, j)
+            self._revalidate(j)
+        self._version = engine.version
+        self._retry()
+        return True
+
+    def withdraw(self, process, resource):
+        """Drop the request of ``process`` for ``resource``, queued or not,
+        and retry the queue."""
+        engine = self.engine
+        edge = engine.graph.succ[process].get(resource) if process in engine.graph else None
+        if edge is None or edge.get('type') != 'request':
+            return False
+        self._sync()
+        self.queue = deque(item for item in self.queue if item[:2] != (process, resource))
+        engine.remove_edge(process, resource)
+        if self._order is not None:
+            if resource not in engine.graph.nodes[process].get('claims', {}):
+                self._order.remove_edge(process, resource)
+        else:
+            i, j = self._index(process, resource)
+            self._state.request[i, j] = 0
+            self._update_need(i, j)
+        self._version = engine.version
+        self._retry()
+        return True
+
+    def remove_edge(self, u, v):
+        """Remove an edge of either kind through the manager: an allocation
+        is released, a request withdrawn."""
+        if self.engine.node_type(u) == 'resource':
+            return self.release(v, u)
+        return self.withdraw(u, v)
+
+    def finish(self, process):
+        """Release everything ``process`` holds, drop it and retry the queue."""
+        engine = self.engine
+        if engine.node_type(process) != 'process':
+            return False
+        self._sync()
+        self.queue = deque(item for item in self.queue if item[0] != process)
+        engine.remove_process(process)
+        if self._order is not None:
+            self._order.remove_node(process)
+        else:
+            # Its row drops to zero, which any safe sequence can finish
+            state = self._state
+            i = self._p_index[process]
+            state.available[:] += state.allocation[i]
+            for matrix in (state.allocation, state.request, state.need, state.claim):
+                matrix[i] = 0
+        self._version = engine.version
+        self._retry()
+        return True
+
+    def remove_resource(self, resource):
+        """Remove ``resource`` along with the requests queued for it."""
+        self.queue = deque(item for item in self.queue if item[1] != resource)
+        removed = self.engine.remove_resource(resource)
+        if removed:
+            self._retry()
+        return removed
+
+    def clear(self):
+        """Empty the engine and the queue."""
+        self.queue.clear()
+        self.engine.remove_all()
+
+    def _retry(self):
+        self._sync()
+        pending, self.queue = self.queue, deque()
+        for process, resource, count in pending:
+            if not self._try_grant(process, resource, count):
+                self.queue.append((process, resource, count))
+
+    # Safety checks
+    def _try_grant(self, process, resource, count):
+        engine = self.engine
+        if count > engine.available(resource):
+            return False
+        if self._order is not None:
+            order = self._order
+            claimed = order.has_edge(process, resource)
+            order.remove_edge(process, resource)
+            if order.add_edge(resource, process) is not None:
+                if claimed:
+                    order.add_edge(process, resource)
+                return False
+        else:
+            state = self._state
+            i, j = self._index(process, resource)
+            state.available[j] -= count
+            state.allocation[i, j] += count
+            pending = state.request[i, j]
+            state.request[i, j] = 0
+            self._update_need(i, j)
+            if not self._matrix_safe(j):
+                state.available[j] += count
+                state.allocation[i, j] -= count
+                state.request[i, j] = pending
+                self._update_need(i, j)
+                return False
+
+        held = self._held(process, resource)
+        with engine.transaction():
+            engine.remove_edge(process, resource)
+            engine.add_allocation_edge(resource, process, held + count)
+        self._version = engine.version
+        return True
+
+    def _wait(self, process, resource, count):
+        # Queue as a request edge; an undeclared request becomes a claim edge,
+        # which is refused if it alone would close a cycle
+        if self._order is not None and not self._holds(process, resource):
+            if self._order.add_edge(process, resource) is not None:
+                return False
+        self.engine.add_request_edge(process, resource, count)
+        if self._state is not None:
+            i, j = self._index(process, resource)
+            self._state.request[i, j] = count
+            self._update_need(i, j)
+            self._revalidate(j)
+        self._version = self.engine.version
+        return True
+
+    def _matrix_safe(self, column):
+        # Only ``column`` changed since the cached safe sequence was verified
+        import numpy as np
+
+        from rag import banker
+
+        state = self._state
+        if self._safe_order is not None and banker.order_is_safe(
+                state.available, state.allocation, state.need, self._safe_order, [column]):
+            return True
+        safe, order = banker.is_safe(state.available, state.allocation, state.need)
+        if safe:
+            self._safe_order = np.array(order, dtype=np.intp)
+        return safe
+
+    def _revalidate(self, column):
+        # The state was changed for good; drop a safe sequence it invalidated
+        if not self._matrix_safe(column):
+            self._safe_order = None
+
+    def _update_need(self, i, j):
+        state = self._state
+        state.need[i, j] = max(state.claim[i, j] - state.allocation[i, j], state.request[i, j])
+
+    # Cache maintenance
+    def _sync(self):
+        if self._version == self.engine.version:
+            return
+        engine = self.engine
+        # Requests withdrawn or removed behind the manager's back
+        succ = engine.graph.succ
+        self.queue = deque(item for item in self.queue if item[0] in succ
+                           and succ[item[0]].get(item[1], {}).get('type') == 'request')
+        self._order = self._state = self._safe_order = None
+        if engine.is_multi_instance():
+            from rag import banker
+            self._state = banker.matrix_state(engine)
+            self._p_index = {p: i for i, p in enumerate(self._state.processes)}
+            self._r_index = {r: j for j, r in enumerate(self._state.resources)}
+        else:
+            self._order = order = DynamicTopologicalOrder()
+            graph = engine.graph
+            for node in graph:
+                order.add_node(node)
+            for u, v, d in graph.edges(data=True):
+                order.add_edge(u, v)
+            for p in engine.processes():
+                for r in graph.nodes[p].get('claims', {}):
+                    if r in graph and not graph.has_edge(r, p):
+                        order.add_edge(p, r)
+        self._version = engine.version
+
+    def _index(self, process, resource):
+        return self._p_index[process], self._r_index[resource]
+
+    def _held(self, process, resource):
+        graph = self.engine.graph
+        edge = graph.succ[resource].get(process) if resource in graph else None
+        return edge.get('count', 1) if edge else 0
+
+    def _holds(self, process, resource):
+        return self.engine.graph.has_edge(resource, process)
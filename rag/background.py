@@ -0,0 +1,130 @@
+"""Run analysis, layout and rendering off the UI thread.
+
+The engine is only ever read on the thread that owns it. :func:`snapshot`
+copies its graph there into plain tuples (cheap: no attribute dicts are
+copied) and a :class:`BackgroundWorker` runs jobs on those snapshots in one
+daemon thread. Only the newest job matters: submitting a job makes any
+older one stale, and a running job stops at its next :meth:`progress` call.
+Results are handed back through a queue that the owner drains with
+:meth:`BackgroundWorker.poll` (for example from ``root.after``), so every
+callback runs on the owner's thread.
+"""
+
+import queue
+import threading
+from collections import namedtuple
+
+import networkx as nx
+
+GraphSnapshot = namedtuple('GraphSnapshot', 'version nodes edges')
+
+
+class Cancelled(Exception):
+    """Raised inside a job whose result nobody wants any more."""
+
+
+def snapshot(engine):
+    """Immutable copy of ``engine``'s graph: ``(name, type, instances)`` per
+    node and ``(u, v, type, count)`` per edge, tagged with the version."""
+    graph = engine.graph
+    nodes = tuple((n, a.get('type'), a.get('instances', 1)) for n, a in graph.nodes(data=True))
+    edges = tuple((u, v, d.get('type'), d.get('count', 1)) for u, v, d in graph.edges(data=True))
+    return GraphSnapshot(engine.version, nodes, edges)
+
+
+def snapshot_graph(snap):
+    """Rebuild a ``networkx`` graph from a snapshot, on the worker."""
+    graph = nx.DiGraph()
+    graph.add_nodes_from((n, {'type': kind, 'instances': instances} if kind == 'resource' else {'type': kind})
+                         for n, kind, instances in snap.nodes)
+    graph.add_edges_from((u, v, {'type': kind, 'count': count}) for u, v, kind, count in snap.edges)
+    return graph
+
+
+def snapshot_engine(snap):
+    """A private :class:`~rag.engine.RAGEngine` over a snapshot, for running
+    the engine's analyses on the worker."""
+    from rag.engine import RAGEngine
+    engine = RAGEngine()
+    engine.graph = snapshot_graph(snap)
+    return engine
+
+
+class BackgroundWorker:
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._generation = 0
+        self._pending = None    # newest job not yet started
+        self._running = False
+        self._results = queue.SimpleQueue()
+        self._status = None     # (generation, fraction, message)
+        self._thread = None
+
+    @property
+    def busy(self):
+        """True while a job is queued or still running (even a stale one)."""
+        return self._pending is not None or self._running
+
+    def submit(self, job, *args, on_done=None, on_error=None):
+        """Run ``job(*args, progress=...)`` on the worker, superseding every
+        earlier job. ``on_done(result)`` or ``on_error(exception)`` is called
+        from :meth:`poll` if no newer job was submitted in the meantime."""
+        with self._lock:
+            self._generation += 1
+            self._pending = (self._generation, job, args, on_done, on_error)
+            self._status = (self._generation, 0.0, "Queued")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rag-worker', daemon=True)
+                self._thread.start()
+            self._lock.notify()
+        return self._generation
+
+    def cancel(self):
+        """Make the current and queued jobs stale."""
+        with self._lock:
+            self._generation += 1
+            self._pending = None
+            self._status = None
+
+    def poll(self):
+        """Deliver finished results on the calling thread; returns the
+        current job's ``(fraction, message)``, or ``None`` when idle."""
+        while True:
+            try:
+                generation, ok, value, on_done, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self._generation:
+                continue
+            self._status = None
+            callback = on_done if ok else on_error
+            if callback is not None:
+                callback(value)
+            elif not ok:
+                raise value
+        status = self._status
+        return status[1:] if status is not None and status[0] == self._generation else None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._pending is None:
+                    self._lock.wait()
+                generation, job, args, on_done, on_error = self._pending
+                self._pending = None
+                self._running = True
+
+            def progress(fraction, message, generation=generation):
+                if generation != self._generation:
+                    raise Cancelled()
+                self._status = (generation, fraction, message)
+
+            try:
+                self._results.put((generation, True, job(*args, progress=progress), on_done, on_error))
+            except Cancelled:
+                pass
+            except Exception as e:
+                self._results.put((generation, False, e, on_done, on_error))
+            finally:
+                self._running = False
@@ -0,0 +1,140 @@
+"""Matrix-based deadlock detection and Banker's safety checks.
+
+Cycle detection is only exact for single-instance resources. For resources
+with several instances the state is expressed as the classic matrices
+
+* ``available`` -- free instances per resource type, shape ``(R,)``
+* ``allocation`` -- instances held by each process, shape ``(P, R)``
+* ``request`` -- outstanding requests of each process, shape ``(P, R)``
+
+and the work/finish iteration is vectorised with NumPy: every round retires
+all processes whose requests fit in ``work`` at once, so a round costs one
+``(P, R)`` comparison instead of a Python loop over processes.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+MatrixState = namedtuple('MatrixState', 'processes resources available allocation request need claim')
+
+
+def matrix_state(engine):
+    """Build the matrices for the current graph of ``engine``.
+
+    ``need`` is the Banker's remaining demand: the declared claim minus what
+    is already held, and never less than the outstanding request.
+    """
+    graph = engine.graph
+    processes = engine.processes()
+    resources = engine.resources()
+    p_index = {p: i for i, p in enumerate(processes)}
+    r_index = {r: j for j, r in enumerate(resources)}
+
+    total = np.array([graph.nodes[r].get('instances', 1) for r in resources], dtype=np.int64)
+    allocation = np.zeros((len(processes), len(resources)), dtype=np.int64)
+    request = np.zeros_like(allocation)
+    claim = np.zeros_like(allocation)
+
+    for u, v, d in graph.edges(data=True):
+        count = d.get('count', 1)
+        if d.get('type') == 'allocation':
+            allocation[p_index[v], r_index[u]] += count
+        elif d.get('type') == 'request':
+            request[p_index[u], r_index[v]] += count
+    for p, i in p_index.items():
+        for r, count in graph.nodes[p].get('claims', {}).items():
+            if r in r_index:
+                claim[i, r_index[r]] = count
+
+    available = total - allocation.sum(axis=0)
+    need = np.maximum(claim - allocation, request)
+    return MatrixState(processes, resources, available, allocation, request, need, claim)
+
+
+def _finish_order(available, allocation, demand, idle):
+    # Repeatedly retire every process whose demand fits in the work vector
+    work = np.array(available, dtype=np.int64)
+    finish = idle.copy()
+    order = []
+    pending = np.flatnonzero(~finish)
+    while pending.size:
+        runnable = np.all(demand[pending] <= work, axis=1)
+        if not runnable.any():
+            break
+        done = pending[runnable]
+        work += allocation[done].sum(axis=0)
+        finish[done] = True
+        order.extend(done.tolist())
+        pending = pending[~runnable]
+    return finish, order
+
+
+def detect_deadlock(available, allocation, request):
+    """Return a boolean mask of the deadlocked processes."""
+    # Processes holding nothing cannot be part of a deadlock
+    finish, _ = _finish_order(available, allocation, request, ~allocation.any(axis=1))
+    return ~finish
+
+
+def is_safe(available, allocation, need):
+    """Banker's safety test. Returns ``(safe, order)`` where ``order`` lists
+    the process indices of a safe sequence for the processes that hold or
+    need anything."""
+    idle = ~(allocation.any(axis=1) | need.any(axis=1))
+    finish, order = _finish_order(available, allocation, need, idle)
+    return bool(finish.all()), order
+
+
+def order_is_safe(available, allocation, need, order, columns=None):
+    """Check in one vectorised pass whether ``order`` (process indices) is
+    still a safe sequence; processes missing from it must be idle.
+
+    A cached safe sequence usually survives a small change of state, so
+    trying it first avoids the round-by-round search of :func:`is_safe`. If
+    only some resource ``columns`` changed since ``order`` was verified, only
+    those need checking, which costs O(P) per column.
+    """
+    if columns is not None:
+        available = available[columns]
+        allocation = allocation[:, columns]
+        need = need[:, columns]
+    order = np.asarray(order, dtype=np.intp)
+    listed = np.zeros(len(allocation), dtype=bool)
+    listed[order] = True
+    if allocation[~listed].any() or need[~listed].any():
+        return False
+    # Work available to the k-th process: everything the first k released
+    held = allocation[order]
+    released = np.cumsum(held, axis=0) - held
+    return bool(np.all(need[order] <= available + released))
+
+
+def request_is_safe(available, allocation, need, process, request):
+    """Would granting ``request`` (a length-R vector) to row ``process`` keep
+    the system in a safe state?"""
+    request = np.asarray(request, dtype=np.int64)
+    if np.any(request > need[process]) or np.any(request > available):
+        return False
+    allocation = allocation.copy()
+    need = need.copy()
+    allocation[process] += request
+    need[process] -= request
+    safe, _ = is_safe(available - request, allocation, need)
+    return safe
+
+
+def deadlocked_processes(engine):
+    state = matrix_state(engine)
+    mask = detect_deadlock(state.available, state.allocation, state.request)
+    return [state.processes[i] for i in np.flatnonzero(mask)]
+
+
+def engine_request_is_safe(engine, process, resource, count=1):
+    state = matrix_state(engine)
+    i = state.processes.index(process)
+    vector = np.zeros(len(state.resources), dtype=np.int64)
+    vector[state.resources.index(resource)] = count
+    need = state.need.copy()
+    need[i] = np.maximum(need[i], vector)
+    return request_is_safe(state.available, state.allocation, need, i, vector)
@@ -0,0 +1,456 @@
+"""Command-line entry point: ``python -m rag <command> ...``.
+
+``analyze`` checks many scenario files for deadlock across a process pool
+and prints one JSON object per file on stdout, followed by aggregate
+throughput on stderr. Verdicts come from :meth:`RAGEngine.find_deadlock`,
+the same detection the GUI uses, which does not take a cycle through a
+multi-instance resource for a deadlock. With ``--partitioned`` the workers
+share each file instead (see :mod:`rag.parallel`), for a few very large
+graphs; the verdict is the same.
+Binary snapshots (``*.ragsnap``, see :mod:`rag.columnar`) are analysed on
+their mapped columns without building a graph.
+
+``simulate`` runs a seeded discrete-event workload headless (see
+:mod:`rag.workload`) and prints its summary as JSON.
+
+``replay`` moves through an event log (see :mod:`rag.eventlog`): it prints
+the graph at a given event or time, or lists every point where a deadlock
+formed.
+
+``serve`` accepts newline-delimited JSON events from many clients over TCP
+or a Unix socket (see :mod:`rag.server`), prints each deadlock as it forms
+and reports ingestion throughput on stderr.
+
+``convert`` turns a scenario file into a binary snapshot or back, by suffix.
+
+``export`` renders an event log headless (see :mod:`rag.export`) as PNG or
+SVG frames or a GIF/MP4 animation, with frames drawn in worker processes, or
+a scenario or snapshot as a single image.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from rag.engine import RAGEngine, cycle_nodes
+from rag import scenario
+
+
+def expand_paths(paths, suffix=('.rag', '.ragsnap')):
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for name in sorted(filenames):
+                    if name.endswith(suffix):
+                        yield os.path.join(dirpath, name)
+        else:
+            yield path
+
+
+def analyze_file(path, max_cycles=0, partition_jobs=0):
+    if path.endswith('.ragsnap'):
+        return analyze_snapshot(path, max_cycles, partition_jobs)
+    start = time.perf_counter()
+    engine = RAGEngine()
+    try:
+        summary = scenario.load(engine, path, atomic=False)
+        if partition_jobs:
+            report = engine.analyze_deadlocks_parallel(partition_jobs, max_cycles=max_cycles)
+            if engine.is_multi_instance():
+                kind, found = 'matrix', sorted(report.deadlocked, key=str)
+            else:
+                kind, found = 'cycles', report.clusters
+        else:
+            kind, found = engine.find_deadlock()
+    except (OSError, ValueError) as e:
+        return {'file': path, 'error': str(e)}
+    result = _verdict(path, kind, found, engine.check_deadlock)
+    result.update({
+        'processes': len(engine.processes()),
+        'resources': len(engine.resources()),
+        'edges': engine.graph.number_of_edges(),
+        'events': summary.events,
+    })
+    if partition_jobs:
+        result['clusters'] = report.clusters
+        result['cycles'] = report.cycles
+    elif max_cycles:
+        report = engine.analyze_deadlocks(max_cycles)
+        result['clusters'] = report.clusters
+        result['cycles'] = report.cycles
+    if summary.expect is not None:
+        result['expect'] = summary.expect
+        result['ok'] = (summary.expect == 'deadlock') == result['deadlock']
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def analyze_snapshot(path, max_cycles=0, partition_jobs=0):
+    from rag import columnar
+
+    start = time.perf_counter()
+    try:
+        with columnar.load(path) as graph:
+            result = _verdict(path, *graph.find_deadlock(), graph.check_deadlock)
+            result.update({
+                'processes': len(graph.processes()),
+                'resources': len(graph.resources()),
+                'edges': graph.number_of_edges(),
+                'events': 0,
+            })
+            if partition_jobs or max_cycles:
+                report = graph.analyze_deadlocks(partition_jobs or 1, max_cycles=max_cycles)
+                result['clusters'] = report.clusters
+                result['cycles'] = report.cycles
+    except (OSError, ValueError) as e:
+        return {'file': path, 'error': str(e)}
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def _verdict(path, kind, found, check_deadlock):
+    # A witness cycle for single-instance deadlocks, the processes that can
+    # never finish for multi-instance ones
+    result = {'file': path, 'deadlock': bool(found), 'cycle': None}
+    if found and kind == 'cycles':
+        cycle = check_deadlock()
+        result['cycle'] = cycle_nodes(cycle) if cycle else None
+    elif found:
+        result['deadlocked'] = found
+    return result
+
+
+def _analyze_star(args):
+    return analyze_file(*args)
+
+
+def cmd_analyze(args):
+    files = list(expand_paths(args.paths))
+    jobs = args.jobs or os.cpu_count() or 1
+    if args.partitioned:
+        # Each file is split across the workers instead, one file at a time
+        tasks = [(path, args.max_cycles, jobs) for path in files]
+    else:
+        tasks = [(path, args.max_cycles) for path in files]
+    start = time.perf_counter()
+    totals = {'files': 0, 'deadlocked': 0, 'errors': 0, 'mismatches': 0, 'events': 0}
+
+    if args.partitioned:
+        results = map(_analyze_star, tasks)
+        pool = None
+    elif jobs == 1 or len(files) <= 1:
+        jobs = 1
+        results = map(_analyze_star, tasks)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=jobs)
+        chunksize = max(1, len(tasks) // (jobs * 8))
+        results = pool.map(_analyze_star, tasks, chunksize=chunksize)
+    try:
+        for result in results:
+            totals['files'] += 1
+            if 'error' in result:
+                totals['errors'] += 1
+            else:
+                totals['deadlocked'] += result['deadlock']
+                totals['events'] += result['events']
+                totals['mismatches'] += result.get('ok') is False
+            print(json.dumps(result), flush=args.flush)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    totals['seconds'] = round(elapsed, 3)
+    totals['files_per_sec'] = round(totals['files'] / elapsed, 1) if elapsed > 0 else None
+    totals['events_per_sec'] = round(totals['events'] / elapsed, 1) if elapsed > 0 else None
+    totals['jobs'] = jobs
+    print(json.dumps(totals), file=sys.stderr)
+    return 1 if totals['errors'] or totals['mismatches'] else 0
+
+
+def cmd_simulate(args):
+    from rag.eventlog import EventLog
+    from rag.workload import WorkloadSimulator
+
+    try:
+        sim = WorkloadSimulator(processes=args.processes, resources=args.resources,
+                                instances=args.instances, max_claims=args.max_claims,
+                                arrival=args.arrival, hold=args.hold, think=args.think,
+                                backoff=args.backoff, seed=args.seed)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    log = EventLog(args.log, sim.engine, args.snapshot_every) if args.log else None
+    try:
+        summary = sim.run(until=args.until, max_events=args.max_events)
+    finally:
+        if log is not None:
+            log.close()
+    summary['seed'] = args.seed
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+def cmd_replay(args):
+    from rag.eventlog import LogReplayer
+
+    engine = RAGEngine()
+    try:
+        replayer = LogReplayer(args.log, engine)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    if args.deadlocks:
+        replay_deadlocks(replayer, args.flush)
+        return 0
+
+    if args.time is not None:
+        replayer.seek_time(args.time)
+    else:
+        replayer.seek(replayer.length if args.at is None else args.at)
+    verdict = _verdict(args.log, *engine.find_deadlock(), engine.check_deadlock)
+    del verdict['file']
+    print(json.dumps({
+        'event': replayer.position,
+        'events': replayer.length,
+        **verdict,
+        'processes': len(engine.processes()),
+        'resources': len(engine.resources()),
+        'edges': engine.graph.number_of_edges(),
+    }))
+    if args.save:
+        save(engine, args.save)
+    return 0
+
+
+def replay_deadlocks(replayer, flush=False):
+    """Print every event of the log that closed a deadlock.
+
+    Single-instance cycles are reported as they close. With multi-instance
+    resources a cycle is only a candidate, so while one exists each event is
+    confirmed with :meth:`RAGEngine.find_deadlock` and the deadlocked
+    processes are printed whenever they change.
+    """
+    from rag.incremental import IncrementalDeadlockDetector
+
+    engine = replayer.engine
+    closed = []
+    deadlocked = []
+
+    def check(event):
+        nonlocal deadlocked
+        if not detector.deadlocked:
+            deadlocked = []
+        elif engine.is_multi_instance():
+            found = engine.find_deadlock()[1]
+            if found and found != deadlocked:
+                print(json.dumps({'event': event, 'deadlocked': found}), flush=flush)
+            deadlocked = found
+        else:
+            for cycle in closed:
+                print(json.dumps({'event': event, 'cycle': cycle_nodes(cycle)}), flush=flush)
+            deadlocked = []
+        closed.clear()
+
+    replayer.seek(0)
+    detector = IncrementalDeadlockDetector(engine, on_deadlock=closed.append)
+    try:
+        replayer.advance(replayer.length, on_event=check)
+    finally:
+        detector.detach()
+
+
+def save(engine, path):
+    """Write ``engine`` as a binary snapshot if ``path`` ends in
+    ``.ragsnap``, else as a scenario file."""
+    if path.endswith('.ragsnap'):
+        from rag import columnar
+        columnar.save(engine, path)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            scenario.dump(engine, f)
+
+
+def cmd_convert(args):
+    engine = RAGEngine()
+    try:
+        if args.source.endswith('.ragsnap'):
+            from rag import columnar
+            with columnar.load(args.source) as graph:
+                graph.populate(engine)
+        else:
+            scenario.load(engine, args.source)
+        save(engine, args.destination)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def cmd_serve(args):
+    import asyncio
+
+    from rag.eventlog import EventLog
+    from rag.server import IngestServer
+
+    engine = RAGEngine()
+
+    def report(processes):
+        print(json.dumps({'deadlock': processes}), flush=True)
+
+    server = IngestServer(engine, batch_size=args.batch_size, max_pending=args.max_pending,
+                          on_deadlock=report)
+    log = EventLog(args.log, engine, args.snapshot_every) if args.log else None
+
+    async def progress():
+        start = time.perf_counter()
+        last = dict(server.stats)
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            stats = dict(server.stats)
+            stats['events_per_sec'] = round((stats['received'] - last['received']) / args.stats_interval, 1)
+            stats['seconds'] = round(time.perf_counter() - start, 1)
+            print(json.dumps(stats), file=sys.stderr, flush=True)
+            last = stats
+
+    async def run():
+        def ready():
+            print(f"listening on {server.address}", file=sys.stderr, flush=True)
+        reporter = asyncio.ensure_future(progress()) if args.stats_interval > 0 else None
+        try:
+            await server.serve(args.host, args.port, args.unix, ready=ready)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if log is not None:
+            log.close()
+    print(json.dumps(server.stats), file=sys.stderr)
+    return 0
+
+
+def cmd_export(args):
+    from rag import export
+
+    options = dict(width=args.width, height=args.height, dpi=args.dpi, layout=args.layout,
+                   highlight=not args.no_highlight)
+    try:
+        if args.source.endswith('.raglog'):
+            summary = export.export_log(args.source, args.output, step=args.step, frames=args.frames,
+                                        start=args.start, stop=args.stop, jobs=args.jobs, fmt=args.format,
+                                        fps=args.fps, **options)
+        else:
+            engine = RAGEngine()
+            if args.source.endswith('.ragsnap'):
+                from rag import columnar
+                with columnar.load(args.source) as graph:
+                    graph.populate(engine)
+            else:
+                scenario.load(engine, args.source)
+            start = time.perf_counter()
+            export.export_image(engine, args.output, **options)
+            summary = {'output': args.output, 'frames': 1, 'seconds': round(time.perf_counter() - start, 3)}
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(summary))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m rag', description="Resource Allocation Graph tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    analyze = commands.add_parser('analyze', help="check scenario files for deadlock")
+    analyze.add_argument('paths', nargs='+', help="scenario files, snapshots, or directories of *.rag and *.ragsnap files")
+    analyze.add_argument('-j', '--jobs', type=int, default=0, help="worker processes (default: all CPUs)")
+    analyze.add_argument('--max-cycles', type=int, default=0,
+                         help="also report deadlock clusters and up to this many cycles per file")
+    analyze.add_argument('--partitioned', action='store_true',
+                         help="split each graph into independent partitions analysed by the workers "
+                              "(for a few very large files)")
+    analyze.add_argument('--flush', action='store_true', help="flush after every result line")
+    analyze.set_defaults(func=cmd_analyze)
+
+    simulate = commands.add_parser('simulate', help="run a seeded discrete-event workload")
+    simulate.add_argument('-n', '--processes', type=int, default=1000, help="processes to run (default: 1000)")
+    simulate.add_argument('-r', '--resources', type=int, default=40, help="resources (default: 40)")
+    simulate.add_argument('--instances', type=int, default=1, help="instances per resource (default: 1)")
+    simulate.add_argument('--max-claims', type=int, default=3, help="most resources one process acquires")
+    simulate.add_argument('--arrival', default='exp:2', help="inter-arrival time, e.g. exp:1, const:2, uniform:0:4")
+    simulate.add_argument('--hold', default='exp:5', help="time a process holds its full set")
+    simulate.add_argument('--think', default='exp:0.5', help="time between successive requests")
+    simulate.add_argument('--backoff', default='exp:2', help="restart delay after a deadlock abort")
+    simulate.add_argument('--seed', type=int, default=0)
+    simulate.add_argument('--until', type=float, help="stop at this simulated time")
+    simulate.add_argument('--max-events', type=int, help="stop after this many events")
+    simulate.add_argument('--log', help="record every graph mutation to this event log")
+    simulate.add_argument('--snapshot-every', type=int, default=10000, help="events between log snapshots")
+    simulate.set_defaults(func=cmd_simulate)
+
+    replay = commands.add_parser('replay', help="inspect an event log at any point in its history")
+    replay.add_argument('log', help="event log written by the GUI or 'simulate --log'")
+    where = replay.add_mutually_exclusive_group()
+    where.add_argument('--at', type=int, help="event position (default: the end)")
+    where.add_argument('--time', type=float, help="last event at or before this time")
+    where.add_argument('--deadlocks', action='store_true', help="list every event that closed a deadlock")
+    replay.add_argument('--save', help="write the graph at that point as a scenario file "
+                                       "(or a binary snapshot if it ends in .ragsnap)")
+    replay.add_argument('--flush', action='store_true', help="flush after every result line")
+    replay.set_defaults(func=cmd_replay)
+
+    serve = commands.add_parser('serve', help="ingest live events from socket clients")
+    serve.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    serve.add_argument('--port', type=int, default=7878, help="TCP port (default: 7878)")
+    serve.add_argument('--unix', help="listen on this Unix socket path instead of TCP")
+    serve.add_argument('--batch-size', type=int, default=1024, help="most events applied per batch")
+    serve.add_argument('--max-pending', type=int, default=65536,
+                       help="queued events before clients are throttled")
+    serve.add_argument('--stats-interval', type=float, default=5.0,
+                       help="seconds between throughput reports on stderr, 0 to disable")
+    serve.add_argument('--log', help="record every graph mutation to this event log")
+    serve.add_argument('--snapshot-every', type=int, default=10000, help="events between log snapshots")
+    serve.set_defaults(func=cmd_serve)
+
+    convert = commands.add_parser('convert', help="convert between scenario files and binary snapshots")
+    convert.add_argument('source', help="scenario file, or a snapshot ending in .ragsnap")
+    convert.add_argument('destination', help="output; a .ragsnap suffix writes a binary snapshot")
+    convert.set_defaults(func=cmd_convert)
+
+    export = commands.add_parser('export', help="render an event log or scenario to images or an animation")
+    export.add_argument('source', help="event log (.raglog), scenario file or snapshot (.ragsnap)")
+    export.add_argument('output', help="for a log: a directory of frames, or a .gif/.mp4 animation; "
+                                       "otherwise one .png/.svg/.pdf image")
+    frames = export.add_mutually_exclusive_group()
+    frames.add_argument('--step', type=int, help="draw a frame every this many events")
+    frames.add_argument('--frames', type=int, default=100, help="frames spread evenly over the log (default: 100)")
+    export.add_argument('--start', type=int, default=0, help="first event position")
+    export.add_argument('--stop', type=int, help="last event position (default: the end)")
+    export.add_argument('-j', '--jobs', type=int, default=0, help="worker processes (default: all CPUs)")
+    export.add_argument('--format', choices=('png', 'svg'), default='png', help="frame format for a directory")
+    export.add_argument('--width', type=int, default=800, help="image width in pixels")
+    export.add_argument('--height', type=int, default=600, help="image height in pixels")
+    export.add_argument('--dpi', type=int, default=100)
+    export.add_argument('--fps', type=float, default=10, help="animation frame rate")
+    export.add_argument('--layout', choices=('spring', 'bipartite'), default='spring')
+    export.add_argument('--no-highlight', action='store_true', help="do not paint deadlocks red")
+    export.set_defaults(func=cmd_export)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
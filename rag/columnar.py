@@ -0,0 +1,353 @@
+"""Binary columnar snapshots of an allocation graph, loaded with ``mmap``.
+
+A snapshot file holds, after a fixed header and section table, one
+8-byte-aligned column per section:
+
+* an interned name table (UTF-8 blob plus ``uint64`` offsets);
+* node kind (``uint8``: 0 process, 1 resource) and instance count
+  (``int32``) per node id;
+* edges sorted by source: ``src``/``dst`` (``int32``), kind (``uint8``:
+  0 request, 1 allocation) and count (``int32``), with a CSR offset per node,
+  so the out-edges of any node are one contiguous slice;
+* claims as ``(process, resource, count)`` ``int32`` triples.
+
+:func:`load` maps the file and wraps the columns in NumPy arrays without
+reading them, so even a multi-GB snapshot opens at once and only the pages
+that are touched get read. :class:`MappedGraph` runs deadlock detection on
+the mapped columns (through the kernels of :mod:`rag.parallel`) and decodes
+names only for the processes it reports. ``to_networkx``, ``to_compact`` and
+``populate`` convert back to the other models. Needs NumPy.
+"""
+
+import mmap
+import struct
+
+import numpy as np
+
+from rag.compact import EDGE_TYPES, NODE_TYPES, PROCESS, RESOURCE
+
+MAGIC = b'RAGSNAP\x01'
+SUFFIX = '.ragsnap'
+
+_HEADER = struct.Struct('<8sQQQ')     # magic, nodes, edges, claims
+_SECTION = struct.Struct('<QQ')        # offset, byte length
+_SECTIONS = (
+    ('name_offsets', '<u8'),
+    ('names', 'u1'),
+    ('kind', 'u1'),
+    ('instances', '<i4'),
+    ('out_offsets', '<i8'),
+    ('src', '<i4'),
+    ('dst', '<i4'),
+    ('edge_kind', 'u1'),
+    ('count', '<i4'),
+    ('claims', '<i4'),
+)
+
+
+def save(store, path):
+    """Write ``store`` (a :class:`~rag.engine.RAGEngine`,
+    :class:`~rag.compact.CompactGraph` or :class:`MappedGraph`) to ``path``.
+    Node names are stored as strings."""
+    from rag.parallel import _columns
+
+    names, columns = _columns(store)
+    live = np.fromiter((name is not None for name in names), dtype=bool, count=len(names))
+    remap = np.cumsum(live) - 1
+    names = [name for name in names if name is not None]
+    src = remap[columns['src']].astype(np.int32)
+    dst = remap[columns['dst']].astype(np.int32)
+    order = np.argsort(src, kind='stable')
+    n = len(names)
+
+    encoded = [str(name).encode('utf-8') for name in names]
+    name_offsets = np.zeros(n + 1, dtype='<u8')
+    name_offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.uint64)
+    out_offsets = np.zeros(n + 1, dtype='<i8')
+    out_offsets[1:] = np.cumsum(np.bincount(src, minlength=n))
+    claims = np.array([(remap[p], remap[r], c) for p, r, c in _claims(store, names)],
+                      dtype='<i4').reshape(-1, 3)
+
+    data = {
+        'name_offsets': name_offsets,
+        'names': np.frombuffer(b''.join(encoded), dtype='u1'),
+        'kind': columns['kind'][live].astype('u1'),
+        'instances': columns['instances'][live].astype('<i4'),
+        'out_offsets': out_offsets,
+        'src': src[order].astype('<i4'),
+        'dst': dst[order].astype('<i4'),
+        'edge_kind': columns['edge_kind'][order].astype('u1'),
+        'count': columns['count'][order].astype('<i4'),
+        'claims': claims.ravel(),
+    }
+    table = []
+    offset = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    for name, _ in _SECTIONS:
+        offset = -(-offset // 8) * 8
+        table.append((offset, data[name].nbytes))
+        offset += data[name].nbytes
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, n, len(src), len(claims)))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        for (name, _), (start, _) in zip(_SECTIONS, table):
+            f.write(b'\0' * (start - f.tell()))
+            data[name].tofile(f)
+
+
+def _claims(store, names):
+    graph = getattr(store, 'graph', None)
+    if isinstance(store, MappedGraph):
+        yield from store.claims()
+        return
+    if graph is None:
+        return
+    ids = {name: i for i, name in enumerate(names)}
+    for p, attr in graph.nodes(data=True):
+        for r, count in attr.get('claims', {}).items():
+            if r in ids:
+                yield ids[p], ids[r], count
+
+
+def load(path):
+    """Map the snapshot at ``path``; raises ``ValueError`` if it is not one."""
+    return MappedGraph(path)
+
+
+class _Names:
+    # Sequence view of the name table; each name is decoded when asked for
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start, stop = int(self._offsets[i]), int(self._offsets[i + 1])
+        return bytes(self._blob[start:stop]).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class MappedGraph:
+    """Read-only allocation graph over the columns of a mapped snapshot."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, n_nodes, n_edges, n_claims = _HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError("bad magic number")
+            columns = {}
+            for k, (name, dtype) in enumerate(_SECTIONS):
+                offset, size = _SECTION.unpack_from(self._mmap, _HEADER.size + k * _SECTION.size)
+                itemsize = np.dtype(dtype).itemsize
+                columns[name] = np.frombuffer(self._mmap, dtype=dtype, count=size // itemsize, offset=offset)
+        except (struct.error, ValueError) as e:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a valid graph snapshot: {e}") from None
+        self.columns = columns
+        self.names = _Names(columns['name_offsets'], columns['names'])
+        self.n_nodes = n_nodes
+        self.n_edges = n_edges
+        self._ids = None
+
+    def close(self):
+        # Arrays handed out keep the mapping alive until they are released
+        self.columns = None
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Queries; looking a node up by name builds the name index once
+    def __contains__(self, name):
+        return name in self._index()
+
+    def __len__(self):
+        return self.n_nodes
+
+    def number_of_edges(self):
+        return self.n_edges
+
+    def _index(self):
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self.names)}
+        return self._ids
+
+    def node_id(self, name):
+        return self._index()[name]
+
+    def node_name(self, node_id):
+        return self.names[node_id]
+
+    def node_type(self, name):
+        return NODE_TYPES[self.columns['kind'][self.node_id(name)]]
+
+    def processes(self):
+        return [self.names[i] for i in np.flatnonzero(self.columns['kind'] == PROCESS)]
+
+    def resources(self):
+        return [self.names[i] for i in np.flatnonzero(self.columns['kind'] == RESOURCE)]
+
+    def instances(self, resource):
+        return int(self.columns['instances'][self.node_id(resource)])
+
+    def is_multi_instance(self):
+        c = self.columns
+        return bool((c['instances'][c['kind'] == RESOURCE] > 1).any())
+
+    def successors(self, name):
+        i = self.node_id(name)
+        offsets = self.columns['out_offsets']
+        return [self.names[j] for j in self.columns['dst'][offsets[i]:offsets[i + 1]]]
+
+    def edges(self):
+        names, c = self.names, self.columns
+        for u, v, k, count in zip(c['src'].tolist(), c['dst'].tolist(), c['edge_kind'].tolist(),
+                                  c['count'].tolist()):
+            yield names[u], names[v], EDGE_TYPES[k], count
+
+    def claims(self):
+        """``(process id, resource id, count)`` for every declared claim."""
+        return [tuple(t) for t in self.columns['claims'].reshape(-1, 3).tolist()]
+
+    # Detection on the mapped columns
+    def check_deadlock(self):
+        """First wait-for cycle as a list of name edges, or ``None``, like
+        :meth:`RAGEngine.check_deadlock`."""
+        from rag.parallel import _wait_for
+
+        c = self.columns
+        waiter, holder = _wait_for(c, np.arange(self.n_edges))
+        cycle = _find_cycle(waiter, holder)
+        if cycle is None:
+            return None
+        return [(self.names[a], self.names[b]) for a, b in zip(cycle, cycle[1:])]
+
+    def find_deadlock(self):
+        """``(kind, found)`` as from :meth:`RAGEngine.find_deadlock`."""
+        report = self.analyze_deadlocks()
+        if self.is_multi_instance():
+            return 'matrix', sorted(report.deadlocked, key=str)
+        return 'cycles', report if report.clusters else None
+
+    def analyze_deadlocks(self, jobs=1, shards=None, max_cycles=0):
+        """Every deadlock; see :func:`rag.parallel.analyze`."""
+        from rag import parallel
+        return parallel.analyze(self, jobs, shards, max_cycles)
+
+    # Conversion
+    def to_networkx(self):
+        import networkx as nx
+        c = self.columns
+        names = list(self.names)
+        graph = nx.DiGraph()
+        for name, kind, instances in zip(names, c['kind'].tolist(), c['instances'].tolist()):
+            if kind:
+                graph.add_node(name, type='resource', instances=instances)
+            else:
+                graph.add_node(name, type='process')
+        graph.add_edges_from((names[u], names[v], {'type': EDGE_TYPES[k], 'count': count})
+                             for u, v, k, count in zip(c['src'].tolist(), c['dst'].tolist(),
+                                                       c['edge_kind'].tolist(), c['count'].tolist()))
+        for p, r, count in self.claims():
+            graph.nodes[names[p]].setdefault('claims', {})[names[r]] = count
+        return graph
+
+    def to_engine(self):
+        from rag.engine import RAGEngine
+        engine = RAGEngine()
+        engine.graph = self.to_networkx()
+        return engine
+
+    def populate(self, engine):
+        """Replace the contents of ``engine`` with the snapshot through its
+        public API (in one transaction), so observers see every change."""
+        c = self.columns
+        names = list(self.names)
+        with engine.transaction():
+            engine.remove_all()
+            for name, kind, instances in zip(names, c['kind'].tolist(), c['instances'].tolist()):
+                if kind:
+                    engine.add_resource(name, instances)
+                else:
+                    engine.add_process(name)
+            for u, v, k, count in zip(c['src'].tolist(), c['dst'].tolist(), c['edge_kind'].tolist(),
+                                      c['count'].tolist()):
+                if k:
+                    engine.add_allocation_edge(names[u], names[v], count)
+                else:
+                    engine.add_request_edge(names[u], names[v], count)
+            for p, r, count in self.claims():
+                engine.set_claim(names[p], names[r], count)
+
+    def to_compact(self):
+        # Adopts the columns directly instead of re-adding every edge
+        from array import array
+
+        from rag.compact import CompactGraph
+        c = self.columns
+        store = CompactGraph()
+        names = list(self.names)
+        store._names = names
+        store._ids = {name: i for i, name in enumerate(names)}
+        store._kind = bytearray(c['kind'].tobytes())
+        store._instances = array('i', c['instances'].astype(np.int32).tobytes())
+        kinds = c['kind']
+        store.process_ids = set(np.flatnonzero(kinds == PROCESS).tolist())
+        store.resource_ids = set(np.flatnonzero(kinds == RESOURCE).tolist())
+        store._src = array('i', c['src'].astype(np.int32).tobytes())
+        store._dst = array('i', c['dst'].astype(np.int32).tobytes())
+        store._ekind = bytearray(c['edge_kind'].tobytes())
+        store._count = array('i', c['count'].astype(np.int32).tobytes())
+        store._alive = bytearray(b'\x01') * self.n_edges
+        store._live_edges = self.n_edges
+        store.compact()
+        return store
+
+
+def _find_cycle(waiter, holder):
+    # Iterative DFS over the wait-for edges; returns a closed node path
+    if not len(waiter):
+        return None
+    nodes, local = np.unique(np.concatenate([waiter, holder]), return_inverse=True)
+    n = len(nodes)
+    w, h = local[:len(waiter)], local[len(waiter):]
+    order = np.argsort(w, kind='stable')
+    offsets = np.searchsorted(w[order], np.arange(n + 1)).tolist()
+    succ = h[order].tolist()
+    state = [0] * n     # 1 = on the DFS path, 2 = finished
+    for root in range(n):
+        if state[root]:
+            continue
+        state[root] = 1
+        path = [root]
+        cursor = [offsets[root]]
+        while path:
+            v = path[-1]
+            i = cursor[-1]
+            if i == offsets[v + 1]:
+                state[v] = 2
+                path.pop()
+                cursor.pop()
+                continue
+            cursor[-1] = i + 1
+            u = succ[i]
+            if state[u] == 1:
+                cycle = path[path.index(u):] + [u]
+                return [int(nodes[k]) for k in cycle]
+            if not state[u]:
+                state[u] = 1
+                path.append(u)
+                cursor.append(offsets[u])
+    return None
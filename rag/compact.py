@@ -0,0 +1,345 @@
+"""Compact array-backed storage for very large allocation graphs.
+
+``networkx`` keeps a dict of attribute dicts for every node and edge, which
+costs hundreds of bytes per element. :class:`CompactGraph` interns node names
+to integer ids and keeps edges in parallel typed columns (``array``), roughly
+20 bytes per edge. Adjacency is a CSR index over those columns, rebuilt
+lazily. Edges added since the last rebuild sit in small per-node overflow
+lists, and removed edges are tombstoned until the next rebuild. Node ids are
+never reused, so ids handed out stay valid for the lifetime of the store.
+
+The public methods mirror :class:`~rag.engine.RAGEngine`, so batch code can
+use either store. ``to_networkx`` and ``from_networkx`` convert between them.
+"""
+
+from array import array
+
+PROCESS = 0
+RESOURCE = 1
+REQUEST = 0
+ALLOCATION = 1
+
+NODE_TYPES = ('process', 'resource')
+EDGE_TYPES = ('request', 'allocation')
+
+
+class CompactGraph:
+
+    def __init__(self):
+        self.remove_all()
+
+    def remove_all(self):
+        # Node table, indexed by id
+        self._names = []
+        self._ids = {}
+        self._kind = bytearray()
+        self._instances = array('i')
+        self.process_ids = set()
+        self.resource_ids = set()
+
+        # Edge columns, indexed by slot
+        self._src = array('i')
+        self._dst = array('i')
+        self._ekind = bytearray()
+        self._count = array('i')
+        self._alive = bytearray()
+        self._live_edges = 0
+
+        # CSR adjacency for the slots present at the last rebuild
+        self._indexed_nodes = 0
+        self._out_offsets = array('i', [0])
+        self._out_slots = array('i')
+        self._in_offsets = array('i', [0])
+        self._in_slots = array('i')
+        self._extra_out = {}
+        self._extra_in = {}
+        self._pending = 0
+
+    # Construction and conversion
+    @classmethod
+    def from_networkx(cls, graph):
+        store = cls()
+        for n, attr in graph.nodes(data=True):
+            if attr.get('type') == 'process':
+                store.add_process(n)
+            elif attr.get('type') == 'resource':
+                store.add_resource(n, attr.get('instances', 1))
+        for u, v, d in graph.edges(data=True):
+            # Bulk load: append to the columns only and index once at the end
+            store._append_edge(store._ids[u], store._ids[v],
+                               EDGE_TYPES.index(d.get('type')), d.get('count', 1), indexed=False)
+        store.compact()
+        return store
+
+    @classmethod
+    def from_engine(cls, engine):
+        return cls.from_networkx(engine.graph)
+
+    def to_networkx(self):
+        import networkx as nx
+        graph = nx.DiGraph()
+        for i in self.process_ids:
+            graph.add_node(self._names[i], type='process')
+        for i in self.resource_ids:
+            graph.add_node(self._names[i], type='resource', instances=self._instances[i])
+        for u, v, kind, count in self.edges():
+            graph.add_edge(u, v, type=kind, count=count)
+        return graph
+
+    def to_engine(self):
+        from rag.engine import RAGEngine
+        engine = RAGEngine()
+        engine.graph = self.to_networkx()
+        return engine
+
+    # Queries
+    def __contains__(self, name):
+        return name in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def number_of_edges(self):
+        return self._live_edges
+
+    def node_id(self, name):
+        return self._ids[name]
+
+    def node_name(self, node_id):
+        return self._names[node_id]
+
+    def node_type(self, name):
+        i = self._ids.get(name)
+        return None if i is None else NODE_TYPES[self._kind[i]]
+
+    def processes(self):
+        return [self._names[i] for i in self.process_ids]
+
+    def resources(self):
+        return [self._names[i] for i in self.resource_ids]
+
+    def instances(self, resource):
+        return self._instances[self._ids[resource]]
+
+    def edges(self):
+        names = self._names
+        for slot in range(len(self._src)):
+            if self._alive[slot]:
+                yield (names[self._src[slot]], names[self._dst[slot]],
+                       EDGE_TYPES[self._ekind[slot]], self._count[slot])
+
+    def successors(self, name):
+        return [self._names[j] for j in self.successor_ids(self._ids[name])]
+
+    def predecessors(self, name):
+        return [self._names[j] for j in self.predecessor_ids(self._ids[name])]
+
+    def successor_ids(self, i):
+        dst = self._dst
+        return [dst[slot] for slot in self._out_edge_slots(i)]
+
+    def predecessor_ids(self, i):
+        src = self._src
+        return [src[slot] for slot in self._in_edge_slots(i)]
+
+    def has_edge(self, u, v):
+        i, j = self._ids.get(u), self._ids.get(v)
+        return i is not None and j is not None and self._find_slot(i, j) is not None
+
+    # Nodes
+    def add_process(self, process):
+        if not process or process in self._ids:
+            return False
+        self.process_ids.add(self._new_node(process, PROCESS, 0))
+        return True
+
+    def add_resource(self, resource, instances=1):
+        if instances < 1:
+            raise ValueError("A resource needs at least one instance")
+        if not resource or resource in self._ids:
+            return False
+        self.resource_ids.add(self._new_node(resource, RESOURCE, instances))
+        return True
+
+    def remove_process(self, process):
+        return self._remove_node(process)
+
+    def remove_resource(self, resource):
+        return self._remove_node(resource)
+
+    def _new_node(self, name, kind, instances):
+        i = len(self._names)
+        self._names.append(name)
+        self._ids[name] = i
+        self._kind.append(kind)
+        self._instances.append(instances)
+        return i
+
+    def _remove_node(self, name):
+        i = self._ids.pop(name, None)
+        if i is None:
+            return False
+        for slot in list(self._out_edge_slots(i)) + list(self._in_edge_slots(i)):
+            self._kill(slot)
+        self._names[i] = None
+        self.process_ids.discard(i)
+        self.resource_ids.discard(i)
+        return True
+
+    # Edges
+    def add_request_edge(self, process, resource, count=1):
+        return self._add_edge(process, resource, PROCESS, RESOURCE, REQUEST, count,
+                              "Request edge must go from process to resource")
+
+    def add_allocation_edge(self, resource, process, count=1):
+        return self._add_edge(resource, process, RESOURCE, PROCESS, ALLOCATION, count,
+                              "Allocation edge must go from resource to process")
+
+    def remove_edge(self, from_node, to_node):
+        i, j = self._ids.get(from_node), self._ids.get(to_node)
+        if i is None or j is None:
+            return False
+        slot = self._find_slot(i, j)
+        if slot is None:
+            return False
+        self._kill(slot)
+        return True
+
+    def _add_edge(self, u, v, u_kind, v_kind, kind, count, message):
+        i, j = self._ids.get(u), self._ids.get(v)
+        if i is None or j is None:
+            return False
+        if self._kind[i] != u_kind or self._kind[j] != v_kind:
+            raise ValueError(message)
+        if count < 1:
+            raise ValueError("An edge must carry at least one instance")
+        slot = self._find_slot(i, j)
+        if kind == ALLOCATION:
+            held = sum(self._count[k] for k in self._out_edge_slots(i) if k != slot)
+            free = self._instances[i] - held
+            if count > free:
+                raise ValueError(f"Resource {u} has only {free} free instance(s)")
+        if slot is not None:
+            self._count[slot] = count
+        else:
+            self._append_edge(i, j, kind, count)
+        return True
+
+    def _append_edge(self, i, j, kind, count, indexed=True):
+        slot = len(self._src)
+        self._src.append(i)
+        self._dst.append(j)
+        self._ekind.append(kind)
+        self._count.append(count)
+        self._alive.append(1)
+        self._live_edges += 1
+        if not indexed:
+            return
+        self._extra_out.setdefault(i, []).append(slot)
+        self._extra_in.setdefault(j, []).append(slot)
+        self._pending += 1
+        # Rebuilding costs O(V + E), so amortise it over a fraction of that
+        if self._pending > max(4096, (self._live_edges + len(self._names)) // 4):
+            self.compact()
+
+    def _kill(self, slot):
+        if self._alive[slot]:
+            self._alive[slot] = 0
+            self._live_edges -= 1
+
+    def _find_slot(self, i, j):
+        dst = self._dst
+        for slot in self._out_edge_slots(i):
+            if dst[slot] == j:
+                return slot
+        return None
+
+    # Adjacency index
+    def _out_edge_slots(self, i):
+        return self._row_slots(i, self._out_offsets, self._out_slots, self._extra_out)
+
+    def _in_edge_slots(self, i):
+        return self._row_slots(i, self._in_offsets, self._in_slots, self._extra_in)
+
+    def _row_slots(self, i, offsets, slots, extra):
+        alive = self._alive
+        if i < self._indexed_nodes:
+            for k in range(offsets[i], offsets[i + 1]):
+                slot = slots[k]
+                if alive[slot]:
+                    yield slot
+        for slot in extra.get(i, ()):
+            if alive[slot]:
+                yield slot
+
+    def compact(self):
+        """Drop tombstoned edges and rebuild the CSR index."""
+        keep = [slot for slot in range(len(self._src)) if self._alive[slot]]
+        if len(keep) != len(self._src):
+            self._src = array('i', (self._src[s] for s in keep))
+            self._dst = array('i', (self._dst[s] for s in keep))
+            self._ekind = bytearray(self._ekind[s] for s in keep)
+            self._count = array('i', (self._count[s] for s in keep))
+            self._alive = bytearray(b'\x01') * len(keep)
+        n = len(self._names)
+        self._out_offsets, self._out_slots = _csr(self._src, n)
+        self._in_offsets, self._in_slots = _csr(self._dst, n)
+        self._indexed_nodes = n
+        self._extra_out = {}
+        self._extra_in = {}
+        self._pending = 0
+
+    # Deadlock detection
+    def wait_for_successors(self, p):
+        """Ids of the processes holding a resource that process ``p`` requests."""
+        dst = self._dst
+        for slot in self._out_edge_slots(p):
+            for holder_slot in self._out_edge_slots(dst[slot]):
+                holder = dst[holder_slot]
+                if holder != p:
+                    yield holder
+
+    def check_deadlock(self):
+        """Return the first wait-for cycle as a list of name edges, or ``None``.
+
+        Same result shape as :meth:`RAGEngine.check_deadlock`, computed by an
+        iterative DFS over the implicit wait-for graph without materialising
+        it.
+        """
+        state = {}   # 1 = on the DFS stack, 2 = finished
+        names = self._names
+        for root in self.process_ids:
+            if root in state:
+                continue
+            state[root] = 1
+            path = [root]
+            stack = [self.wait_for_successors(root)]
+            while stack:
+                for q in stack[-1]:
+                    if state.get(q) == 1:
+                        cycle = path[path.index(q):] + [q]
+                        return [(names[a], names[b]) for a, b in zip(cycle, cycle[1:])]
+                    if q not in state:
+                        state[q] = 1
+                        path.append(q)
+                        stack.append(self.wait_for_successors(q))
+                        break
+                else:
+                    state[path.pop()] = 2
+                    stack.pop()
+        return None
+
+
+def _csr(keys, n):
+    # Counting sort of edge slots by endpoint id
+    offsets = array('i', bytes(4 * (n + 1)))
+    for k in keys:
+        offsets[k + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+    cursor = array('i', offsets)
+    slots = array('i', bytes(4 * len(keys)))
+    for slot, k in enumerate(keys):
+        slots[cursor[k]] = slot
+        cursor[k] += 1
+    return offsets, slots
@@ -0,0 +1,409 @@
+"""GUI-free model of a Resource Allocation Graph.
+
+The engine owns the ``networkx`` graph and every mutation and query the
+simulator needs. Front ends (the Tk window in ``sim_2.0.py``, batch jobs,
+services) drive it through plain method calls and never touch Tk or
+matplotlib.
+"""
+
+import functools
+import time
+from contextlib import contextmanager
+
+import networkx as nx
+
+
+def _instrumented(mutation):
+    # Time the call when a rag.metrics.Metrics is attached to the engine;
+    # mutations also bump engine.version so caches can tell they are stale
+    def decorate(func):
+        op = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if mutation:
+                self.version += 1
+            metrics = self.metrics
+            if metrics is None:
+                return func(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                metrics.observe(op, time.perf_counter() - start)
+                if mutation:
+                    metrics.count_event()
+        return wrapper
+    return decorate
+
+
+class GraphObserver:
+    """Receives every mutation applied to a :class:`RAGEngine`.
+
+    Edge callbacks fire after the graph has been updated. Removing a node
+    first reports the removal of each incident edge, so observers that only
+    track edges stay consistent.
+    """
+
+    def node_added(self, name, kind):
+        pass
+
+    def node_removed(self, name, kind):
+        pass
+
+    def edge_added(self, u, v, kind):
+        pass
+
+    def edge_removed(self, u, v, kind):
+        pass
+
+    def edge_updated(self, u, v, kind):
+        # The edge's count changed
+        pass
+
+    def claim_set(self, process, resource, count):
+        # count is None when a claim is withdrawn
+        pass
+
+    def cleared(self):
+        pass
+
+
+class RAGEngine:
+
+    def __init__(self, clock=time.monotonic):
+        # clock stamps each process's creation time; recovery costs use its age
+        self.clock = clock
+        self.graph = nx.DiGraph()
+        self.observers = []
+        self.metrics = None
+        self.version = 0
+        self._journal = None
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    @contextmanager
+    def transaction(self):
+        """Apply a group of mutations atomically.
+
+        Every mutation inside the block records its inverse; if the block
+        raises, the inverses are replayed in reverse order (observers see
+        them as ordinary mutations) and the exception propagates. Nested
+        blocks join the outermost transaction.
+        """
+        if self._journal is not None:
+            yield self
+            return
+        self._journal = []
+        try:
+            yield self
+        except BaseException:
+            journal, self._journal = self._journal, None
+            self.version += 1
+            for undo in reversed(journal):
+                undo()
+            raise
+        finally:
+            self._journal = None
+
+    def _record(self, undo):
+        if self._journal is not None:
+            self._journal.append(undo)
+
+    # Queries
+    def node_type(self, name):
+        return self.graph.nodes[name].get('type') if name in self.graph else None
+
+    def processes(self):
+        return [n for n, attr in self.graph.nodes(data=True) if attr.get('type') == 'process']
+
+    def resources(self):
+        return [n for n, attr in self.graph.nodes(data=True) if attr.get('type') == 'resource']
+
+    def instances(self, resource):
+        return self.graph.nodes[resource].get('instances', 1)
+
+    def allocated(self, resource):
+        return sum(d.get('count', 1) for d in self.graph.succ[resource].values())
+
+    def available(self, resource):
+        return self.instances(resource) - self.allocated(resource)
+
+    def age(self, process):
+        return self.clock() - self.graph.nodes[process].get('created', self.clock())
+
+    def is_multi_instance(self):
+        return any(attr.get('instances', 1) > 1 for n, attr in self.graph.nodes(data=True)
+                   if attr.get('type') == 'resource')
+
+    def request_edges(self):
+        return [(u, v) for u, v, d in self.graph.edges(data=True) if d.get('type') == 'request']
+
+    def allocation_edges(self):
+        return [(u, v) for u, v, d in self.graph.edges(data=True) if d.get('type') == 'allocation']
+
+    # Nodes
+    @_instrumented(mutation=True)
+    def add_process(self, process):
+        if process and not self.graph.has_node(process):
+            self.graph.add_node(process, type='process', created=self.clock())
+            self._record(lambda: self._remove_node(process))
+            for observer in self.observers:
+                observer.node_added(process, 'process')
+            return True
+        return False
+
+    @_instrumented(mutation=True)
+    def remove_process(self, process):
+        return self._remove_node(process)
+
+    @_instrumented(mutation=True)
+    def add_resource(self, resource, instances=1):
+        if instances < 1:
+            raise ValueError("A resource needs at least one instance")
+        if resource and not self.graph.has_node(resource):
+            self.graph.add_node(resource, type='resource', instances=instances)
+            self._record(lambda: self._remove_node(resource))
+            for observer in self.observers:
+                observer.node_added(resource, 'resource')
+            return True
+        return False
+
+    @_instrumented(mutation=True)
+    def remove_resource(self, resource):
+        return self._remove_node(resource)
+
+    def _remove_node(self, name):
+        if name not in self.graph:
+            return False
+        if self.observers or self._journal is not None:
+            # Part of this one mutation, so not timed or counted on their own
+            for u, v in list(self.graph.in_edges(name)) + list(self.graph.out_edges(name)):
+                self._remove_edge(u, v)
+        kind = self.node_type(name)
+        if kind == 'resource':
+            # Drop claims on the resource so re-adding it starts clean
+            for p, attr in list(self.graph.nodes(data=True)):
+                previous = attr.get('claims', {}).get(name)
+                if previous is not None:
+                    self._set_claim(p, name, None)
+                    self._record(lambda p=p, previous=previous: self._set_claim(p, name, previous))
+        attrs = self.graph.nodes[name]
+        self.graph.remove_node(name)
+        self._record(lambda: self._restore_node(name, attrs))
+        for observer in self.observers:
+            observer.node_removed(name, kind)
+        return True
+
+    def _restore_node(self, name, attrs):
+        self.graph.add_node(name, **attrs)
+        for observer in self.observers:
+            observer.node_added(name, attrs.get('type'))
+
+    # Edges
+    @_instrumented(mutation=True)
+    def add_request_edge(self, process, resource, count=1):
+        if process in self.graph and resource in self.graph:
+            if self.node_type(process) == 'process' and self.node_type(resource) == 'resource':
+                self._add_edge(process, resource, 'request', count)
+                return True
+            raise ValueError("Request edge must go from process to resource")
+        return False
+
+    @_instrumented(mutation=True)
+    def add_allocation_edge(self, resource, process, count=1):
+        if resource in self.graph and process in self.graph:
+            if self.node_type(resource) == 'resource' and self.node_type(process) == 'process':
+                edge = self.graph.succ[resource].get(process)
+                free = self.available(resource) + (edge.get('count', 1) if edge else 0)
+                if count > free:
+                    raise ValueError(f"Resource {resource} has only {free} free instance(s)")
+                self._add_edge(resource, process, 'allocation', count)
+                return True
+            raise ValueError("Allocation edge must go from resource to process")
+        return False
+
+    @_instrumented(mutation=True)
+    def set_claim(self, process, resource, count):
+        # Maximum number of instances of resource the process may ever hold;
+        # None withdraws the claim
+        if self.node_type(process) != 'process' or self.node_type(resource) != 'resource':
+            raise ValueError("A claim must name a process and a resource")
+        previous = self.graph.nodes[process].get('claims', {}).get(resource)
+        self._set_claim(process, resource, count)
+        self._record(lambda: self._set_claim(process, resource, previous))
+
+    def _set_claim(self, process, resource, count):
+        claims = self.graph.nodes[process].setdefault('claims', {})
+        if count is None:
+            claims.pop(resource, None)
+        else:
+            claims[resource] = count
+        for observer in self.observers:
+            observer.claim_set(process, resource, count)
+
+    @_instrumented(mutation=True)
+    def mark_rollback(self, process):
+        # Count how often a process was rolled back by deadlock recovery
+        attrs = self.graph.nodes[process]
+        previous = attrs.get('rollbacks')
+        attrs['rollbacks'] = (previous or 0) + 1
+        self._record(lambda: attrs.__setitem__('rollbacks', previous) if previous is not None
+                     else attrs.pop('rollbacks', None))
+
+    def _add_edge(self, u, v, kind, count=1):
+        # Re-adding an existing edge only updates its count
+        if count < 1:
+            raise ValueError("An edge must carry at least one instance")
+        if self.graph.has_edge(u, v):
+            previous = self.graph.edges[u, v].get('count', 1)
+            self._set_count(u, v, count)
+            self._record(lambda: self._set_count(u, v, previous))
+            return
+        self._restore_edge(u, v, {'type': kind, 'count': count})
+        self._record(lambda: self._remove_edge(u, v))
+
+    def _set_count(self, u, v, count):
+        data = self.graph.edges[u, v]
+        data['count'] = count
+        for observer in self.observers:
+            observer.edge_updated(u, v, data.get('type'))
+
+    def _restore_edge(self, u, v, attrs):
+        self.graph.add_edge(u, v, **attrs)
+        for observer in self.observers:
+            observer.edge_added(u, v, attrs.get('type'))
+
+    @_instrumented(mutation=True)
+    def remove_edge(self, from_node, to_node):
+        return self._remove_edge(from_node, to_node)
+
+    def _remove_edge(self, from_node, to_node):
+        if self.graph.has_edge(from_node, to_node):
+            attrs = self.graph.edges[from_node, to_node]
+            kind = attrs.get('type')
+            self.graph.remove_edge(from_node, to_node)
+            self._record(lambda: self._restore_edge(from_node, to_node, attrs))
+            for observer in self.observers:
+                observer.edge_removed(from_node, to_node, kind)
+            return True
+        return False
+
+    @_instrumented(mutation=True)
+    def remove_all(self):
+        if self._journal is not None:
+            snapshot = self.graph.copy()
+            self._record(lambda: self._restore_graph(snapshot))
+        self.graph.clear()
+        for observer in self.observers:
+            observer.cleared()
+
+    def _restore_graph(self, snapshot):
+        self.remove_all()
+        for name, attrs in snapshot.nodes(data=True):
+            self._restore_node(name, attrs)
+        for u, v, attrs in snapshot.edges(data=True):
+            self._restore_edge(u, v, attrs)
+
+    # Deadlock detection
+    def wait_for_graph(self):
+        """Derive the process wait-for graph from adjacency lists.
+
+        A process waits for every other process holding a resource it
+        requests, so each resource contributes waiters x holders edges. With
+        single-instance resources that is one holder per resource and the
+        whole derivation is O(V + E).
+
+        A process that holds something and asks for more of a resource than
+        it could get even if everyone else released it (re-requesting a
+        single-instance resource it holds, say) waits for itself: the
+        self-loop makes it deadlocked, as in the matrix algorithm.
+        """
+        dependency_graph = nx.DiGraph()
+        succ = self.graph.succ
+        pred = self.graph.pred
+        nodes = self.graph.nodes
+        for r in self.resources():
+            holders = succ[r]
+            waiters = pred[r]
+            if not waiters:
+                continue
+            instances = nodes[r].get('instances', 1)
+            for waiter, d in waiters.items():
+                if waiter in holders:
+                    dependency_graph.add_edges_from((waiter, h) for h in holders if h != waiter)
+                    wanted = d.get('count', 1) + holders[waiter].get('count', 1)
+                else:
+                    dependency_graph.add_edges_from((waiter, h) for h in holders)
+                    wanted = d.get('count', 1)
+                if wanted > instances and pred[waiter]:
+                    dependency_graph.add_edge(waiter, waiter)
+        return dependency_graph
+
+    @_instrumented(mutation=False)
+    def check_deadlock(self):
+        """Return the first wait-for cycle as a list of edges, or ``None``."""
+        try:
+            return list(nx.find_cycle(self.wait_for_graph(), orientation='original'))
+        except nx.NetworkXNoCycle:
+            return None
+
+    @_instrumented(mutation=False)
+    def analyze_deadlocks(self, max_cycles=0):
+        """Every deadlock at once; see :func:`rag.analysis.analyze`."""
+        from rag import analysis
+        return analysis.analyze(self, max_cycles)
+
+    @_instrumented(mutation=False)
+    def find_deadlock(self):
+        """The deadlock verdict every front end shares, as ``(kind, found)``.
+
+        With multi-instance resources, where a cycle is not sufficient, it is
+        ``('matrix', deadlocked processes)``, otherwise ``('cycles',
+        DeadlockReport)``; an empty ``found`` means no deadlock. Both come
+        from :meth:`analyze_deadlocks`, so they agree with the partitioned
+        analysis.
+        """
+        report = self.analyze_deadlocks()
+        if self.is_multi_instance():
+            return 'matrix', sorted(report.deadlocked, key=str)
+        return 'cycles', report if report.clusters else None
+
+    @_instrumented(mutation=False)
+    def analyze_deadlocks_parallel(self, jobs=None, shards=None, max_cycles=0):
+        """Every deadlock, with the graph partitioned across worker
+        processes; see :func:`rag.parallel.analyze`."""
+        from rag import parallel
+        return parallel.analyze(self, jobs, shards, max_cycles)
+
+    @_instrumented(mutation=False)
+    def deadlocked_processes(self):
+        """Processes that can never finish, valid for multi-instance resources.
+
+        Uses the Available/Allocation/Request matrix algorithm from
+        :mod:`rag.banker`, which needs NumPy.
+        """
+        from rag import banker
+        return banker.deadlocked_processes(self)
+
+    @_instrumented(mutation=False)
+    def recover(self, strategy='terminate'):
+        """Break every deadlock; see :func:`rag.recovery.recover`."""
+        from rag import recovery
+        return recovery.recover(self, strategy)
+
+    @_instrumented(mutation=False)
+    def request_is_safe(self, process, resource, count=1):
+        """Banker's admission check for granting ``count`` instances."""
+        from rag import banker
+        return banker.engine_request_is_safe(self, process, resource, count)
+
+
+def cycle_nodes(cycle):
+    # Process names around the cycle, closed back onto the first one
+    return [edge[0] for edge in cycle] + [cycle[0][0]]
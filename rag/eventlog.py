@@ -0,0 +1,326 @@
+"""Append-only binary event log with snapshots, for replay and time travel.
+
+:class:`EventLog` observes a :class:`~rag.engine.RAGEngine` and appends one
+fixed-size record per mutation (21 bytes: opcode, three integer operands and
+a timestamp from the engine clock). Node names are interned: a name record
+is written the first time an id is used after the latest snapshot.
+
+Every ``snapshot_every`` events the whole graph is written inline as a
+snapshot, and its event position, byte offset and time go to a sidecar
+index (``<log>.idx``). :class:`LogReplayer` seeks to any event position by
+loading the nearest snapshot at or before it and replaying only the delta,
+so moving through an hours-long trace costs at most ``snapshot_every``
+events per seek. The index is rebuilt by scanning the log if it is missing.
+"""
+
+import os
+import struct
+from bisect import bisect_right
+
+from rag.engine import GraphObserver
+
+MAGIC = b'RAGLOG\x01\n'
+
+_RECORD = struct.Struct('<BIIId')     # op, a, b, c, time
+_INDEX = struct.Struct('<QQd')        # event position, byte offset, time
+_NODE = struct.Struct('<IBI')         # id, kind, instances
+_EDGE = struct.Struct('<IIBI')        # u, v, kind, count
+_CLAIM = struct.Struct('<III')        # process, resource, count
+
+NAME = 0
+ADD_PROCESS = 1
+ADD_RESOURCE = 2
+REMOVE_NODE = 3
+REQUEST = 4        # add a request edge or update its count
+ALLOCATION = 5     # add an allocation edge or update its count
+REMOVE_EDGE = 6
+CLEAR = 7
+CLAIM = 8          # c = count + 1, 0 withdraws the claim
+SNAPSHOT = 9
+
+
+class EventLog(GraphObserver):
+
+    def __init__(self, path, engine=None, snapshot_every=10000):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.engine = None
+        self.position = 0
+        self._file = None
+        self._index = None
+        self._ids = {}
+        self._named = set()
+        self._last_snapshot = 0
+        if engine is not None:
+            self.attach(engine)
+
+    def attach(self, engine):
+        """Start a new log at the current state of ``engine``."""
+        self.engine = engine
+        self._file = open(self.path, 'wb', buffering=1 << 16)
+        self._index = open(self.path + '.idx', 'wb')
+        self._file.write(MAGIC)
+        self.position = 0
+        self._snapshot()
+        engine.add_observer(self)
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.remove_observer(self)
+            self.engine = None
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = self._index = None
+
+    def flush(self):
+        self._file.flush()
+        self._index.flush()
+
+    # GraphObserver
+    def node_added(self, name, kind):
+        if kind == 'resource':
+            self._write(ADD_RESOURCE, self._id(name), 0, self.engine.instances(name))
+        else:
+            self._write(ADD_PROCESS, self._id(name))
+
+    def node_removed(self, name, kind):
+        self._write(REMOVE_NODE, self._id(name))
+
+    def edge_added(self, u, v, kind):
+        self._write(REQUEST if kind == 'request' else ALLOCATION, self._id(u), self._id(v),
+                    self.engine.graph.edges[u, v].get('count', 1))
+
+    edge_updated = edge_added
+
+    def edge_removed(self, u, v, kind):
+        self._write(REMOVE_EDGE, self._id(u), self._id(v))
+
+    def claim_set(self, process, resource, count):
+        self._write(CLAIM, self._id(process), self._id(resource), 0 if count is None else count + 1)
+
+    def cleared(self):
+        self._write(CLEAR)
+
+    # Writing
+    def _id(self, name):
+        i = self._ids.get(name)
+        if i is None:
+            i = self._ids[name] = len(self._ids)
+        if i not in self._named:
+            self._named.add(i)
+            data = str(name).encode('utf-8')
+            self._file.write(_RECORD.pack(NAME, i, len(data), 0, 0.0))
+            self._file.write(data)
+        return i
+
+    def _write(self, op, a=0, b=0, c=0):
+        self._file.write(_RECORD.pack(op, a, b, c, self.engine.clock()))
+        self.position += 1
+        if self.position - self._last_snapshot >= self.snapshot_every:
+            self._snapshot()
+
+    def _snapshot(self):
+        # Self-contained: names are re-declared so a reader can start here
+        graph = self.engine.graph
+        offset = self._file.tell()
+        now = self.engine.clock()
+        self._named = set()
+        nodes = []
+        edges = []
+        claims = []
+        for n, attr in graph.nodes(data=True):
+            kind = 1 if attr.get('type') == 'resource' else 0
+            nodes.append(_NODE.pack(self._id(n), kind, attr.get('instances', 1)))
+            for r, count in attr.get('claims', {}).items():
+                claims.append((n, r, count))
+        for u, v, d in graph.edges(data=True):
+            edges.append(_EDGE.pack(self._id(u), self._id(v), d.get('type') == 'allocation', d.get('count', 1)))
+        claims = [_CLAIM.pack(self._id(p), self._id(r), count) for p, r, count in claims]
+        self._file.write(_RECORD.pack(SNAPSHOT, len(nodes), len(edges), len(claims), now))
+        self._file.write(b''.join(nodes + edges + claims))
+        self._index.write(_INDEX.pack(self.position, offset, now))
+        self._last_snapshot = self.position
+
+
+class LogReplayer:
+    """Moves ``engine`` to any event position of the log at ``path``.
+
+    The engine is changed through its ordinary API, so observers attached to
+    it (online detection, the GUI) follow along.
+    """
+
+    def __init__(self, path, engine):
+        self.path = path
+        self.engine = engine
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an event log")
+        self._snapshots = self._load_index()
+        self._positions = [entry[0] for entry in self._snapshots]
+        self.position = None     # event position the engine is at
+        self._offset = None      # byte offset just after that event
+        self._names = {}
+        self.length, self.end_time = self._scan_tail()
+
+    def seek(self, position):
+        """Bring the engine to the state after ``position`` events."""
+        position = max(0, min(position, self.length))
+        k = bisect_right(self._positions, position) - 1
+        snap_position, snap_offset, _ = self._snapshots[k]
+        if self.position is not None and snap_position <= self.position <= position:
+            # Going forward from here replays no more than the snapshot would
+            self._replay(self._offset, self.position, position, snapshot=False)
+        else:
+            self._names = {}
+            self._replay(snap_offset, snap_position, position, snapshot=True)
+        return self.position
+
+    def advance(self, position, on_event=None):
+        """Replay forward event by event to ``position`` without jumping to a
+        snapshot, so engine observers see every intermediate state.
+        ``on_event(position)`` is called after each event is applied."""
+        if self.position is None:
+            self.seek(0)
+        self._replay(self._offset, self.position, min(position, self.length), snapshot=False,
+                     on_event=on_event)
+        return self.position
+
+    def seek_time(self, t):
+        """Bring the engine to the last event at or before time ``t``."""
+        return self.seek(self.position_at(t))
+
+    def position_at(self, t):
+        k = bisect_right([s[2] for s in self._snapshots], t) - 1
+        position, offset, _ = self._snapshots[max(k, 0)]
+        for record, record_position, time, _ in self._records(offset, position):
+            if record[0] != SNAPSHOT and time > t:
+                return record_position - 1
+        return self.length
+
+    # Reading
+    def _replay(self, offset, position, target, snapshot, on_event=None):
+        # self.position advances record by record, so engine observers can
+        # tell which event they are seeing
+        self.position = position
+        engine = self.engine
+        names = self._names
+        for record, record_position, _, end in self._records(offset, position, names, snapshot):
+            if record_position > target:
+                break
+            op, a, b, c = record
+            if op == ADD_PROCESS:
+                engine.add_process(names[a])
+            elif op == ADD_RESOURCE:
+                engine.add_resource(names[a], c)
+            elif op == REMOVE_NODE:
+                engine.remove_process(names[a])
+            elif op == REQUEST:
+                engine.add_request_edge(names[a], names[b], c)
+            elif op == ALLOCATION:
+                engine.add_allocation_edge(names[a], names[b], c)
+            elif op == REMOVE_EDGE:
+                engine.remove_edge(names[a], names[b])
+            elif op == CLEAR:
+                engine.remove_all()
+            elif op == CLAIM:
+                engine.set_claim(names[a], names[b], c - 1 if c else None)
+            self.position = record_position
+            self._offset = end
+            if on_event is not None and op != SNAPSHOT:
+                on_event(record_position)
+
+    def _records(self, offset, position, names=None, snapshot=False):
+        # Yields ((op, a, b, c), position, time, end offset) per event;
+        # snapshots are applied to the engine when snapshot is true
+        if names is None:
+            names = {}
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            read = f.read
+            size = _RECORD.size
+            while True:
+                header = read(size)
+                if len(header) < size:
+                    return
+                op, a, b, c, time = _RECORD.unpack(header)
+                if op == NAME:
+                    names[a] = read(b).decode('utf-8')
+                    continue
+                if op == SNAPSHOT:
+                    payload = read(a * _NODE.size + b * _EDGE.size + c * _CLAIM.size)
+                    if snapshot:
+                        self._load_snapshot(payload, a, b, c, names)
+                    yield (op, a, b, c), position, time, f.tell()
+                    continue
+                position += 1
+                yield (op, a, b, c), position, time, f.tell()
+
+    def _load_snapshot(self, payload, n_nodes, n_edges, n_claims, names):
+        engine = self.engine
+        engine.remove_all()
+        view = memoryview(payload)
+        pos = 0
+        for _ in range(n_nodes):
+            i, kind, instances = _NODE.unpack_from(view, pos)
+            pos += _NODE.size
+            if kind:
+                engine.add_resource(names[i], instances)
+            else:
+                engine.add_process(names[i])
+        for _ in range(n_edges):
+            u, v, kind, count = _EDGE.unpack_from(view, pos)
+            pos += _EDGE.size
+            if kind:
+                engine.add_allocation_edge(names[u], names[v], count)
+            else:
+                engine.add_request_edge(names[u], names[v], count)
+        for _ in range(n_claims):
+            p, r, count = _CLAIM.unpack_from(view, pos)
+            pos += _CLAIM.size
+            engine.set_claim(names[p], names[r], count)
+
+    def _load_index(self):
+        path = self.path + '.idx'
+        if os.path.exists(path):
+            size = os.path.getsize(self.path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            entries = [entry for entry in _INDEX.iter_unpack(data[:len(data) - len(data) % _INDEX.size])
+                       if entry[1] < size]
+            if entries:
+                return entries
+        return self._rebuild_index()
+
+    def _rebuild_index(self):
+        entries = []
+        with open(self.path, 'rb') as f:
+            f.seek(len(MAGIC))
+            position = 0
+            name_start = None
+            while True:
+                offset = f.tell()
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    break
+                op, a, b, c, time = _RECORD.unpack(header)
+                if op == NAME:
+                    if name_start is None:
+                        name_start = offset
+                    f.seek(b, os.SEEK_CUR)
+                    continue
+                if op == SNAPSHOT:
+                    entries.append((position, offset if name_start is None else name_start, time))
+                    f.seek(a * _NODE.size + b * _EDGE.size + c * _CLAIM.size, os.SEEK_CUR)
+                else:
+                    position += 1
+                name_start = None
+        if not entries:
+            raise ValueError(f"{self.path} has no snapshot")
+        return entries
+
+    def _scan_tail(self):
+        position, offset, time = self._snapshots[-1]
+        for _, position, time, _ in self._records(offset, position):
+            pass
+        return position, time
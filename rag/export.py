@@ -0,0 +1,263 @@
+"""Headless export of graph states as images or an animation.
+
+Frames are drawn by :class:`~rag.render.OffscreenRenderer` on a plain Agg
+figure, so no display, Tk or pyplot is involved and the same artists are
+reused from frame to frame. Positions are computed once, over the union of
+every node and edge that appears in the sequence, and shared by all frames
+together with axis limits fitted to all of them: nodes never move between
+frames, the view neither pans nor zooms, and the output is the same on every
+run.
+
+Frames are rendered by a pool of worker processes. For an event log (see
+:mod:`rag.eventlog`) each worker opens the log itself and takes a
+contiguous run of frames, seeking to the first one through the log's
+snapshots and replaying forward from there, so nothing but frame numbers
+crosses the process boundary. Explicit states (from
+:func:`rag.background.snapshot`) are sent to the workers in chunks.
+
+PNG and SVG frames go to a directory as ``frame_00000.png`` and so on. An
+output path ending in ``.gif`` (via Pillow) or ``.mp4`` (via ``ffmpeg``)
+assembles the frames into an animation instead.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import networkx as nx
+
+from rag.engine import GraphObserver, RAGEngine
+
+FRAME_FORMATS = ('png', 'svg')
+ANIMATION_FORMATS = ('gif', 'mp4')
+
+_worker = None    # per-process render state, set by _init_worker
+
+
+class _UnionObserver(GraphObserver):
+    # Accumulates every node and edge an engine ever holds
+
+    def __init__(self):
+        self.graph = nx.DiGraph()
+
+    def node_added(self, name, kind):
+        self.graph.add_node(name, type=kind)
+
+    def edge_added(self, u, v, kind):
+        self.graph.add_edge(u, v, type=kind)
+
+
+def stable_layout(graph, mode='spring', seed=0):
+    """Positions for every node of ``graph`` (normally the union of all the
+    states to draw), the same on every run for the same graph and seed."""
+    from rag.layout import LayoutCache
+    return dict(LayoutCache(mode, seed=seed).relayout(graph))
+
+
+def log_frames(replayer, step=None, frames=None, start=0, stop=None):
+    """Event positions to draw from a log: every ``step`` events, or
+    ``frames`` positions spread evenly, between ``start`` and ``stop``."""
+    stop = replayer.length if stop is None else min(stop, replayer.length)
+    start = max(0, min(start, stop))
+    if step:
+        positions = list(range(start, stop + 1, step))
+    else:
+        frames = max(frames or 100, 1)
+        span = stop - start
+        positions = sorted({start + round(span * i / max(frames - 1, 1)) for i in range(frames)})
+    if positions[-1] != stop:
+        positions.append(stop)
+    return positions
+
+
+def export_image(engine, path, width=800, height=600, dpi=100, layout='spring', highlight=True):
+    """Render ``engine``'s graph once to ``path`` (PNG, SVG or PDF, by
+    suffix), highlighting any deadlock."""
+    from rag.incremental import IncrementalDeadlockDetector
+
+    global _worker
+    _init_worker(stable_layout(engine.graph, layout), None, None, width, height, dpi, highlight)
+    detector = IncrementalDeadlockDetector(engine) if highlight else None
+    try:
+        _draw(engine, detector, "Resource Allocation Graph", path)
+    finally:
+        if detector is not None:
+            detector.detach()
+        _worker = None
+
+
+def export_log(path, output, step=None, frames=None, start=0, stop=None, jobs=None, fmt=None,
+               width=800, height=600, dpi=100, fps=10, layout='spring', highlight=True):
+    """Render the graph at a series of positions in the event log at
+    ``path``; see :func:`log_frames` for choosing them. Returns a summary
+    dict."""
+    from rag.eventlog import LogReplayer
+
+    union = _UnionObserver()
+    engine = RAGEngine()
+    replayer = LogReplayer(path, engine)
+    positions = log_frames(replayer, step, frames, start, stop)
+    # Union of everything up to the last frame, for positions that hold still
+    engine.add_observer(union)
+    replayer.seek(0)
+    replayer.advance(positions[-1])
+    pos = stable_layout(union.graph, layout)
+    tasks = []
+    first = 0
+    for chunk in _split(positions, jobs):
+        tasks.append((path, first, chunk))
+        first += len(chunk)
+    return _export(_render_log, tasks, len(positions), pos, output, jobs, fmt,
+                   width, height, dpi, fps, highlight)
+
+
+def export_states(states, output, jobs=None, fmt=None, width=800, height=600, dpi=100, fps=10,
+                  layout='spring', highlight=True):
+    """Render a sequence of :class:`~rag.background.GraphSnapshot` states."""
+    states = list(states)
+    union = nx.DiGraph()
+    for state in states:
+        union.add_nodes_from((n, {'type': kind}) for n, kind, _ in state.nodes)
+        union.add_edges_from((u, v, {'type': kind}) for u, v, kind, _ in state.edges)
+    pos = stable_layout(union, layout)
+    tasks = []
+    first = 0
+    for chunk in _split(range(len(states)), jobs):
+        tasks.append((first, [states[i] for i in chunk]))
+        first += len(chunk)
+    return _export(_render_states, tasks, len(states), pos, output, jobs, fmt,
+                   width, height, dpi, fps, highlight)
+
+
+def _export(render, tasks, n_frames, pos, output, jobs, fmt, width, height, dpi, fps, highlight):
+    start = time.perf_counter()
+    suffix = os.path.splitext(output)[1][1:].lower()
+    animation = suffix in ANIMATION_FORMATS
+    if animation:
+        if suffix == 'mp4' and shutil.which('ffmpeg') is None:
+            raise ValueError("Writing .mp4 needs ffmpeg on the PATH")
+        directory = tempfile.mkdtemp(prefix='rag-frames-')
+        fmt = 'png'
+    else:
+        directory = output
+        fmt = fmt or 'png'
+        if fmt not in FRAME_FORMATS:
+            raise ValueError(f"Unknown frame format '{fmt}'")
+        os.makedirs(directory, exist_ok=True)
+    options = (pos, directory, fmt, width, height, dpi, highlight)
+
+    try:
+        jobs = min(jobs or os.cpu_count() or 1, len(tasks))
+        if jobs <= 1:
+            _init_worker(*options)
+            for task in tasks:
+                render(*task)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=options) as pool:
+                for _ in pool.map(_render_star, [(render, task) for task in tasks]):
+                    pass
+        frame_paths = [os.path.join(directory, f'frame_{i:05d}.{fmt}') for i in range(n_frames)]
+        if animation:
+            _assemble(frame_paths, output, suffix, fps)
+    finally:
+        if animation:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'output': output,
+        'frames': n_frames,
+        'jobs': jobs,
+        'seconds': round(elapsed, 3),
+        'frames_per_sec': round(n_frames / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def _split(items, jobs, per_job=4):
+    # Contiguous chunks, a few per worker so uneven frames balance out
+    items = list(items)
+    count = max(1, min(len(items), (jobs or os.cpu_count() or 1) * per_job))
+    size = -(-len(items) // count)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _assemble(frame_paths, output, kind, fps):
+    if kind == 'gif':
+        from PIL import Image
+
+        frames = (Image.open(path) for path in frame_paths)
+        first = next(frames)
+        first.save(output, save_all=True, append_images=frames, duration=round(1000 / fps), loop=0)
+    else:
+        directory = os.path.dirname(frame_paths[0])
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps),
+                        '-i', os.path.join(directory, 'frame_%05d.png'),
+                        '-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', output], check=True)
+
+
+# Worker side
+def _init_worker(pos, directory, fmt, width, height, dpi, highlight):
+    global _worker
+    from rag.render import OffscreenRenderer, fit_limits
+    _worker = {
+        'renderer': OffscreenRenderer(width, height, dpi),
+        'pos': pos,
+        'limits': fit_limits(list(pos.values())) if pos else None,
+        'directory': directory,
+        'fmt': fmt,
+        'highlight': highlight,
+    }
+
+
+def _render_star(args):
+    render, task = args
+    return render(*task)
+
+
+def _render_log(path, first, positions):
+    from rag.eventlog import LogReplayer
+    from rag.incremental import IncrementalDeadlockDetector
+
+    engine = RAGEngine()
+    replayer = LogReplayer(path, engine)
+    detector = IncrementalDeadlockDetector(engine) if _worker['highlight'] else None
+    for i, position in enumerate(positions, first):
+        replayer.seek(position)
+        _draw(engine, detector, f"Event {position} of {replayer.length}", _frame_path(i))
+    return len(positions)
+
+
+def _render_states(first, states):
+    from rag.background import snapshot_engine
+    from rag.incremental import IncrementalDeadlockDetector
+
+    for i, state in enumerate(states, first):
+        engine = snapshot_engine(state)
+        detector = IncrementalDeadlockDetector(engine) if _worker['highlight'] else None
+        _draw(engine, detector, f"State {i}", _frame_path(i))
+    return len(states)
+
+
+def _frame_path(index):
+    return os.path.join(_worker['directory'], f"frame_{index:05d}.{_worker['fmt']}")
+
+
+def _draw(engine, detector, title, path):
+    from rag.analysis import cycle_edges
+
+    nodes = set()
+    if detector is not None and detector.deadlocked:
+        if engine.is_multi_instance():
+            # A cycle through a multi-instance resource is only a candidate
+            nodes = set(engine.find_deadlock()[1])
+        else:
+            nodes = {p for cycle in detector.cycles() for p, _ in cycle}
+    if nodes:
+        title += " (Deadlock Detected)"
+    renderer = _worker['renderer']
+    renderer.render(engine.graph, _worker['pos'], nodes, cycle_edges(engine, nodes) if nodes else (), title,
+                    _worker['limits'])
+    renderer.save(path)
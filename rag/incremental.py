@@ -0,0 +1,240 @@
+"""Online deadlock detection that runs on every edge insertion.
+
+:class:`IncrementalDeadlockDetector` observes a :class:`~rag.engine.RAGEngine`
+and keeps a persistent wait-for graph in step with it. Acyclicity is tracked
+with the Pearce-Kelly dynamic topological order
+(:class:`DynamicTopologicalOrder`): an inserted wait-for edge that already
+agrees with the order costs O(1), and otherwise only the nodes between the
+two endpoints in the order are searched and renumbered. The edge that
+closes a cycle is reported the moment it is inserted.
+"""
+
+from rag.engine import GraphObserver
+
+
+class DynamicTopologicalOrder:
+    """Pearce-Kelly order of a directed graph that is kept acyclic.
+
+    :meth:`add_edge` refuses an edge that would close a cycle and returns
+    the closing path instead, so callers can treat it as a cycle test that
+    costs O(1) whenever the edge already agrees with the order.
+    """
+
+    def __init__(self):
+        self.out = {}
+        self.in_ = {}
+        self.ord = {}
+        self._next_ord = 0
+
+    def __contains__(self, node):
+        return node in self.ord
+
+    def has_edge(self, u, v):
+        return u in self.out and v in self.out[u]
+
+    def add_node(self, node):
+        if node not in self.ord:
+            self.ord[node] = self._next_ord
+            self._next_ord += 1
+            self.out[node] = set()
+            self.in_[node] = set()
+        return self.ord[node]
+
+    def remove_node(self, node):
+        if node not in self.ord:
+            return
+        for v in self.out.pop(node):
+            self.in_[v].discard(node)
+        for u in self.in_.pop(node):
+            self.out[u].discard(node)
+        del self.ord[node]
+
+    def add_edge(self, u, v):
+        """Insert ``u -> v`` and return ``None``, or leave the graph unchanged
+        and return the path ``v ~> u`` (as edges) that the edge would close."""
+        lower = self.add_node(v)
+        upper = self.add_node(u)
+        if lower < upper:
+            path, visited = self.path(v, u, upper)
+            if path is not None:
+                return path
+            self._reorder(u, visited, lower)
+        self.out[u].add(v)
+        self.in_[v].add(u)
+        return None
+
+    def remove_edge(self, u, v):
+        if u in self.out:
+            self.out[u].discard(v)
+            self.in_[v].discard(u)
+
+    def path(self, source, target, upper=None):
+        # Forward DFS from source restricted to positions <= upper; returns
+        # the path to target (or None) and the set of visited nodes
+        parent = {source: None}
+        stack = [source]
+        ord_ = self.ord
+        while stack:
+            node = stack.pop()
+            if node == target:
+                path = []
+                while parent[node] is not None:
+                    path.append((parent[node], node))
+                    node = parent[node]
+                path.reverse()
+                return path, parent
+            for nxt in self.out[node]:
+                if nxt not in parent and (upper is None or ord_[nxt] <= upper):
+                    parent[nxt] = node
+                    stack.append(nxt)
+        return None, parent
+
+    def _reorder(self, u, visited, lower):
+        # Move everything reaching u ahead of everything reachable from v
+        # (visited), reusing the same set of positions
+        ord_ = self.ord
+        forward = list(visited)
+        seen = {u}
+        stack = [u]
+        while stack:
+            node = stack.pop()
+            for prev in self.in_[node]:
+                if prev not in seen and ord_[prev] >= lower:
+                    seen.add(prev)
+                    stack.append(prev)
+        backward = sorted(seen, key=ord_.__getitem__)
+        forward.sort(key=ord_.__getitem__)
+        slots = sorted(ord_[n] for n in backward + forward)
+        for node, slot in zip(backward + forward, slots):
+            ord_[node] = slot
+
+
+class IncrementalDeadlockDetector(GraphObserver):
+    """Keeps the wait-for graph of an engine and flags cycles as they form.
+
+    After each mutation ``new_cycle`` holds the cycle closed by that mutation
+    (as a list of wait-for edges) or ``None``; ``on_deadlock`` is called with
+    the same list. ``deadlocked`` stays true while any cycle remains.
+    """
+
+    def __init__(self, engine=None, on_deadlock=None):
+        self.engine = None
+        self.on_deadlock = on_deadlock
+        self.new_cycle = None
+        self.reset()
+        if engine is not None:
+            self.attach(engine)
+
+    def reset(self):
+        self._count = {}     # wait-for edge -> number of resources inducing it
+        self._order = DynamicTopologicalOrder()   # acyclic part of the wait-for graph
+        self._held = set()   # wait-for edges that would close a cycle
+        self.new_cycle = None
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.add_observer(self)
+        self.rebuild()
+
+    def detach(self):
+        if self.engine is not None:
+            self.engine.remove_observer(self)
+            self.engine = None
+
+    def rebuild(self):
+        self.reset()
+        graph = self.engine.graph
+        for r in self.engine.resources():
+            for waiter in graph.pred[r]:
+                for holder in graph.succ[r]:
+                    if holder != waiter:
+                        self._inc(waiter, holder, report=False)
+
+    # State
+    @property
+    def deadlocked(self):
+        return bool(self._held)
+
+    def wait_for_edges(self):
+        return list(self._count)
+
+    def closing_edges(self):
+        """One wait-for edge ``(p, q)`` per cycle still present; ``p`` is on
+        that cycle. Much cheaper than :meth:`cycles` when only the processes
+        are needed."""
+        return list(self._held)
+
+    def cycles(self):
+        """One current cycle for every cycle-closing edge still present."""
+        found = []
+        for p, q in self._held:
+            # Order edges only go up, so the path never passes p's position
+            path, _ = self._order.path(q, p, upper=self._order.ord[p])
+            if path is not None:
+                found.append([(p, q)] + path)
+        return found
+
+    # GraphObserver
+    def edge_added(self, u, v, kind):
+        self.new_cycle = None
+        graph = self.engine.graph
+        if kind == 'request':
+            for holder in graph.succ[v]:
+                if holder != u:
+                    self._inc(u, holder)
+        elif kind == 'allocation':
+            for waiter in graph.pred[u]:
+                if waiter != v:
+                    self._inc(waiter, v)
+
+    def edge_removed(self, u, v, kind):
+        self.new_cycle = None
+        graph = self.engine.graph
+        if kind == 'request':
+            for holder in graph.succ[v]:
+                if holder != u:
+                    self._dec(u, holder)
+        elif kind == 'allocation':
+            for waiter in graph.pred[u]:
+                if waiter != v:
+                    self._dec(waiter, v)
+
+    def node_removed(self, name, kind):
+        self._order.remove_node(name)
+
+    def cleared(self):
+        self.reset()
+
+    # Wait-for edge bookkeeping
+    def _inc(self, p, q, report=True):
+        count = self._count.get((p, q), 0)
+        self._count[(p, q)] = count + 1
+        if count == 0:
+            self._insert(p, q, report)
+
+    def _dec(self, p, q):
+        count = self._count.get((p, q), 0)
+        if count > 1:
+            self._count[(p, q)] = count - 1
+            return
+        if count == 0:
+            return
+        del self._count[(p, q)]
+        if (p, q) in self._held:
+            self._held.discard((p, q))
+            return
+        self._order.remove_edge(p, q)
+        # Removing an edge can break the cycles that held edges were closing
+        if self._held:
+            held, self._held = self._held, set()
+            for edge in held:
+                self._insert(*edge, report=False)
+
+    def _insert(self, p, q, report=True):
+        path = self._order.add_edge(p, q)
+        if path is not None:
+            self._held.add((p, q))
+            if report:
+                self.new_cycle = [(p, q)] + path
+                if self.on_deadlock is not None:
+                    self.on_deadlock(self.new_cycle)
@@ -0,0 +1,138 @@
+"""Instrumentation of the simulator's own work.
+
+:class:`Metrics` keeps a latency histogram per operation (engine mutations,
+detection, layout, rendering), counts graph events and derives an events per
+second rate over a sliding window. Attach one to an engine with
+``engine.metrics = Metrics()`` and every public engine operation is timed.
+Time other work with ``with metrics.timed('layout'): ...``.
+
+Snapshots are plain dicts and can be exported as JSON or in the Prometheus
+text exposition format.
+"""
+
+import json
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bucket bounds in seconds: 1 us doubling up to ~16 s
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+
+    def __init__(self, window=10, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.start = clock()
+        self.histograms = {}
+        self.events = 0
+        self._seconds = deque()   # [second, events] for the sliding window
+
+    @contextmanager
+    def timed(self, op):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(op, time.perf_counter() - start)
+
+    def observe(self, op, seconds):
+        histogram = self.histograms.get(op)
+        if histogram is None:
+            histogram = self.histograms[op] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def count_event(self, n=1):
+        self.events += n
+        second = int(self.clock())
+        if self._seconds and self._seconds[-1][0] == second:
+            self._seconds[-1][1] += n
+        else:
+            self._seconds.append([second, n])
+            while self._seconds[0][0] <= second - self.window:
+                self._seconds.popleft()
+
+    def events_per_second(self):
+        now = self.clock()
+        span = min(self.window, max(now - self.start, 1e-9))
+        recent = sum(n for second, n in self._seconds if second > now - self.window)
+        return recent / span
+
+    def snapshot(self, engine=None):
+        snap = {
+            'uptime': self.clock() - self.start,
+            'events': self.events,
+            'events_per_sec': self.events_per_second(),
+            'operations': {op: h.snapshot() for op, h in sorted(self.histograms.items())},
+        }
+        if engine is not None:
+            snap['graph'] = {'nodes': engine.graph.number_of_nodes(),
+                             'edges': engine.graph.number_of_edges()}
+        return snap
+
+    def to_json(self, engine=None):
+        return json.dumps(self.snapshot(engine), indent=2)
+
+    def to_prometheus(self, engine=None):
+        lines = ['# HELP rag_operation_seconds Latency of simulator operations.',
+                 '# TYPE rag_operation_seconds histogram']
+        for op, h in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.counts):
+                cumulative += n
+                lines.append(f'rag_operation_seconds_bucket{{op="{op}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'rag_operation_seconds_bucket{{op="{op}",le="+Inf"}} {h.count}')
+            lines.append(f'rag_operation_seconds_sum{{op="{op}"}} {h.total:.9f}')
+            lines.append(f'rag_operation_seconds_count{{op="{op}"}} {h.count}')
+        lines += ['# HELP rag_events_total Graph mutation events applied.',
+                  '# TYPE rag_events_total counter',
+                  f'rag_events_total {self.events}',
+                  '# HELP rag_events_per_second Events per second over the sliding window.',
+                  '# TYPE rag_events_per_second gauge',
+                  f'rag_events_per_second {self.events_per_second():.3f}']
+        if engine is not None:
+            lines += ['# TYPE rag_graph_nodes gauge',
+                      f'rag_graph_nodes {engine.graph.number_of_nodes()}',
+                      '# TYPE rag_graph_edges gauge',
+                      f'rag_graph_edges {engine.graph.number_of_edges()}']
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,455 @@
+"""Partitioned deadlock analysis across CPU cores.
+
+A deadlock never spans two weakly connected components of the allocation
+graph, so the components can be analysed independently. :func:`analyze`
+labels them with a vectorised hook-and-shortcut pass, or starts from
+caller-supplied shards (lock namespaces, say) and merges any shards that an
+edge crosses, so a deadlock is never cut in two.
+
+The graph is flattened into integer columns (from a
+:class:`~rag.compact.CompactGraph` these are its own arrays, with no
+per-edge Python work), sorted by partition and copied once into a
+``multiprocessing.shared_memory`` block. Partitions are grouped into chunks
+of similar edge count and analysed in a process pool; a worker only receives
+the block's name and a range of partitions, and sends back integer ids.
+
+Within a chunk the wait-for edges come from one vectorised join of request
+and allocation edges, and deadlock clusters from an iterative Tarjan pass.
+As in :meth:`~rag.engine.RAGEngine.wait_for_graph`, a process holding
+something that asks for more of a resource than it could ever get waits for
+itself, which graph reduction reports as well.
+Partitions with a multi-instance resource, where a cycle is not sufficient,
+are checked by graph reduction instead (the sparse form of the Banker's
+detection algorithm) and reported as one cluster of the processes that can
+never finish. Results merge into a single
+:class:`~rag.analysis.DeadlockReport`. Needs NumPy.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from rag.analysis import DeadlockReport
+
+PROCESS = 0
+RESOURCE = 1
+REQUEST = 0
+ALLOCATION = 1
+
+_COLUMNS = ('kind', 'instances', 'src', 'dst', 'edge_kind', 'count', 'offsets', 'multi')
+
+
+def analyze(store, jobs=None, shards=None, max_cycles=0, chunks_per_job=4):
+    """Every deadlock in ``store`` (a :class:`~rag.engine.RAGEngine`, a
+    :class:`~rag.compact.CompactGraph` or a mapped
+    :class:`~rag.columnar.MappedGraph`), analysed in up to ``jobs`` worker
+    processes (default: all CPUs).
+
+    ``shards`` maps node names to partition keys, as a dict or a callable;
+    nodes it leaves out (``None``) get a partition of their own. Without it
+    the partitions are the weakly connected components. ``max_cycles``
+    elementary cycles are enumerated afterwards, on the deadlock clusters
+    only.
+    """
+    names, columns = _columns(store)
+    n = len(names)
+    seed = _shard_labels(names, shards) if shards is not None else np.arange(n, dtype=np.int64)
+    part = components(seed, columns['src'], columns['dst'])
+    arrays = _partition(columns, part)
+
+    jobs = jobs or os.cpu_count() or 1
+    tasks = _chunks(arrays['offsets'], jobs * chunks_per_job)
+    if jobs == 1 or len(tasks) <= 1:
+        results = [_analyze_chunk(arrays, start, stop) for start, stop in tasks]
+    else:
+        results = _run_pool(arrays, tasks, jobs)
+    return _merge(names, results, store, max_cycles)
+
+
+def components(labels, src, dst):
+    """Merge the groups in ``labels`` (one int per node) along the edges
+    ``src -> dst`` and return a root label per node."""
+    # Hook each group's root onto the smaller root across an edge, then
+    # shortcut until every node points at its root; O(log V) rounds
+    _, parent = np.unique(labels, return_inverse=True)
+    parent = parent.astype(np.int64)
+    roots = np.arange(parent.max() + 1 if len(parent) else 0, dtype=np.int64)
+    gs, gd = parent[src], parent[dst]
+    cross = gs != gd
+    gs, gd = gs[cross], gd[cross]
+    while len(gs):
+        rs, rd = roots[gs], roots[gd]
+        low, high = np.minimum(rs, rd), np.maximum(rs, rd)
+        keep = low != high
+        if not keep.any():
+            break
+        np.minimum.at(roots, high[keep], low[keep])
+        while True:
+            jumped = roots[roots]
+            if np.array_equal(jumped, roots):
+                break
+            roots = jumped
+        gs, gd = gs[keep], gd[keep]
+    return roots[parent]
+
+
+# Flattening
+def _columns(store):
+    from rag.columnar import MappedGraph
+    from rag.compact import CompactGraph
+
+    if isinstance(store, MappedGraph):
+        # Views on the mapped file; only _partition's sort copies them
+        return store.names, store.columns
+    if isinstance(store, CompactGraph):
+        store.compact()   # drop tombstones so the columns are all live
+        names = store._names
+        return names, {
+            'kind': np.frombuffer(bytes(store._kind), dtype=np.uint8),
+            'instances': np.array(store._instances, dtype=np.int32),
+            'src': np.array(store._src, dtype=np.int32),
+            'dst': np.array(store._dst, dtype=np.int32),
+            'edge_kind': np.frombuffer(bytes(store._ekind), dtype=np.uint8),
+            'count': np.array(store._count, dtype=np.int32),
+        }
+
+    graph = store.graph
+    names = list(graph)
+    ids = {name: i for i, name in enumerate(names)}
+    kind = np.fromiter((attr.get('type') == 'resource' for attr in graph.nodes.values()),
+                       dtype=np.uint8, count=len(names))
+    instances = np.fromiter((attr.get('instances', 1) for attr in graph.nodes.values()),
+                            dtype=np.int32, count=len(names))
+    m = graph.number_of_edges()
+    src = np.empty(m, dtype=np.int32)
+    dst = np.empty(m, dtype=np.int32)
+    edge_kind = np.empty(m, dtype=np.uint8)
+    count = np.empty(m, dtype=np.int32)
+    for k, (u, v, d) in enumerate(graph.edges(data=True)):
+        src[k] = ids[u]
+        dst[k] = ids[v]
+        edge_kind[k] = d.get('type') == 'allocation'
+        count[k] = d.get('count', 1)
+    return names, {'kind': kind, 'instances': instances, 'src': src, 'dst': dst,
+                   'edge_kind': edge_kind, 'count': count}
+
+
+def _shard_labels(names, shards):
+    lookup = shards if callable(shards) else shards.get
+    keys = {}
+    labels = np.empty(len(names), dtype=np.int64)
+    for i, name in enumerate(names):
+        key = lookup(name) if name is not None else None
+        if key is None:
+            labels[i] = -1 - i    # a shard of its own
+        else:
+            labels[i] = keys.setdefault(key, len(keys))
+    return labels
+
+
+def _partition(columns, part):
+    # Edges grouped by partition, largest partition first; isolated nodes
+    # and edgeless partitions drop out
+    src, dst = columns['src'], columns['dst']
+    edge_part = part[src]
+    labels, edge_label, sizes = np.unique(edge_part, return_inverse=True, return_counts=True)
+    rank = np.empty(len(labels), dtype=np.int64)
+    rank[np.argsort(-sizes, kind='stable')] = np.arange(len(labels))
+    edge_rank = rank[edge_label.ravel()]
+    order = np.argsort(edge_rank, kind='stable')
+    offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(edge_rank, minlength=len(labels)))
+
+    # A partition needs graph reduction if any of its resources has more
+    # than one instance
+    instances = columns['instances']
+    multi = np.zeros(len(labels), dtype=np.uint8)
+    touched = np.concatenate([src, dst])
+    resource = columns['kind'][touched] == RESOURCE
+    np.maximum.at(multi, np.concatenate([edge_rank, edge_rank])[resource],
+                  (instances[touched[resource]] > 1).astype(np.uint8))
+    return {
+        'kind': columns['kind'],
+        'instances': instances,
+        'src': src[order],
+        'dst': dst[order],
+        'edge_kind': columns['edge_kind'][order],
+        'count': columns['count'][order],
+        'offsets': offsets,
+        'multi': multi,
+    }
+
+
+def _chunks(offsets, target):
+    # Contiguous partition ranges of roughly equal edge count
+    total = int(offsets[-1])
+    if not total:
+        return []
+    size = max(total // max(target, 1), 1)
+    tasks = []
+    start = 0
+    n_parts = len(offsets) - 1
+    while start < n_parts:
+        stop = int(np.searchsorted(offsets, offsets[start] + size, side='right')) - 1
+        stop = min(max(stop, start + 1), n_parts)
+        tasks.append((start, stop))
+        start = stop
+    return tasks
+
+
+# Process pool over shared memory
+_shared = None
+
+
+def _run_pool(arrays, tasks, jobs):
+    from multiprocessing import shared_memory
+
+    layout = []
+    offset = 0
+    for name in _COLUMNS:
+        a = arrays[name]
+        offset = -(-offset // 8) * 8
+        layout.append((name, a.dtype.str, len(a), offset))
+        offset += a.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for name, dtype, length, start in layout:
+            np.ndarray(length, dtype=dtype, buffer=block.buf, offset=start)[:] = arrays[name]
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_attach,
+                                 initargs=(block.name, layout)) as pool:
+            return list(pool.map(_analyze_shared, tasks))
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _attach(name, layout):
+    global _shared
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(name=name)
+    arrays = {column: np.ndarray(length, dtype=dtype, buffer=block.buf, offset=start)
+              for column, dtype, length, start in layout}
+    _shared = (block, arrays)
+
+
+def _analyze_shared(task):
+    return _analyze_chunk(_shared[1], *task)
+
+
+# Per-chunk analysis; returns global ids only
+def _analyze_chunk(arrays, start, stop):
+    offsets = arrays['offsets']
+    multi = arrays['multi'][start:stop].astype(bool)
+    clusters = []
+    blocked = []
+    simple = [(int(offsets[k]), int(offsets[k + 1])) for k in range(start, stop) if not multi[k - start]]
+    if simple:
+        found, behind = _cycle_clusters(arrays, _edge_index(simple))
+        clusters += found
+        blocked += behind
+    for k in range(start, stop):
+        if multi[k - start]:
+            stuck = _reduce(arrays, np.arange(offsets[k], offsets[k + 1]))
+            if stuck:
+                clusters.append(stuck)
+    return clusters, blocked
+
+
+def _edge_index(ranges):
+    return np.concatenate([np.arange(a, b) for a, b in ranges])
+
+
+def _wait_for(arrays, edges):
+    # (waiter, holder) pairs: each request edge p -> r joined with every
+    # allocation edge r -> q, q != p, plus (p, p) where p holds something
+    # and asks for more of r than r's instances minus its own share
+    src, dst, kind = arrays['src'][edges], arrays['dst'][edges], arrays['edge_kind'][edges]
+    count = arrays['count'][edges]
+    req = kind == REQUEST
+    rp, rr, rc = src[req], dst[req], count[req]
+    ar, aq, ac = src[~req], dst[~req], count[~req]
+    order = np.lexsort((aq, ar))
+    ar, aq, ac = ar[order], aq[order], ac[order]
+    first = np.searchsorted(ar, rr, side='left')
+    n_holders = np.searchsorted(ar, rr, side='right') - first
+    total = int(n_holders.sum())
+    starts = np.cumsum(n_holders) - n_holders
+    index = np.arange(total) - np.repeat(starts, n_holders) + np.repeat(first, n_holders)
+    waiter = np.repeat(rp, n_holders).astype(np.int64)
+    holder = aq[index].astype(np.int64)
+    keep = waiter != holder
+
+    # Own share of r: the allocation r -> p, found by its (r, p) key
+    key = ar.astype(np.int64) << 32 | aq.astype(np.int64)
+    wanted = rr.astype(np.int64) << 32 | rp.astype(np.int64)
+    at = np.minimum(np.searchsorted(key, wanted), max(len(key) - 1, 0))
+    own = np.where(key[at] == wanted, ac[at], 0) if len(key) else np.zeros(len(rp), dtype=np.int64)
+    stuck = (rc > arrays['instances'][rr] - own) & np.isin(rp, aq)
+    selves = rp[stuck].astype(np.int64)
+
+    waiter = np.concatenate([waiter[keep], selves])
+    holder = np.concatenate([holder[keep], selves])
+    if not len(waiter):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.unique(np.stack([waiter, holder], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _cycle_clusters(arrays, edges):
+    waiter, holder = _wait_for(arrays, edges)
+    if not len(waiter):
+        return [], []
+    nodes, local = np.unique(np.concatenate([waiter, holder]), return_inverse=True)
+    n = len(nodes)
+    w, h = local[:len(waiter)], local[len(waiter):]
+    order = np.argsort(w, kind='stable')
+    out_offsets = np.searchsorted(w[order], np.arange(n + 1))
+    succ = h[order].tolist()
+    out_offsets = out_offsets.tolist()
+    waits_for_self = set(w[w == h].tolist())
+
+    # Iterative Tarjan
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        work = [(root, out_offsets[root])]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            v, i = work[-1]
+            if i < out_offsets[v + 1]:
+                work[-1] = (v, i + 1)
+                u = succ[i]
+                if index[u] == -1:
+                    index[u] = low[u] = counter
+                    counter += 1
+                    stack.append(u)
+                    on_stack[u] = True
+                    work.append((u, out_offsets[u]))
+                elif on_stack[u] and index[u] < low[v]:
+                    low[v] = index[u]
+                continue
+            work.pop()
+            if work and low[v] < low[work[-1][0]]:
+                low[work[-1][0]] = low[v]
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    u = stack.pop()
+                    on_stack[u] = False
+                    component.append(u)
+                    if u == v:
+                        break
+                if len(component) > 1 or component[0] in waits_for_self:
+                    components.append(component)
+
+    # Everyone transitively waiting for a deadlocked process is blocked
+    deadlocked = [False] * n
+    for component in components:
+        for v in component:
+            deadlocked[v] = True
+    order = np.argsort(h, kind='stable')
+    in_offsets = np.searchsorted(h[order], np.arange(n + 1)).tolist()
+    pred = w[order].tolist()
+    seen = list(deadlocked)
+    queue = deque(v for component in components for v in component)
+    blocked = []
+    while queue:
+        v = queue.popleft()
+        for i in range(in_offsets[v], in_offsets[v + 1]):
+            u = pred[i]
+            if not seen[u]:
+                seen[u] = True
+                blocked.append(u)
+                queue.append(u)
+    ids = nodes.tolist()
+    return [[ids[v] for v in component] for component in components], [ids[v] for v in blocked]
+
+
+def _reduce(arrays, edges):
+    # Graph reduction: a process whose every request fits in what is free
+    # finishes and returns what it holds; whoever never finishes is stuck
+    src, dst = arrays['src'][edges].tolist(), arrays['dst'][edges].tolist()
+    kind, count = arrays['edge_kind'][edges].tolist(), arrays['count'][edges].tolist()
+    instances = arrays['instances']
+    available = {}
+    held = {}
+    requests = {}
+    for u, v, k, c in zip(src, dst, kind, count):
+        if k == ALLOCATION:
+            available[u] = available.get(u, int(instances[u])) - c
+            held.setdefault(v, []).append((u, c))
+            requests.setdefault(v, [])
+        else:
+            available.setdefault(v, int(instances[v]))
+            requests.setdefault(u, []).append((v, c))
+    unmet = {}
+    waiting = {}
+    ready = deque()
+    for p, wanted in requests.items():
+        unmet[p] = 0
+        for r, c in wanted:
+            if c > available[r]:
+                unmet[p] += 1
+                waiting.setdefault(r, []).append((c, p))
+        if not unmet[p]:
+            ready.append(p)
+    for queue in waiting.values():
+        queue.sort(reverse=True)    # smallest request at the end
+    while ready:
+        p = ready.popleft()
+        for r, c in held.get(p, ()):
+            available[r] += c
+            queue = waiting.get(r)
+            while queue and queue[-1][0] <= available[r]:
+                _, q = queue.pop()
+                unmet[q] -= 1
+                if not unmet[q]:
+                    ready.append(q)
+    # As in the matrix algorithm, a process holding nothing is not deadlocked
+    return [p for p, left in unmet.items() if left and p in held]
+
+
+# Merging
+def _merge(names, results, store, max_cycles):
+    clusters = []
+    blocked = set()
+    for found, behind in results:
+        clusters.extend(sorted((names[i] for i in cluster), key=str) for cluster in found)
+        blocked.update(names[i] for i in behind)
+    clusters.sort(key=lambda c: (-len(c), str(c[0])))
+    deadlocked = set().union(*clusters) if clusters else set()
+    cycles = []
+    if max_cycles and clusters:
+        from itertools import islice
+
+        import networkx as nx
+
+        successors = store.graph.succ.__getitem__ if hasattr(store, 'graph') else store.successors
+        for cluster in clusters:
+            remaining = max_cycles - len(cycles)
+            if remaining <= 0:
+                break
+            members = set(cluster)
+            wait_for = nx.DiGraph()
+            for p in cluster:
+                for r in successors(p):
+                    for q in successors(r):
+                        if q != p and q in members:
+                            wait_for.add_edge(p, q)
+            if len(cluster) == 1:
+                # Only a process waiting for itself is deadlocked alone
+                wait_for.add_edge(cluster[0], cluster[0])
+            cycles.extend(islice(nx.simple_cycles(wait_for), remaining))
+    return DeadlockReport(clusters, deadlocked, blocked - deadlocked, cycles)
@@ -0,0 +1,150 @@
+"""Automatic deadlock recovery.
+
+Three strategies break every current deadlock in one call:
+
+* ``'terminate'`` -- kill a minimal-cost set of victims;
+* ``'preempt'`` -- take the victims' resources away and roll them back, so
+  they request those resources again; the freed instances are left
+  available, since handing them straight to a waiter could close a new
+  cycle;
+* ``'abort'`` -- kill every deadlocked process.
+
+Victims are selected per deadlock cluster (strongly connected component of
+the wait-for graph) in a single pass over a private copy of the cluster:
+the cheapest process, weighted by how many wait-for edges it breaks, is
+removed and only the remainder of its own cluster is re-split, so the
+engine is never re-detected between kills. With multi-instance resources the
+same greedy selection runs on the Available/Allocation/Request matrices,
+inside a single reduction pass that resumes after each victim is removed.
+
+Costs come from :func:`process_cost` (held instances, age and previous
+rollbacks) unless a ``cost(engine, process)`` callable is given.
+"""
+
+from collections import namedtuple
+
+import networkx as nx
+
+from rag.analysis import analyze_wait_for, is_deadlock
+
+STRATEGIES = ('terminate', 'preempt', 'abort')
+
+RecoveryPlan = namedtuple('RecoveryPlan', 'strategy clusters victims preempted cost')
+
+
+def process_cost(engine, process, held_weight=1.0, age_weight=1.0, rollback_weight=1.0):
+    """Price of sacrificing ``process``: work lost grows with what it holds
+    and how long it has run; past rollbacks count extra to avoid starving
+    the same victim."""
+    graph = engine.graph
+    held = sum(d.get('count', 1) for d in graph.pred[process].values() if d.get('type') == 'allocation')
+    rollbacks = graph.nodes[process].get('rollbacks', 0)
+    return held_weight * held + age_weight * engine.age(process) + rollback_weight * rollbacks
+
+
+def plan(engine, strategy='terminate', cost=None):
+    """Work out how to break every deadlock without changing the engine."""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown recovery strategy '{strategy}'")
+    cost = cost or process_cost
+    if engine.is_multi_instance():
+        clusters, victims = _matrix_victims(engine, strategy, cost)
+    else:
+        clusters, victims = _cycle_victims(engine, strategy, cost)
+    preempted = _preemptions(engine, victims) if strategy == 'preempt' else []
+    total = sum(cost(engine, p) for p in victims)
+    return RecoveryPlan(strategy, clusters, victims, preempted, total)
+
+
+def apply(engine, recovery_plan):
+    """Carry out ``recovery_plan`` in one engine transaction."""
+    graph = engine.graph
+    with engine.transaction():
+        if recovery_plan.strategy != 'preempt':
+            for p in recovery_plan.victims:
+                engine.remove_process(p)
+            return
+        for r, p, count in recovery_plan.preempted:
+            engine.remove_edge(r, p)
+            pending = graph.edges[p, r].get('count', 1) if graph.has_edge(p, r) else 0
+            engine.add_request_edge(p, r, pending + count)
+        for p in recovery_plan.victims:
+            engine.mark_rollback(p)
+
+
+def recover(engine, strategy='terminate', cost=None):
+    """Plan and apply recovery; returns the :class:`RecoveryPlan` used."""
+    recovery_plan = plan(engine, strategy, cost)
+    if recovery_plan.victims:
+        apply(engine, recovery_plan)
+    return recovery_plan
+
+
+def _cheapest(costs, graph):
+    # Cheapest per broken wait-for path: cost / (in-degree * out-degree)
+    return min(graph, key=lambda p: (costs[p] / max(graph.in_degree(p) * graph.out_degree(p), 1), str(p)))
+
+
+def _cycle_victims(engine, strategy, cost):
+    wait_for = engine.wait_for_graph()
+    clusters = analyze_wait_for(wait_for).clusters
+    if strategy == 'abort':
+        return clusters, [p for cluster in clusters for p in cluster]
+    costs = {p: cost(engine, p) for cluster in clusters for p in cluster}
+    victims = []
+    pending = [wait_for.subgraph(cluster).copy() for cluster in clusters]
+    while pending:
+        sub = pending.pop()
+        victim = _cheapest(costs, sub)
+        victims.append(victim)
+        sub.remove_node(victim)
+        pending.extend(sub.subgraph(c).copy() for c in nx.strongly_connected_components(sub)
+                       if is_deadlock(sub, c))
+    return clusters, victims
+
+
+def _matrix_victims(engine, strategy, cost):
+    import numpy as np
+
+    from rag import banker
+
+    state = banker.matrix_state(engine)
+    allocation = state.allocation
+    request = state.request
+    # One reduction, resumed after each kill: finished processes stay
+    # finished because the work vector only grows
+    work = state.available.copy()
+    pending = _retire(work, np.flatnonzero(allocation.any(axis=1)), allocation, request)
+    deadlocked = [state.processes[i] for i in pending]
+    clusters = [sorted(deadlocked, key=str)] if deadlocked else []
+    if strategy == 'abort':
+        return clusters, deadlocked
+
+    costs = {p: cost(engine, p) for p in deadlocked}
+    victims = []
+    while pending.size:
+        i = min(pending.tolist(), key=lambda i: (costs[state.processes[i]] / max(allocation[i].sum(), 1),
+                                                 str(state.processes[i])))
+        victims.append(state.processes[i])
+        work += allocation[i]
+        pending = _retire(work, pending[pending != i], allocation, request)
+    return clusters, victims
+
+
+def _retire(work, pending, allocation, request):
+    # Advance the reduction: retire every pending process whose request fits
+    # in work (returning what it holds) until none does; returns the rest
+    while pending.size:
+        runnable = (request[pending] <= work).all(axis=1)
+        if not runnable.any():
+            break
+        work += allocation[pending[runnable]].sum(axis=0)
+        pending = pending[~runnable]
+    return pending
+
+
+def _preemptions(engine, victims):
+    # Roll every victim back to before it took its resources
+    graph = engine.graph
+    return [(r, p, d.get('count', 1)) for p in victims
+            for r, d in graph.pred[p].items() if d.get('type') == 'allocation']
@@ -0,0 +1,226 @@
+"""Persistent-artist renderer for the allocation graph.
+
+``nx.draw_networkx_*`` creates new artists on every call, so each redraw
+clears the axes and rebuilds everything. :class:`GraphRenderer` creates its
+artists once and only updates their data:
+
+* every node is one point of a single ``PathCollection`` (offsets, colours
+  and sizes are replaced in place);
+* edges are drawn as one compound ``Path`` per style (request, allocation,
+  highlighted): shafts and arrow heads are MOVETO/LINETO pairs computed with
+  NumPy, so thousands of edges cost one artist and one Agg call each instead
+  of one ``Path`` object per segment as with a ``LineCollection``;
+* labels are reused ``Text`` artists (a node's ``label`` attribute, else its
+  name) and are dropped once the graph has more than ``label_limit`` nodes.
+
+Nodes and edges of type ``'cluster'`` (see :mod:`rag.views`) are drawn grey
+and dotted, standing for a collapsed part of the graph.
+
+Redraws go through ``canvas.draw_idle()``, so bursts of updates coalesce into
+one paint. The renderer only needs an ``Axes``, so it works equally on a Tk
+canvas or a headless Agg figure; :class:`OffscreenRenderer` wraps the latter
+and rasterizes to an RGBA array, which is safe on a worker thread because
+it touches neither Tk nor pyplot.
+"""
+
+import os
+
+import numpy as np
+from matplotlib.colors import to_rgba_array
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+
+PROCESS_COLOR = 'skyblue'
+RESOURCE_COLOR = 'lightgreen'
+HIGHLIGHT_COLOR = 'red'
+CLUSTER_COLOR = 'lightgrey'
+REQUEST_COLOR = 'orange'
+ALLOCATION_COLOR = 'green'
+NODE_SIZE = 800
+HIGHLIGHT_SIZE = 1000
+
+_NODE_CODES = {'process': 0, 'resource': 1, 'cluster': 3}
+_EDGE_CODES = {'request': 0, 'allocation': 1, 'cluster': 3}
+_EMPTY = Path(np.empty((0, 2)))
+_SEGMENT_CODES = np.array([Path.MOVETO, Path.LINETO], dtype=Path.code_type)
+
+
+class GraphRenderer:
+
+    def __init__(self, ax, label_limit=150, arrow_px=12):
+        self.ax = ax
+        self.label_limit = label_limit
+        self.arrow_px = arrow_px
+        self._labels = {}
+        self._node_palette = to_rgba_array([PROCESS_COLOR, RESOURCE_COLOR, HIGHLIGHT_COLOR, CLUSTER_COLOR])
+
+        ax.axis('off')
+        self.title = ax.set_title("Resource Allocation Graph")
+        self.placeholder = ax.text(0.5, 0.5, "Add processes and resources to begin",
+                                   ha='center', va='center', fontsize=12, transform=ax.transAxes)
+        # Indexed by edge code: 0 request, 1 allocation, 2 highlighted, 3 cluster
+        self.edge_patches = [
+            PathPatch(_EMPTY, fill=False, edgecolor=REQUEST_COLOR, linestyle='dashed', zorder=1),
+            PathPatch(_EMPTY, fill=False, edgecolor=ALLOCATION_COLOR, zorder=1),
+            PathPatch(_EMPTY, fill=False, edgecolor=HIGHLIGHT_COLOR, linewidth=3, zorder=1),
+            PathPatch(_EMPTY, fill=False, edgecolor='grey', linestyle='dotted', zorder=1),
+        ]
+        for patch in self.edge_patches:
+            ax.add_patch(patch)
+        self.nodes = ax.scatter([], [], zorder=2, edgecolors='none')
+
+        ax.plot([], [], color=REQUEST_COLOR, linestyle='dashed', label='Request Edge')
+        ax.plot([], [], color=ALLOCATION_COLOR, label='Allocation Edge')
+        ax.legend(loc='upper right')
+
+    def render(self, graph, pos, highlight_nodes=(), highlight_edges=(), title="Resource Allocation Graph",
+               limits=None):
+        # limits, ((x0, x1), (y0, y1)), fixes the view instead of fitting it
+        # to the nodes drawn, e.g. so that the frames of an animation line up
+        self.title.set_text(title)
+        names = list(graph.nodes())
+        self.placeholder.set_visible(not names)
+        if not names:
+            self._clear()
+            self._draw()
+            return
+
+        xy = np.array([pos[n] for n in names], dtype=float)
+        (x0, x1), (y0, y1) = limits if limits is not None else fit_limits(xy)
+        self.ax.set_xlim(x0, x1)
+        self.ax.set_ylim(y0, y1)
+
+        # Nodes: 0 process, 1 resource, 2 highlighted, 3 cluster
+        scale = self.label_limit / len(names) if len(names) > self.label_limit else 1.0
+        codes = np.array([2 if n in highlight_nodes else _NODE_CODES.get(attr.get('type'), 1)
+                          for n, attr in graph.nodes(data=True)], dtype=np.intp)
+        self.nodes.set_offsets(xy)
+        self.nodes.set_facecolors(self._node_palette[codes])
+        self.nodes.set_sizes(np.where(codes == 2, HIGHLIGHT_SIZE, NODE_SIZE) * scale)
+
+        # Edges: 0 request, 1 allocation, 2 highlighted; shafts stop at the marker rim
+        index = {n: i for i, n in enumerate(names)}
+        src_idx = []
+        dst_idx = []
+        edge_codes = []
+        for u, v, d in graph.edges(data=True):
+            src_idx.append(index[u])
+            dst_idx.append(index[v])
+            edge_codes.append(2 if (u, v) in highlight_edges else _EDGE_CODES.get(d.get('type'), 1))
+        if not edge_codes:
+            self._clear_edges()
+        else:
+            edge_codes = np.array(edge_codes, dtype=np.intp)
+            radius = self._data_per_px() * np.sqrt(NODE_SIZE * scale) / 2 * self.ax.figure.dpi / 72
+            segments = self._arrows(xy[src_idx], xy[dst_idx], radius)
+            for code, patch in enumerate(self.edge_patches):
+                chosen = segments[edge_codes == code].reshape(-1, 2)
+                if len(chosen):
+                    patch.set_path(Path(chosen, np.tile(_SEGMENT_CODES, len(chosen) // 2)))
+                else:
+                    patch.set_path(_EMPTY)
+
+        self._update_labels(names, xy, [attr.get('label', n) for n, attr in graph.nodes(data=True)])
+        self._draw()
+
+    def _clear(self):
+        self.nodes.set_offsets(np.empty((0, 2)))
+        self._clear_edges()
+        self._update_labels([], None, None)
+
+    def _clear_edges(self):
+        for patch in self.edge_patches:
+            patch.set_path(_EMPTY)
+
+    def _update_labels(self, names, xy, texts):
+        show = 0 < len(names) <= self.label_limit
+        current = set(names) if show else set()
+        for name in [n for n in self._labels if n not in current]:
+            self._labels.pop(name).remove()
+        if not show:
+            return
+        for name, (x, y), text in zip(names, xy, texts):
+            label = self._labels.get(name)
+            if label is None:
+                self._labels[name] = self.ax.text(x, y, str(text), ha='center', va='center', zorder=3)
+            else:
+                label.set_position((x, y))
+                label.set_text(str(text))
+
+    def _data_per_px(self):
+        bbox = self.ax.get_window_extent()
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        return max((x1 - x0) / max(bbox.width, 1), (y1 - y0) / max(bbox.height, 1))
+
+    def _arrows(self, src, dst, radius):
+        # Per edge: shaft, left barb and right barb as three 2-point segments
+        delta = dst - src
+        length = np.hypot(delta[:, 0], delta[:, 1])
+        unit = delta / np.maximum(length, 1e-12)[:, None]
+        trim = np.minimum(radius, length / 2)[:, None]
+        start = src + unit * trim
+        end = dst - unit * trim
+
+        back = -unit * (self.arrow_px * self._data_per_px())
+        cos, sin = np.cos(np.radians(25)), np.sin(np.radians(25))
+        left = np.stack([back[:, 0] * cos - back[:, 1] * sin, back[:, 0] * sin + back[:, 1] * cos], axis=1)
+        right = np.stack([back[:, 0] * cos + back[:, 1] * sin, -back[:, 0] * sin + back[:, 1] * cos], axis=1)
+
+        segments = np.empty((len(end), 3, 2, 2))
+        segments[:, 0, 0] = start
+        segments[:, 0, 1] = end
+        segments[:, 1, 0] = end
+        segments[:, 1, 1] = end + left
+        segments[:, 2, 0] = end
+        segments[:, 2, 1] = end + right
+        return segments
+
+    def _draw(self):
+        self.ax.figure.canvas.draw_idle()
+
+
+def fit_limits(xy):
+    """Axis limits ``((x0, x1), (y0, y1))`` around the points ``xy`` with a
+    margin."""
+    xy = np.asarray(xy, dtype=float)
+    low = xy.min(axis=0)
+    high = xy.max(axis=0)
+    margin = np.maximum((high - low) * 0.1, 0.2)
+    return (low[0] - margin[0], high[0] + margin[0]), (low[1] - margin[1], high[1] + margin[1])
+
+
+class OffscreenRenderer:
+    """A :class:`GraphRenderer` on its own Agg figure."""
+
+    def __init__(self, width=800, height=600, dpi=100, **kwargs):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.renderer = GraphRenderer(self.figure.add_subplot(), **kwargs)
+        self.figure.tight_layout()
+
+    def resize(self, width, height):
+        dpi = self.figure.dpi
+        if (width, height) != tuple(self.canvas.get_width_height()):
+            self.figure.set_size_inches(width / dpi, height / dpi)
+            self.figure.tight_layout()
+
+    def render(self, graph, pos, highlight_nodes=(), highlight_edges=(), title="Resource Allocation Graph",
+               limits=None):
+        """Draw and return the image as an ``(height, width, 4)`` uint8 array."""
+        self.renderer.render(graph, pos, highlight_nodes, highlight_edges, title, limits)
+        return np.asarray(self.canvas.buffer_rgba()).copy()
+
+    def save(self, path, format=None):
+        """Write the last rendered image to ``path``. PNG is encoded straight
+        from the Agg buffer; other formats (SVG, PDF) go through
+        ``savefig``, which draws the figure again with their own backend."""
+        format = (format or os.path.splitext(path)[1][1:] or 'png').lower()
+        if format == 'png':
+            from PIL import Image
+            Image.fromarray(np.asarray(self.canvas.buffer_rgba())).save(path, compress_level=1)
+        else:
+            self.figure.savefig(path, format=format)
@@ -0,0 +1,150 @@
+"""Scenario files: scripted graph construction and event traces.
+
+A scenario is a plain-text file with one operation per line. Blank lines and
+everything after ``#`` are ignored::
+
+    # Test Set 2 (Deadlock Case)
+    process P1 P2
+    resource R1 R2 R3:2       # name:instances, default 1
+    request P1 R1             # P1 -> R1, optional unit count
+    allocate R1 P2 1          # R1 -> P2
+    release R1 P2             # remove an edge
+    claim P1 R3 2             # maximum claim for Banker's checks
+    remove P1                 # remove a process or resource
+    clear
+    expect deadlock           # or: expect none (checked by the CLI)
+
+:func:`iter_events` parses lazily, one line at a time, so traces far larger
+than memory can be streamed. :func:`load` applies a scenario to an engine
+inside a single transaction and leaves redrawing to the caller.
+"""
+
+from collections import namedtuple
+
+Event = namedtuple('Event', 'lineno op args')
+LoadSummary = namedtuple('LoadSummary', 'events expect')
+
+OPS = ('process', 'resource', 'request', 'allocate', 'release', 'claim', 'remove', 'clear', 'expect')
+
+
+class ScenarioError(ValueError):
+
+    def __init__(self, lineno, message):
+        super().__init__(f"line {lineno}: {message}")
+        self.lineno = lineno
+
+
+def iter_events(lines):
+    """Yield an :class:`Event` per operation in ``lines`` (any iterable of
+    strings, typically an open file)."""
+    for lineno, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        op, *args = line.split()
+        if op not in OPS:
+            raise ScenarioError(lineno, f"unknown operation '{op}'")
+        yield Event(lineno, op, args)
+
+
+def _count(event, value):
+    if not value.isdigit() or int(value) < 1:
+        raise ScenarioError(event.lineno, f"'{value}' is not a valid instance count")
+    return int(value)
+
+
+def _arity(event, low, high=None):
+    # high=None means "at least low"
+    n = len(event.args)
+    if n < low or (high is not None and n > high):
+        raise ScenarioError(event.lineno, f"wrong number of arguments for '{event.op}'")
+
+
+def apply_event(engine, event):
+    op, args = event.op, event.args
+    try:
+        if op == 'process':
+            _arity(event, 1)
+            for name in args:
+                engine.add_process(name)
+        elif op == 'resource':
+            _arity(event, 1)
+            for spec in args:
+                name, _, instances = spec.partition(':')
+                engine.add_resource(name, _count(event, instances) if instances else 1)
+        elif op in ('request', 'allocate'):
+            _arity(event, 2, 3)
+            count = _count(event, args[2]) if len(args) == 3 else 1
+            add = engine.add_request_edge if op == 'request' else engine.add_allocation_edge
+            if not add(args[0], args[1], count):
+                raise ScenarioError(event.lineno, f"unknown node in '{op} {args[0]} {args[1]}'")
+        elif op == 'release':
+            _arity(event, 2, 2)
+            engine.remove_edge(args[0], args[1])
+        elif op == 'claim':
+            _arity(event, 3, 3)
+            engine.set_claim(args[0], args[1], _count(event, args[2]))
+        elif op == 'remove':
+            _arity(event, 1, 1)
+            if engine.node_type(args[0]) == 'resource':
+                engine.remove_resource(args[0])
+            else:
+                engine.remove_process(args[0])
+        elif op == 'clear':
+            _arity(event, 0, 0)
+            engine.remove_all()
+    except ScenarioError:
+        raise
+    except ValueError as e:
+        raise ScenarioError(event.lineno, str(e)) from None
+
+
+def apply_events(engine, events, atomic=True):
+    """Apply ``events`` to ``engine`` and return a :class:`LoadSummary`.
+
+    With ``atomic`` (the default) everything runs in one engine transaction,
+    so a bad line leaves the engine untouched. Streaming a huge trace with
+    ``atomic=False`` avoids keeping the undo journal in memory.
+    """
+    if atomic:
+        with engine.transaction():
+            return _apply_all(engine, events)
+    return _apply_all(engine, events)
+
+
+def _apply_all(engine, events):
+    count = 0
+    expect = None
+    for event in events:
+        if event.op == 'expect':
+            expect = ' '.join(event.args)
+        else:
+            apply_event(engine, event)
+            count += 1
+    return LoadSummary(count, expect)
+
+
+def load(engine, path, atomic=True):
+    with open(path, encoding='utf-8') as f:
+        return apply_events(engine, iter_events(f), atomic)
+
+
+def loads(engine, text, atomic=True):
+    return apply_events(engine, iter_events(text.splitlines()), atomic)
+
+
+def dump(engine, f):
+    """Write the current graph of ``engine`` as a scenario to file ``f``."""
+    graph = engine.graph
+    for p in engine.processes():
+        f.write(f"process {p}\n")
+    for r in engine.resources():
+        instances = engine.instances(r)
+        f.write(f"resource {r}:{instances}\n" if instances > 1 else f"resource {r}\n")
+    for p in engine.processes():
+        for r, count in graph.nodes[p].get('claims', {}).items():
+            f.write(f"claim {p} {r} {count}\n")
+    for u, v, d in graph.edges(data=True):
+        op = 'request' if d.get('type') == 'request' else 'allocate'
+        count = d.get('count', 1)
+        f.write(f"{op} {u} {v} {count}\n" if count > 1 else f"{op} {u} {v}\n")
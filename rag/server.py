@@ -0,0 +1,308 @@
+"""Live event ingestion over TCP or a Unix socket.
+
+Clients send newline-delimited JSON, one event per line::
+
+    {"op": "request", "process": "P1", "resource": "R1", "count": 1}
+    {"op": "allocate", "process": "P1", "resource": "R1"}
+    {"op": "release", "process": "P1", "resource": "R1"}
+
+``request`` adds ``count`` (default 1) to what the process waits for;
+``allocate`` grants ``count`` instances, settling that much of a pending
+request; ``release`` gives back ``count`` instances (all by default) and
+``cancel`` withdraws a pending request. Processes and resources named by
+these are created on first use (resources with one instance). The scenario
+operations ``process``/``resource`` (``name``, ``instances``), ``claim``,
+``remove`` (``name``) and ``clear`` are accepted too.
+
+Events from every client go through one bounded queue and are applied to the
+engine in batches, with an :class:`~rag.incremental.IncrementalDeadlockDetector`
+checking each of them. When the queue is full the server stops reading from
+the sockets, so backpressure reaches the clients through TCP flow control.
+Nothing is sent back except ``{"error": ...}`` for a bad event and
+``{"deadlock": [...]}`` to the client whose event closed a cycle (echoing the
+event's ``id`` when it has one). With multi-instance resources a cycle is
+only a candidate, so deadlocks are confirmed with the matrix check once per
+batch instead.
+
+:meth:`IngestServer.serve` runs everything on the asyncio loop.
+:meth:`IngestServer.start_thread` runs the sockets on a background thread and
+leaves applying to the owner of the engine, which calls
+:meth:`IngestServer.drain` with a time budget, e.g. from the Tk main loop.
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+
+from rag.engine import cycle_nodes
+from rag.incremental import IncrementalDeadlockDetector
+
+
+def apply_message(engine, message):
+    """Apply one decoded event to ``engine``; raises ``ValueError`` if it is
+    malformed or the engine refuses it."""
+    try:
+        op = message['op']
+        if op in ('request', 'allocate', 'release', 'cancel', 'claim'):
+            return _apply_edge(engine, op, message['process'], message['resource'], message.get('count'))
+        if op == 'process':
+            engine.add_process(message['name'])
+        elif op == 'resource':
+            engine.add_resource(message['name'], _count(message.get('instances', 1)))
+        elif op == 'remove':
+            name = message['name']
+            if engine.node_type(name) == 'resource':
+                engine.remove_resource(name)
+            else:
+                engine.remove_process(name)
+        elif op == 'clear':
+            engine.remove_all()
+        else:
+            raise ValueError(f"unknown operation '{op}'")
+    except KeyError as e:
+        raise ValueError(f"missing field {e}") from None
+    except TypeError:
+        raise ValueError("malformed event") from None
+
+
+def _count(value):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"'{value}' is not a valid instance count")
+    return value
+
+
+def _apply_edge(engine, op, process, resource, count):
+    graph = engine.graph
+    if process not in graph:
+        engine.add_process(process)
+    if resource not in graph:
+        engine.add_resource(resource)
+    if engine.node_type(process) != 'process' or engine.node_type(resource) != 'resource':
+        raise ValueError(f"'{op}' needs a process and a resource")
+    edge = graph.succ[process].get(resource)
+    waiting = edge.get('count', 1) if edge else 0
+    edge = graph.succ[resource].get(process)
+    held = edge.get('count', 1) if edge else 0
+
+    if op == 'claim':
+        engine.set_claim(process, resource, None if count is None else _count(count))
+    elif op == 'request':
+        engine.add_request_edge(process, resource, waiting + _count(count or 1))
+    elif op == 'allocate':
+        count = _count(count or 1)
+        with engine.transaction():
+            if waiting > count:
+                engine.add_request_edge(process, resource, waiting - count)
+            elif waiting:
+                engine.remove_edge(process, resource)
+            engine.add_allocation_edge(resource, process, held + count)
+    elif op == 'release':
+        count = held if count is None else min(_count(count), held)
+        if count and count < held:
+            engine.add_allocation_edge(resource, process, held - count)
+        elif held:
+            engine.remove_edge(resource, process)
+    elif waiting:
+        engine.remove_edge(process, resource)
+
+
+class IngestServer:
+    """Feeds events from socket clients into ``engine``.
+
+    ``on_deadlock(processes)`` is called on the applying thread for every
+    deadlock found; ``stats`` counts clients, events, errors and batches.
+    """
+
+    def __init__(self, engine, batch_size=1024, max_pending=65536, on_deadlock=None):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.on_deadlock = on_deadlock
+        self.detector = IncrementalDeadlockDetector(engine, on_deadlock=self._cycle_closed)
+        self.address = None
+        self.stats = {'clients': 0, 'received': 0, 'applied': 0, 'errors': 0, 'batches': 0, 'deadlocks': 0}
+        self._sender = None
+        self._closed = []                 # (processes, sender) per cycle closed in this batch
+        self._deadlocked = frozenset()    # last reported multi-instance deadlock
+        self._loop = None
+        self._queue = None
+        self._clients = set()
+        self._stopping = None
+        self._handoff = None
+        self._thread = None
+
+    # Running
+    async def serve(self, host='127.0.0.1', port=7878, path=None, ready=None):
+        """Accept clients on ``path`` (a Unix socket) or ``host:port`` until
+        :meth:`stop` is called. ``ready()`` is called once listening."""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.max_pending)
+        self._stopping = asyncio.Event()
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+        self.address = server.sockets[0].getsockname()
+        applier = asyncio.ensure_future(self._apply_loop())
+        if ready is not None:
+            ready()
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close()
+            for writer in list(self._clients):
+                writer.close()
+            applier.cancel()
+            await server.wait_closed()
+
+    def stop(self):
+        self.detector.detach()
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def start_thread(self, host='127.0.0.1', port=7878, path=None):
+        """Serve from a daemon thread; the caller applies events with
+        :meth:`drain`. Raises ``OSError`` if the socket cannot be opened."""
+        self._handoff = queue.Queue()
+        started = threading.Event()
+        failure = []
+
+        def run():
+            try:
+                asyncio.run(self.serve(host, port, path, ready=started.set))
+            except OSError as e:
+                failure.append(e)
+                started.set()
+
+        self._thread = threading.Thread(target=run, name='rag-ingest', daemon=True)
+        self._thread.start()
+        started.wait()
+        if failure:
+            self._thread = None
+            self.detector.detach()
+            raise failure[0]
+
+    def drain(self, budget=0.02):
+        """Apply batches handed over by the server thread for up to
+        ``budget`` seconds; returns the number of events applied."""
+        deadline = time.perf_counter() + budget
+        applied = 0
+        while True:
+            try:
+                batch = self._handoff.get_nowait()
+            except queue.Empty:
+                break
+            applied += self.apply(batch)
+            if time.perf_counter() >= deadline:
+                break
+        return applied
+
+    # Connections
+    async def _handle(self, reader, writer):
+        self._clients.add(writer)
+        self.stats['clients'] += 1
+        put = self._queue.put
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError as e:
+                    self.stats['errors'] += 1
+                    self._reply(writer, {'error': f"invalid JSON: {e}"})
+                    continue
+                if not isinstance(message, dict):
+                    self.stats['errors'] += 1
+                    self._reply(writer, {'error': "an event must be a JSON object"})
+                    continue
+                self.stats['received'] += 1
+                await put((message, writer))
+        except (ConnectionError, ValueError):
+            pass   # reset by the peer, or a line over the stream limit
+        finally:
+            self._clients.discard(writer)
+            self.stats['clients'] -= 1
+            writer.close()
+
+    def _reply(self, writer, payload):
+        # Safe from any thread; replies to a client that has gone are dropped
+        data = (json.dumps(payload) + '\n').encode('utf-8')
+
+        def send():
+            if not writer.is_closing():
+                writer.write(data)
+
+        self._loop.call_soon_threadsafe(send)
+
+    # Applying
+    async def _apply_loop(self):
+        events = self._queue
+        limit = max(1, self.max_pending // self.batch_size)
+        while True:
+            batch = [await events.get()]
+            while len(batch) < self.batch_size and not events.empty():
+                batch.append(events.get_nowait())
+            if self._handoff is None:
+                self.apply(batch)
+                await asyncio.sleep(0)
+            else:
+                # Hold back while the consumer is behind; the full event
+                # queue then stops the readers
+                while self._handoff.qsize() >= limit:
+                    await asyncio.sleep(0.001)
+                self._handoff.put(batch)
+
+    def apply(self, batch):
+        """Apply ``(message, writer)`` pairs to the engine, one by one, then
+        report the deadlocks they formed."""
+        engine = self.engine
+        errors = 0
+        for message, writer in batch:
+            self._sender = (message, writer)
+            try:
+                apply_message(engine, message)
+            except ValueError as e:
+                errors += 1
+                reply = {'error': str(e)}
+                if 'id' in message:
+                    reply['id'] = message['id']
+                self._reply(writer, reply)
+        sender, self._sender = self._sender, None
+        self.stats['errors'] += errors
+        self.stats['applied'] += len(batch) - errors
+        self.stats['batches'] += 1
+        self._report(sender)
+        return len(batch)
+
+    def _cycle_closed(self, cycle):
+        self._closed.append((cycle_nodes(cycle), self._sender))
+
+    def _report(self, last_sender):
+        closed, self._closed = self._closed, []
+        if not self.detector.deadlocked:
+            self._deadlocked = frozenset()
+            return
+        if self.engine.is_multi_instance():
+            # A cycle is necessary but not sufficient; confirm with the
+            # matrix check once per batch, reporting only a changed set
+            deadlocked = frozenset(self.engine.deadlocked_processes())
+            if not deadlocked or deadlocked == self._deadlocked:
+                return
+            self._deadlocked = deadlocked
+            closed = [(sorted(deadlocked, key=str), closed[-1][1] if closed else last_sender)]
+        for processes, sender in closed:
+            self.stats['deadlocks'] += 1
+            if sender is not None:
+                message, writer = sender
+                reply = {'deadlock': processes}
+                if 'id' in message:
+                    reply['id'] = message['id']
+                self._reply(writer, reply)
+            if self.on_deadlock is not None:
+                self.on_deadlock(processes)
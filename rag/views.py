@@ -0,0 +1,213 @@
+"""Focused views of a large allocation graph.
+
+Drawing every node stops being useful (and fast) long before the graph gets
+large. The functions here pick a *region* of the graph, walking the engine's
+adjacency dicts outwards from a few seed nodes, so their cost depends on the
+size of the region and never on the size of the graph:
+
+* :func:`neighborhood`: everything within ``hops`` edges of some nodes;
+* :func:`deadlock_region`: the given deadlocked processes and the resources
+  linking them;
+* :func:`contention_region`: the most requested resources with the processes
+  waiting for and holding them, ranked by a :class:`ContentionIndex`.
+
+A region maps each node, in visiting order, to the node it was reached from.
+:func:`focus` turns it into a small ``networkx`` graph to draw: the first
+``limit`` nodes are kept and every other node is folded into a
+:class:`Cluster` node attached to its nearest kept ancestor.
+"""
+
+import heapq
+import itertools
+from collections import deque, namedtuple
+
+import networkx as nx
+
+from rag.engine import GraphObserver
+
+VIEWS = ('full', 'neighborhood', 'deadlock', 'contention')
+
+
+Cluster = namedtuple('Cluster', 'anchor')
+Cluster.__doc__ = """Node standing for the part of a region folded into ``anchor`` (``None``
+for nodes reached from no kept node)."""
+
+
+class ContentionIndex(GraphObserver):
+    """Number of processes waiting for each resource, kept up to date from
+    the engine's mutations; resources nobody waits for are not stored.
+
+    The most contended resources come from a heap with lazy deletion: every
+    change pushes a fresh entry and outdated ones are dropped when they
+    surface, so :meth:`most_contended` costs O(n log R) instead of a sort.
+    """
+
+    def __init__(self, engine=None):
+        self.engine = None
+        self.waiters = {}
+        self._heap = []     # (-waiters, sequence, resource), possibly stale
+        self._sequence = itertools.count()
+        if engine is not None:
+            self.attach(engine)
+
+    def attach(self, engine):
+        self.engine = engine
+        engine.add_observer(self)
+        self.rebuild()
+
+    def detach(self):
+        if self.engine is not None:
+            self.engine.remove_observer(self)
+            self.engine = None
+
+    def rebuild(self):
+        graph = self.engine.graph
+        self.waiters = {r: len(graph.pred[r]) for r in self.engine.resources() if graph.pred[r]}
+        self._reheap()
+
+    def most_contended(self, n):
+        """The ``n`` resources with the most waiters, most first."""
+        found = []
+        valid = []
+        heap = self._heap
+        while heap and len(found) < n:
+            entry = heapq.heappop(heap)
+            count, _, r = entry
+            if self.waiters.get(r) == -count and r not in found:
+                found.append(r)
+                valid.append(entry)
+        for entry in valid:
+            heapq.heappush(heap, entry)
+        return found
+
+    def _push(self, r):
+        count = self.waiters.get(r)
+        if count:
+            heapq.heappush(self._heap, (-count, next(self._sequence), r))
+        if len(self._heap) > 2 * len(self.waiters) + 64:
+            self._reheap()
+
+    def _reheap(self):
+        self._heap = [(-count, next(self._sequence), r) for r, count in self.waiters.items()]
+        heapq.heapify(self._heap)
+
+    # GraphObserver
+    def edge_added(self, u, v, kind):
+        if kind == 'request':
+            self.waiters[v] = self.waiters.get(v, 0) + 1
+            self._push(v)
+
+    def edge_removed(self, u, v, kind):
+        if kind == 'request':
+            count = self.waiters.get(v, 0) - 1
+            if count > 0:
+                self.waiters[v] = count
+                self._push(v)
+            else:
+                self.waiters.pop(v, None)
+
+    def cleared(self):
+        self.waiters = {}
+        self._heap = []
+
+
+def neighborhood(graph, centers, hops=2):
+    """Nodes within ``hops`` edges of any of ``centers`` in either
+    direction, breadth first."""
+    region = {c: None for c in centers if c in graph}
+    frontier = list(region)
+    for _ in range(hops):
+        reached = []
+        for u in frontier:
+            for v in _neighbors(graph, u):
+                if v not in region:
+                    region[v] = u
+                    reached.append(v)
+        frontier = reached
+    return region
+
+
+def deadlock_region(graph, processes):
+    """``processes``, every member of one or more deadlocks as found by the
+    detector, with the resources linking them: those a member requests while
+    a member holds them. Only the members' own edges are visited, so nothing
+    downstream of the deadlock or blocked behind it is walked."""
+    members = {p for p in processes if p in graph}
+    region = {}
+    for seed in processes:
+        if seed not in members or seed in region:
+            continue
+        region[seed] = None
+        queue = deque([seed])
+        while queue:
+            p = queue.popleft()
+            for r in graph.succ[p]:
+                if r in region:
+                    continue
+                holders = [q for q in graph.succ[r] if q in members]
+                if not holders:
+                    continue
+                region[r] = p
+                for q in holders:
+                    if q not in region:
+                        region[q] = r
+                        queue.append(q)
+    return region
+
+
+def contention_region(graph, resources):
+    """``resources`` (most contended first) with the processes waiting for
+    and holding each of them."""
+    region = {r: None for r in resources if r in graph}
+    for r in list(region):
+        for p in graph.pred[r]:
+            region.setdefault(p, r)
+        for p in graph.succ[r]:
+            region.setdefault(p, r)
+    return region
+
+
+def focus(graph, region, limit=300):
+    """Graph of the first ``limit`` nodes of ``region`` and the edges among
+    them, plus one :class:`Cluster` node per kept node that the rest of the
+    region hangs off. Cluster nodes record how many processes and resources
+    they stand for; edges to and from them are of type ``'cluster'``."""
+    view = nx.DiGraph()
+    owner = {}
+    for node, parent in region.items():
+        if len(owner) < limit:
+            owner[node] = node
+            view.add_node(node, **graph.nodes[node])
+            continue
+        # The parent was visited first, so its owner is already known
+        cluster = owner[parent] if parent is not None else Cluster(None)
+        if not isinstance(cluster, Cluster):
+            cluster = Cluster(cluster)
+        owner[node] = cluster
+        if cluster not in view:
+            view.add_node(cluster, type='cluster', processes=0, resources=0)
+        attr = view.nodes[cluster]
+        attr['processes' if graph.nodes[node].get('type') == 'process' else 'resources'] += 1
+        if cluster.anchor is not None:
+            view.add_edge(cluster.anchor, cluster, type='cluster', count=1)
+
+    for u in region:
+        for v, d in graph.succ[u].items():
+            if v not in owner:
+                continue
+            a, b = owner[u], owner[v]
+            if a == b:
+                continue
+            if not isinstance(a, Cluster) and not isinstance(b, Cluster):
+                view.add_edge(u, v, **d)
+            elif not view.has_edge(a, b) and not view.has_edge(b, a):
+                view.add_edge(a, b, type='cluster', count=1)
+    for node, attr in view.nodes(data=True):
+        if attr.get('type') == 'cluster':
+            attr['label'] = f"+{attr['processes'] + attr['resources']}"
+    return view
+
+
+def _neighbors(graph, node):
+    yield from graph.succ[node]
+    yield from graph.pred[node]
@@ -0,0 +1,245 @@
+"""Discrete-event workload simulator on top of :class:`~rag.engine.RAGEngine`.
+
+Processes arrive over time, acquire a random set of resources one at a time,
+hold them and release everything. A request that cannot be served becomes a
+request edge in the engine, and an :class:`IncrementalDeadlockDetector`
+reports the moment one closes a cycle. The simulator then resolves the
+deadlock with a recovery strategy (by default aborting the requester, which
+restarts after a back-off) and carries on.
+
+Events live in a binary heap keyed by simulated time, and all randomness
+comes from one seeded ``random.Random``, so a run is reproducible from its
+seed. ``recovery(simulator, requester, deadlocked)`` may be passed to choose
+the victims to abort from the deadlocked processes; it must abort at least
+one live process. Nothing here touches a GUI; ``python -m rag simulate``
+runs it headless and prints a JSON summary.
+"""
+
+import heapq
+import random
+import time
+from collections import deque
+
+from rag.engine import RAGEngine
+from rag.incremental import IncrementalDeadlockDetector
+
+ARRIVE = 0
+REQUEST = 1
+RELEASE = 2
+
+
+def make_distribution(spec, rng):
+    """Turn ``'exp:MEAN'``, ``'const:VALUE'`` or ``'uniform:LOW:HIGH'`` into a
+    zero-argument sampler drawing from ``rng``."""
+    if callable(spec):
+        return spec
+    kind, *params = str(spec).split(':')
+    try:
+        values = [float(p) for p in params]
+    except ValueError:
+        raise ValueError(f"Bad distribution '{spec}'") from None
+    if kind == 'exp' and len(values) == 1:
+        rate = 1.0 / values[0]
+        return lambda: rng.expovariate(rate)
+    if kind == 'const' and len(values) == 1:
+        value = values[0]
+        return lambda: value
+    if kind == 'uniform' and len(values) == 2:
+        low, high = values
+        return lambda: rng.uniform(low, high)
+    raise ValueError(f"Bad distribution '{spec}'")
+
+
+class WorkloadSimulator:
+
+    def __init__(self, processes=1000, resources=40, instances=1, max_claims=3,
+                 arrival='exp:2', hold='exp:5', think='exp:0.5', backoff='exp:2',
+                 seed=0, engine=None, recovery=None):
+        self.rng = random.Random(seed)
+        self.n_processes = processes
+        self.max_claims = max(1, min(max_claims, resources))
+        self.arrival = make_distribution(arrival, self.rng)
+        self.hold = make_distribution(hold, self.rng)
+        self.think = make_distribution(think, self.rng)
+        self.backoff = make_distribution(backoff, self.rng)
+        self.recovery = recovery
+
+        self.engine = engine if engine is not None else RAGEngine(clock=lambda: self.now)
+        self.detector = IncrementalDeadlockDetector(self.engine)
+        self.resources = [f'R{j}' for j in range(resources)]
+        for r in self.resources:
+            self.engine.add_resource(r, instances)
+        self.multi_instance = instances > 1
+        self.free = {r: instances for r in self.resources}
+        self.waiters = {r: deque() for r in self.resources}
+        self.total_units = instances * resources
+
+        self.now = 0.0
+        self._heap = []
+        self._seq = 0
+        self.state = {}   # pid -> [plan, step, held, waiting_for, incarnation]
+
+        self.events = 0
+        self.completed = 0
+        self.aborted = 0
+        self.deadlocks = 0
+        self.deadlock_times = []
+        self._busy = 0
+        self._busy_area = 0.0
+        self._last = 0.0
+
+    # Scheduling
+    def schedule(self, delay, kind, pid, incarnation=None):
+        # Events carry the incarnation of pid they belong to (by default its
+        # current one), so an aborted process's leftovers can be told apart
+        if incarnation is None:
+            incarnation = self.state[pid][4]
+        self._seq += 1
+        heapq.heappush(self._heap, (self.now + delay, self._seq, kind, pid, incarnation))
+
+    def run(self, until=None, max_events=None):
+        """Run until every process has finished, ``until`` simulated time
+        units have passed or ``max_events`` events were processed."""
+        wall = time.perf_counter()
+        if not self._seq:
+            t = 0.0
+            for i in range(self.n_processes):
+                self._seq += 1
+                heapq.heappush(self._heap, (t, self._seq, ARRIVE, f'P{i}', 0))
+                t += self.arrival()
+        heap = self._heap
+        while heap:
+            if until is not None and heap[0][0] > until:
+                self._advance(until)
+                break
+            if max_events is not None and self.events >= max_events:
+                break
+            when, _, kind, pid, incarnation = heapq.heappop(heap)
+            if kind != ARRIVE:
+                state = self.state.get(pid)
+                if state is None or state[4] != incarnation:
+                    continue    # scheduled before pid was aborted
+            self._advance(when)
+            self.events += 1
+            if kind == REQUEST:
+                self._request(pid)
+            elif kind == RELEASE:
+                self._release(pid)
+            else:
+                self._arrive(pid, incarnation)
+        return self.summary(time.perf_counter() - wall)
+
+    def _advance(self, when):
+        self._busy_area += self._busy * (when - self._last)
+        self._last = when
+        self.now = when
+
+    # Process lifecycle
+    def _arrive(self, pid, incarnation=0):
+        plan = self.rng.sample(self.resources, self.rng.randint(1, self.max_claims))
+        self.state[pid] = [plan, 0, [], None, incarnation]
+        self.engine.add_process(pid)
+        self._request(pid)
+
+    def _request(self, pid):
+        state = self.state.get(pid)
+        if state is None:
+            return
+        r = state[0][state[1]]
+        if self.free[r] > 0:
+            self._grant(pid, r)
+            return
+        state[3] = r
+        self.waiters[r].append(pid)
+        self.engine.add_request_edge(pid, r)
+        if self.multi_instance:
+            # A cycle is necessary but not sufficient with several instances
+            if self.detector.deadlocked:
+                deadlocked = self.engine.deadlocked_processes()
+                if deadlocked:
+                    self._detected()
+                while deadlocked:
+                    self._recover(pid, deadlocked)
+                    deadlocked = self.engine.deadlocked_processes()
+        elif self.detector.new_cycle is not None:
+            self._detected()
+            self._recover(pid, [p for p, _ in self.detector.new_cycle])
+
+    def _grant(self, pid, r):
+        state = self.state[pid]
+        if state[3] == r:
+            self.engine.remove_edge(pid, r)
+            state[3] = None
+        self.free[r] -= 1
+        self._busy += 1
+        self.engine.add_allocation_edge(r, pid)
+        state[2].append(r)
+        state[1] += 1
+        if state[1] < len(state[0]):
+            self.schedule(self.think(), REQUEST, pid)
+        else:
+            self.schedule(self.hold(), RELEASE, pid)
+
+    def _release(self, pid, finished=True):
+        state = self.state.pop(pid, None)
+        if state is None:
+            return
+        if state[3] is not None:
+            self.waiters[state[3]].remove(pid)
+        self.engine.remove_process(pid)
+        for r in state[2]:
+            self.free[r] += 1
+            self._busy -= 1
+            self._serve_waiters(r)
+        if finished:
+            self.completed += 1
+
+    def _serve_waiters(self, r):
+        waiters = self.waiters[r]
+        while self.free[r] > 0 and waiters:
+            self._grant(waiters.popleft(), r)
+
+    # Deadlock recovery
+    def _detected(self):
+        self.deadlocks += 1
+        self.deadlock_times.append(self.now)
+
+    def _recover(self, requester, deadlocked):
+        if self.recovery is not None:
+            victims = self.recovery(self, requester, deadlocked)
+        else:
+            victims = [requester if requester in deadlocked else deadlocked[0]]
+        aborted = [pid for pid in victims if self.abort(pid)]
+        if not aborted:
+            raise RuntimeError(f"Recovery chose no live victim among {deadlocked}")
+
+    def abort(self, pid):
+        """Abort ``pid``, releasing what it holds; it restarts after a back-off
+        as a new incarnation, and its pending events are dropped. Returns
+        whether ``pid`` was live."""
+        if pid not in self.state:
+            return False
+        incarnation = self.state[pid][4] + 1
+        self._release(pid, finished=False)
+        self.aborted += 1
+        self.schedule(self.backoff(), ARRIVE, pid, incarnation)
+        return True
+
+    # Results
+    def summary(self, wall_seconds=0.0):
+        elapsed = self.now or 1e-12
+        gaps = [b - a for a, b in zip([0.0] + self.deadlock_times, self.deadlock_times)]
+        return {
+            'sim_time': self.now,
+            'events': self.events,
+            'completed': self.completed,
+            'aborted': self.aborted,
+            'deadlocks': self.deadlocks,
+            'deadlock_rate': self.deadlocks / elapsed,
+            'time_to_first_deadlock': self.deadlock_times[0] if self.deadlock_times else None,
+            'mean_time_between_deadlocks': sum(gaps) / len(gaps) if gaps else None,
+            'utilization': self._busy_area / (self.total_units * elapsed) if self.total_units else 0.0,
+            'throughput': self.completed / elapsed,
+            'wall_seconds': wall_seconds,
+            'events_per_sec': self.events / wall_seconds if wall_seconds > 0 else None,
+        }
@@ -140,11 +140,12 @@ class ResourceAllocationGraph:
         nx.draw_networkx_nodes(self.graph, pos, nodelist=process_nodes, node_color='skyblue', node_size=800, ax=self.ax)
         nx.draw_networkx_nodes(self.graph, pos, nodelist=resource_nodes, node_color='lightgreen', node_size=800, ax=self.ax)
 
-        edges = self.graph.edges(data=True)
-        for u, v, d in edges:
-            color = d.get('color', 'black')
-            style = d.get('style', 'solid')
-            nx.draw_networkx_edges(self.graph, pos, edgelist=[(u, v)], edge_color=color, style=style, ax=self.ax)
+        # One draw call per (color, style) group instead of one per edge
+        edge_groups = {}
+        for u, v, d in self.graph.edges(data=True):
+            edge_groups.setdefault((d.get('color', 'black'), d.get('style', 'solid')), []).append((u, v))
+        for (color, style), edgelist in edge_groups.items():
+            nx.draw_networkx_edges(self.graph, pos, edgelist=edgelist, edge_color=color, style=style, ax=self.ax)
 
         nx.draw_networkx_labels(self.graph, pos, ax=self.ax)
 
@@ -1,18 +1,35 @@
-import networkx as nx
 import matplotlib.pyplot as plt
+import numpy as np
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, filedialog, ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import psutil
-import time
-import threading
-from collections import deque
+from rag.engine import RAGEngine, cycle_nodes
+from rag.incremental import IncrementalDeadlockDetector
+from rag.analysis import cycle_edges
+from rag.layout import LayoutCache, MODES as LAYOUT_MODES
+from rag.render import GraphRenderer, OffscreenRenderer
+from rag.background import BackgroundWorker, snapshot, snapshot_engine, snapshot_graph
+from rag import columnar, scenario, views
+from rag.metrics import Metrics
+from rag.recovery import STRATEGIES as RECOVERY_STRATEGIES
+from rag.avoidance import AvoidanceManager, POLICIES as AVOIDANCE_POLICIES, GRANTED, DENIED
+from rag.eventlog import EventLog, LogReplayer
+from rag.server import IngestServer
+from rag.analytics import WaitAnalytics
+
+# Graphs above this many nodes are analysed, laid out and rasterized on a
+# worker thread; smaller ones are drawn directly, which is quicker
+BACKGROUND_NODES = 2000
+# Focused views draw at most this many nodes and fold the rest into clusters
+VIEW_NODES = 300
+VIEW_RESOURCES = 20
 
 class ResourceAllocationGraph:
     
     
     def __init__(self, root):
-        self.graph = nx.DiGraph()
+        self.engine = RAGEngine()
+        self.graph = self.engine.graph
         self.root = root
         self.root.title("Resource Allocation Graph Simulator")
         
@@ -20,6 +37,18 @@ class ResourceAllocationGraph:
         self.figure, self.ax = plt.subplots(figsize=(8, 6))
         self.canvas = FigureCanvasTkAgg(self.figure, master=root)
         self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.renderer = GraphRenderer(self.ax)
+        self.figure.tight_layout()
+        # Background results arrive as finished images, shown over the whole figure
+        self.image_ax = self.figure.add_axes([0, 0, 1, 1])
+        self.image_ax.axis('off')
+        self.image = self.image_ax.imshow(np.zeros((1, 1, 4), dtype=np.uint8), extent=(0, 1, 0, 1),
+                                          aspect='auto', interpolation='nearest')
+        self.image_ax.set_visible(False)
+        self.worker = BackgroundWorker()
+        self.offscreen = None
+        self._deferred = None
+        self._watching = False
         
         # Control panel
         self.controls_frame = tk.Frame(root)
@@ -38,6 +67,10 @@ class ResourceAllocationGraph:
         self.resource_entry.grid(row=1, column=1, padx=5, pady=5)
         tk.Button(self.controls_frame, text="Add", command=self.add_resource).grid(row=1, column=2, padx=5, pady=5)
         tk.Button(self.controls_frame, text="Remove", command=self.remove_resource, bg='lightcoral').grid(row=1, column=3, padx=5, pady=5)
+        tk.Label(self.controls_frame, text="Instances:").grid(row=1, column=4, padx=5, pady=5)
+        self.instances_entry = tk.Entry(self.controls_frame, width=5)
+        self.instances_entry.insert(0, "1")
+        self.instances_entry.grid(row=1, column=5, padx=5, pady=5, sticky=tk.W)
         
         # Edge controls
         tk.Label(self.controls_frame, text="From:").grid(row=2, column=0, padx=5, pady=5)
@@ -49,231 +82,618 @@ class ResourceAllocationGraph:
         tk.Button(self.controls_frame, text="Add Request", command=self.add_request_edge, bg='lightyellow').grid(row=2, column=4, padx=5, pady=5)
         tk.Button(self.controls_frame, text="Add Allocation", command=self.add_allocation_edge, bg='lightgreen').grid(row=2, column=5, padx=5, pady=5)
         tk.Button(self.controls_frame, text="Remove Edge", command=self.remove_edge, bg='lightcoral').grid(row=2, column=6, padx=5, pady=5)
+        tk.Label(self.controls_frame, text="Units:").grid(row=2, column=7, padx=5, pady=5)
+        self.units_entry = tk.Entry(self.controls_frame, width=5)
+        self.units_entry.insert(0, "1")
+        self.units_entry.grid(row=2, column=8, padx=5, pady=5)
         
         # Deadlock detection
         tk.Button(self.controls_frame, text="Check Deadlock", command=self.check_deadlock, bg='orange').grid(row=3, column=0, columnspan=2, padx=5, pady=5)
         tk.Button(self.controls_frame, text="Remove All", command=self.remove_all, bg='red').grid(row=3, column=2, columnspan=2, padx=5, pady=5)
+        self.online_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.controls_frame, text="Online Detection", variable=self.online_var,
+                       command=self.toggle_online_detection).grid(row=3, column=4, columnspan=2, padx=5, pady=5)
+        
+        # Layout controls
+        self.layout = LayoutCache()
+        tk.Button(self.controls_frame, text="Re-layout", command=self.relayout).grid(row=3, column=6, padx=5, pady=5)
+        self.layout_var = tk.StringVar(value=self.layout.mode)
+        tk.OptionMenu(self.controls_frame, self.layout_var, *LAYOUT_MODES,
+                      command=self.change_layout).grid(row=3, column=7, columnspan=2, padx=5, pady=5)
+        
+        # Scenario files
+        tk.Button(self.controls_frame, text="Load Scenario", command=self.load_scenario).grid(row=4, column=0, columnspan=2, padx=5, pady=5)
+        tk.Button(self.controls_frame, text="Save Scenario", command=self.save_scenario).grid(row=4, column=2, columnspan=2, padx=5, pady=5)
+        
+        # Deadlock recovery
+        tk.Button(self.controls_frame, text="Recover", command=self.recover, bg='orange').grid(row=4, column=4, columnspan=2, padx=5, pady=5)
+        self.recovery_var = tk.StringVar(value=RECOVERY_STRATEGIES[0])
+        tk.OptionMenu(self.controls_frame, self.recovery_var, *RECOVERY_STRATEGIES).grid(row=4, column=6, columnspan=2, padx=5, pady=5)
+        
+        # Deadlock avoidance: gate requests and allocations through a safety check
+        self.avoidance = None
+        tk.Label(self.controls_frame, text="Avoidance:").grid(row=5, column=0, padx=5, pady=5)
+        self.avoidance_var = tk.StringVar(value='off')
+        tk.OptionMenu(self.controls_frame, self.avoidance_var, 'off', *AVOIDANCE_POLICIES,
+                      command=self.change_avoidance).grid(row=5, column=1, padx=5, pady=5)
+        tk.Button(self.controls_frame, text="Add Claim", command=self.add_claim).grid(row=5, column=2, columnspan=2, padx=5, pady=5)
+        
+        # Event log: record the session, or open a log and move through its history
+        self.event_log = None
+        self.replayer = None
+        self._seek_pending = False
+        self.record_button = tk.Button(self.controls_frame, text="Record Log", command=self.toggle_recording)
+        self.record_button.grid(row=6, column=0, columnspan=2, padx=5, pady=5)
+        tk.Button(self.controls_frame, text="Open Log", command=self.open_log).grid(row=6, column=2, columnspan=2, padx=5, pady=5)
+        self.timeline = tk.Scale(self.controls_frame, from_=0, to=0, orient=tk.HORIZONTAL, length=300,
+                                 showvalue=False, command=self.seek_log, state=tk.DISABLED)
+        self.timeline.grid(row=6, column=4, columnspan=3, padx=5, pady=5)
+        self.timeline_label = tk.Label(self.controls_frame, text="")
+        self.timeline_label.grid(row=6, column=7, columnspan=2, padx=5, pady=5)
+        self.detector = None
+        
+        # Live ingestion: socket clients stream events, applied between redraws
+        self.server = None
+        self._served_deadlock = None
+        self.server_button = tk.Button(self.controls_frame, text="Start Server", command=self.toggle_server)
+        self.server_button.grid(row=7, column=0, columnspan=2, padx=5, pady=5)
+        tk.Label(self.controls_frame, text="Port:").grid(row=7, column=2, padx=5, pady=5)
+        self.port_entry = tk.Entry(self.controls_frame, width=6)
+        self.port_entry.insert(0, "7878")
+        self.port_entry.grid(row=7, column=3, padx=5, pady=5, sticky=tk.W)
+        self.server_label = tk.Label(self.controls_frame, text="")
+        self.server_label.grid(row=7, column=4, columnspan=5, padx=5, pady=5, sticky=tk.W)
         
-        # Performance metrics
+        # Focused views: draw one region of a large graph instead of all of it
+        self.contention = views.ContentionIndex(self.engine)
+        self.deadlock_seeds = set()
+        self.view_layout = LayoutCache()
+        tk.Label(self.controls_frame, text="View:").grid(row=8, column=0, padx=5, pady=5)
+        self.view_var = tk.StringVar(value='full')
+        tk.OptionMenu(self.controls_frame, self.view_var, *views.VIEWS,
+                      command=self.change_view).grid(row=8, column=1, padx=5, pady=5)
+        tk.Label(self.controls_frame, text="Around:").grid(row=8, column=2, padx=5, pady=5)
+        self.focus_entry = tk.Entry(self.controls_frame, width=15)
+        self.focus_entry.grid(row=8, column=3, padx=5, pady=5)
+        tk.Label(self.controls_frame, text="Hops:").grid(row=8, column=4, padx=5, pady=5)
+        self.hops_entry = tk.Entry(self.controls_frame, width=5)
+        self.hops_entry.insert(0, "2")
+        self.hops_entry.grid(row=8, column=5, padx=5, pady=5, sticky=tk.W)
+        tk.Button(self.controls_frame, text="Show", command=self.draw_graph).grid(row=8, column=6, padx=5, pady=5)
+        
+        # Performance metrics, measured on the engine itself
+        self.metrics = Metrics()
+        self.engine.metrics = self.metrics
         self.metrics_frame = tk.Frame(root, bd=2, relief=tk.SUNKEN, padx=10, pady=10)
         self.metrics_frame.pack(side=tk.RIGHT, fill=tk.Y)
         tk.Label(self.metrics_frame, text="Performance Metrics", font=("Arial", 12, "bold")).pack()
-        self.cpu_label = tk.Label(self.metrics_frame, text="CPU Utilization: - %")
-        self.cpu_label.pack()
-        self.memory_label = tk.Label(self.metrics_frame, text="Memory Utilization: - %")
-        self.memory_label.pack()
-        self.page_fault_label = tk.Label(self.metrics_frame, text="Page Fault Rate: -")
-        self.page_fault_label.pack()
-        self.throughput_label = tk.Label(self.metrics_frame, text="Throughput: - processes/sec")
-        self.throughput_label.pack()
-        self.response_time_label = tk.Label(self.metrics_frame, text="Response Time: - sec")
-        self.response_time_label.pack()
+        self.events_label = tk.Label(self.metrics_frame, text="Events: -")
+        self.events_label.pack(anchor=tk.W)
+        self.graph_size_label = tk.Label(self.metrics_frame, text="Graph: -")
+        self.graph_size_label.pack(anchor=tk.W)
+        tk.Label(self.metrics_frame, text="Latency (p50 / p99 / max, ms)").pack(anchor=tk.W, pady=(10, 0))
+        self.latency_label = tk.Label(self.metrics_frame, text="", font=("Courier", 9), justify=tk.LEFT)
+        self.latency_label.pack(anchor=tk.W)
         
-        self.processed_tasks = 0
-        self.start_time = time.time()
-        threading.Thread(target=self.update_metrics, daemon=True).start()
+        # Wait analytics: contention and wait chains, updated on every edge
+        self.analytics = None
+        self.analytics_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.metrics_frame, text="Wait Analytics", variable=self.analytics_var,
+                       command=self.toggle_analytics).pack(anchor=tk.W, pady=(10, 0))
+        self.analytics_label = tk.Label(self.metrics_frame, text="", font=("Courier", 9), justify=tk.LEFT)
+        self.analytics_label.pack(anchor=tk.W)
+        tk.Button(self.metrics_frame, text="Export Metrics", command=self.export_metrics).pack(side=tk.BOTTOM, pady=5)
+        self.progress = ttk.Progressbar(self.metrics_frame, mode='determinate', maximum=1.0, length=180)
+        self.progress.pack(side=tk.BOTTOM, pady=(10, 0))
+        self.progress_label = tk.Label(self.metrics_frame, text="")
+        self.progress_label.pack(side=tk.BOTTOM, anchor=tk.W)
         
         self.draw_graph()
+        self.update_metrics()
     
     def update_metrics(self):
-        while True:
-            cpu_usage = psutil.cpu_percent()
-            memory_usage = psutil.virtual_memory().percent
-            page_fault_rate = round(psutil.swap_memory().sin / 1024, 2)
-            elapsed_time = time.time() - self.start_time
-            throughput = round(self.processed_tasks / elapsed_time, 2) if elapsed_time > 0 else 0
-            response_time = round(elapsed_time / (self.processed_tasks + 1), 2)
-            
-            self.cpu_label.config(text=f"CPU Utilization: {cpu_usage} %")
-            self.memory_label.config(text=f"Memory Utilization: {memory_usage} %")
-            self.page_fault_label.config(text=f"Page Fault Rate: {page_fault_rate} KB/sec")
-            self.throughput_label.config(text=f"Throughput: {throughput} processes/sec")
-            self.response_time_label.config(text=f"Response Time: {response_time} sec")
-            
-            time.sleep(1)
+        # Runs on the Tk main loop; reschedules itself every second
+        snap = self.metrics.snapshot(self.engine)
+        self.events_label.config(text=f"Events: {snap['events']} ({snap['events_per_sec']:.1f}/sec)")
+        self.graph_size_label.config(text=f"Graph: {snap['graph']['nodes']} nodes, {snap['graph']['edges']} edges")
+        rows = [f"{op[:16]:<16} {h['p50'] * 1e3:7.2f} {h['p99'] * 1e3:7.2f} {h['max'] * 1e3:7.2f}"
+                for op, h in snap['operations'].items()]
+        self.latency_label.config(text="\n".join(rows) or "no operations yet")
+        if self.analytics is not None:
+            self.analytics_label.config(text=self.analytics_text())
+        self.root.after(1000, self.update_metrics)
+    
+    def toggle_analytics(self):
+        if self.analytics_var.get():
+            self.analytics = WaitAnalytics(self.engine)
+            self.analytics_label.config(text=self.analytics_text())
+        elif self.analytics is not None:
+            self.analytics.detach()
+            self.analytics = None
+            self.analytics_label.config(text="")
+    
+    def analytics_text(self):
+        # A few lines for the panel; every figure comes from the live indexes
+        a = self.analytics
+        chain = a.longest_chain(limit=6)
+        rows = ["Hottest resources (waiters):"]
+        rows += [f"  {str(r)[:14]:<14} {n:5d}" for r, n in a.most_contended(5)] or ["  none"]
+        rows.append("Waiting longest (s):")
+        rows += [f"  {str(p)[:14]:<14} {t:7.1f}" for p, t in a.longest_waiting(5)] or ["  none"]
+        rows.append(f"Longest wait chain: {a.max_chain_depth}")
+        if chain:
+            rows.append("  " + " → ".join(map(str, chain)) + (" → …" if a.max_chain_depth >= len(chain) else ""))
+        return "\n".join(rows)
+    
+    def export_metrics(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("Prometheus text", "*.prom")])
+        if not path:
+            return
+        text = self.metrics.to_prometheus(self.engine) if path.endswith('.prom') else self.metrics.to_json(self.engine)
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not export metrics: {e}")
     
     def add_process(self):
         process = self.process_entry.get().strip()
-        if process and not self.graph.has_node(process):
-            self.graph.add_node(process, type='process')
-            self.processed_tasks += 1
+        if self.engine.add_process(process):
             self.draw_graph()
     
     def remove_process(self):
         process = self.process_entry.get().strip()
-        if process in self.graph:
-            self.graph.remove_node(process)
+        removed = self.avoidance.finish(process) if self.avoidance is not None else self.engine.remove_process(process)
+        if removed:
             self.draw_graph()
     
     def add_resource(self):
         resource = self.resource_entry.get().strip()
-        if resource and not self.graph.has_node(resource):
-            self.graph.add_node(resource, type='resource', instances=1)  # Automatically set instances to 1
-            self.draw_graph()
+        try:
+            if self.engine.add_resource(resource, self.read_count(self.instances_entry)):
+                self.draw_graph()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
     
     def remove_resource(self):
         resource = self.resource_entry.get().strip()
-        if resource in self.graph:
-            self.graph.remove_node(resource)
+        removed = self.avoidance.remove_resource(resource) if self.avoidance is not None else self.engine.remove_resource(resource)
+        if removed:
             self.draw_graph()
     
     def add_request_edge(self):
         from_node = self.from_entry.get().strip()
         to_node = self.to_entry.get().strip()
-        if from_node in self.graph and to_node in self.graph:
-            if self.graph.nodes[from_node]['type'] == 'process' and self.graph.nodes[to_node]['type'] == 'resource':
-                self.graph.add_edge(from_node, to_node, type='request')
+        if self.avoidance is not None:
+            self.request_safely(from_node, to_node)
+            return
+        try:
+            if self.engine.add_request_edge(from_node, to_node, self.read_count(self.units_entry)):
                 self.draw_graph()
-            else:
-                messagebox.showerror("Error", "Request edge must go from process to resource")
+                self.report_online_deadlock()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
     
     def add_allocation_edge(self):
         from_node = self.from_entry.get().strip()
         to_node = self.to_entry.get().strip()
-        if from_node in self.graph and to_node in self.graph:
-            if self.graph.nodes[from_node]['type'] == 'resource' and self.graph.nodes[to_node]['type'] == 'process':
-                self.graph.add_edge(from_node, to_node, type='allocation')
+        if self.avoidance is not None:
+            self.request_safely(to_node, from_node)
+            return
+        try:
+            if self.engine.add_allocation_edge(from_node, to_node, self.read_count(self.units_entry)):
                 self.draw_graph()
-            else:
-                messagebox.showerror("Error", "Allocation edge must go from resource to process")
+                self.report_online_deadlock()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+    
+    def read_count(self, entry):
+        text = entry.get().strip() or "1"
+        if not text.isdigit():
+            raise ValueError(f"'{text}' is not a valid instance count")
+        return int(text)
     
     def remove_edge(self):
         from_node = self.from_entry.get().strip()
         to_node = self.to_entry.get().strip()
-        if from_node in self.graph and to_node in self.graph and self.graph.has_edge(from_node, to_node):
-            self.graph.remove_edge(from_node, to_node)
+        if self.avoidance is not None:
+            # Releasing an allocation may let queued requests through
+            removed = self.avoidance.remove_edge(from_node, to_node)
+        else:
+            removed = self.engine.remove_edge(from_node, to_node)
+        if removed:
             self.draw_graph()
     
+    def change_avoidance(self, policy):
+        self.avoidance = AvoidanceManager(self.engine, policy) if policy != 'off' else None
+    
+    def request_safely(self, process, resource):
+        try:
+            result = self.avoidance.request(process, resource, self.read_count(self.units_entry))
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.draw_graph()
+        if result == DENIED:
+            messagebox.showwarning("Request Denied", f"Granting {resource} to {process} would make the state unsafe")
+        elif result != GRANTED:
+            messagebox.showinfo("Request Queued", f"{process} waits for {resource} until it can be granted safely")
+    
+    def add_claim(self):
+        process = self.from_entry.get().strip()
+        resource = self.to_entry.get().strip()
+        try:
+            count = self.read_count(self.units_entry)
+            if self.avoidance is not None:
+                self.avoidance.claim(process, resource, count)
+            else:
+                self.engine.set_claim(process, resource, count)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+    
     
     def check_deadlock(self):
+        if len(self.graph) > BACKGROUND_NODES:
+            snap = snapshot(self.engine)
+            self.worker.submit(self._check_snapshot, snap, on_done=self.report_deadlock,
+                               on_error=self.background_failed)
+            self.watch_worker()
+            return
         try:
-            # Separate processes and resources
-            processes = [n for n, attr in self.graph.nodes(data=True) if attr.get('type') == 'process']
-            resources = [n for n, attr in self.graph.nodes(data=True) if attr.get('type') == 'resource']
-            
-            # Create a graph to track dependencies
-            dependency_graph = nx.DiGraph()
-            
-            # Analyze resource allocation and request edges
-            for p in processes:
-                # Find resources requested by the process
-                requested_resources = [r for r in resources if self.graph.has_edge(p, r)]
-                
-                # Find resources allocated to the process
-                allocated_resources = [r for r in resources if self.graph.has_edge(r, p)]
-                
-                # For each requested resource not allocated to the process
-                for req_resource in requested_resources:
-                    # Find which process currently holds this resource
-                    resource_holders = [p2 for p2 in processes if self.graph.has_edge(req_resource, p2)]
-                    
-                    # Add dependency edges
-                    for holder in resource_holders:
-                        if holder != p:
-                            dependency_graph.add_edge(p, holder)
-            
-            # Check for cycles in the dependency graph
-            try:
-                cycle = list(nx.find_cycle(dependency_graph, orientation='original'))
-                
-                # Construct the cycle of process names
-                cycle_nodes = [edge[0] for edge in cycle] + [cycle[0][0]]  # Complete the cycle
-                
-                # Highlight the cycle and show warning
-                messagebox.showwarning("Deadlock Detected", 
-                    f"Deadlock found in cycle: {' → '.join(cycle_nodes)}")
-                self.highlight_cycle(cycle)
-                
-            except nx.NetworkXNoCycle:
-                messagebox.showinfo("No Deadlock", "No deadlock detected in the system")
-            
+            self.report_deadlock(self.engine.find_deadlock())
         except Exception as e:
             messagebox.showerror("Error", f"Error checking for deadlock: {str(e)}")
+    
+    def _check_snapshot(self, snap, progress):
+        # Runs on the worker thread
+        progress(0.1, "Copying graph")
+        engine = snapshot_engine(snap)
+        progress(0.5, "Detecting deadlocks")
+        return engine.find_deadlock()
+    
+    def report_deadlock(self, result):
+        kind, found = result
+        if not found:
+            messagebox.showinfo("No Deadlock", "No deadlock detected in the system")
+        elif kind == 'matrix':
+            messagebox.showwarning("Deadlock Detected", 
+                f"Deadlocked processes: {', '.join(found)}")
+            self.highlight_deadlock(set(found), set())
+        else:
+            # Report every independent deadlock, not just the first cycle
+            lines = [f"Cluster {i}: {', '.join(c)}" for i, c in enumerate(found.clusters, 1)]
+            if found.blocked:
+                lines.append(f"Blocked behind them: {', '.join(sorted(found.blocked))}")
+            messagebox.showwarning("Deadlock Detected", 
+                f"{len(found.clusters)} deadlock cluster(s) found\n" + "\n".join(lines))
+            nodes = {p for p in found.deadlocked if p in self.graph}
+            self.highlight_deadlock(nodes, cycle_edges(self.engine, nodes))
+    
+    def background_failed(self, error):
+        messagebox.showerror("Error", f"Background job failed: {error}")
         
+    def recover(self):
+        try:
+            plan = self.engine.recover(self.recovery_var.get())
+        except Exception as e:
+            messagebox.showerror("Error", f"Error recovering from deadlock: {str(e)}")
+            return
+        if not plan.victims:
+            messagebox.showinfo("No Deadlock", "No deadlock detected in the system")
+            return
+        self.deadlock_seeds = set()
+        self.draw_graph()
+        if plan.strategy == 'preempt':
+            taken = ', '.join(f"{r} from {p}" for r, p, _ in plan.preempted)
+            message = f"Rolled back {', '.join(plan.victims)}\nPreempted: {taken}"
+        else:
+            message = f"Terminated {', '.join(plan.victims)}"
+        messagebox.showinfo("Deadlock Recovered", f"{message}\nCost: {plan.cost:.1f}")
+    
+    def toggle_recording(self):
+        if self.event_log is not None:
+            self.event_log.close()
+            self.event_log = None
+            self.record_button.config(text="Record Log")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".raglog", filetypes=[("Event log", "*.raglog")])
+        if not path:
+            return
+        try:
+            self.event_log = EventLog(path, self.engine)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not record log: {e}")
+            return
+        self.record_button.config(text="Stop Recording")
+    
+    def open_log(self):
+        path = filedialog.askopenfilename(filetypes=[("Event log", "*.raglog"), ("All files", "*")])
+        if not path:
+            return
+        if self.event_log is not None:
+            self.toggle_recording()
+        try:
+            self.replayer = LogReplayer(path, self.engine)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not open log: {e}")
+            return
+        self.timeline.config(state=tk.NORMAL, to=self.replayer.length)
+        self.timeline.set(self.replayer.length)
+        self.seek_log(self.replayer.length)
+    
+    def seek_log(self, value):
+        # Dragging the slider fires many events; seek once per idle cycle
+        if self.replayer is None or self._seek_pending:
+            return
+        self._seek_pending = True
+        self.root.after_idle(self._apply_seek)
+    
+    def _apply_seek(self):
+        self._seek_pending = False
+        try:
+            with self.metrics.timed('seek'):
+                position = self.replayer.seek(int(self.timeline.get()))
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Could not replay log: {e}")
+            return
+        self.timeline_label.config(text=f"Event {position} / {self.replayer.length}")
+        self.draw_graph()
+    
+    def toggle_server(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+            self.server_button.config(text="Start Server")
+            self.server_label.config(text="")
+            return
+        try:
+            port = int(self.port_entry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Port must be a number")
+            return
+        server = IngestServer(self.engine, on_deadlock=self.served_deadlock)
+        try:
+            server.start_thread(port=port)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not start server: {e}")
+            return
+        self.server = server
+        self.server_button.config(text="Stop Server")
+        self.poll_server()
+    
+    def served_deadlock(self, processes):
+        # Called from drain(); a dialog here would stall the stream
+        self._served_deadlock = processes
+    
+    def poll_server(self):
+        # Apply what arrived for a bounded slice of the main loop and redraw
+        # once, however many events that was
+        if self.server is None:
+            return
+        with self.metrics.timed('ingest'):
+            applied = self.server.drain(budget=0.03)
+        if applied:
+            deadlocked = self._served_deadlock
+            if deadlocked and self.server.detector.deadlocked and all(p in self.graph for p in deadlocked):
+                nodes = set(deadlocked)
+                self.deadlock_seeds = nodes
+                self.redraw(supersede=False, highlight_nodes=nodes, focus=nodes,
+                            highlight_edges=cycle_edges(self.engine, nodes),
+                            title="Resource Allocation Graph (Deadlock Detected)")
+            else:
+                self.draw_graph(supersede=False)
+        stats = self.server.stats
+        self.server_label.config(text=f"{stats['clients']} client(s), {stats['applied']} events, "
+                                      f"{stats['deadlocks']} deadlock(s)")
+        self.root.after(100, self.poll_server)
+    
+    def toggle_online_detection(self):
+        if self.online_var.get():
+            self.detector = IncrementalDeadlockDetector(self.engine)
+            if self.detector.deadlocked:
+                messagebox.showwarning("Deadlock Detected", "The current graph is already deadlocked")
+        elif self.detector is not None:
+            self.detector.detach()
+            self.detector = None
+    
+    def report_online_deadlock(self):
+        if self.detector is not None and self.detector.new_cycle:
+            cycle = self.detector.new_cycle
+            messagebox.showwarning("Deadlock Detected", 
+                f"Deadlock formed by the last edge: {' → '.join(cycle_nodes(cycle))}")
+            self.highlight_cycle(cycle)
+    
     def highlight_cycle(self, cycle):
-        self.ax.clear()
-        pos = nx.spring_layout(self.graph, k=0.5, iterations=50)
-        
-        # Get all nodes and edges involved in the cycle
-        cycle_nodes = set()
-        cycle_edges = set()
-        for edge in cycle:
-            cycle_nodes.add(edge[0])
-            cycle_nodes.add(edge[1])
-            cycle_edges.add((edge[0], edge[1]))
-        
-        # Draw all nodes
-        process_nodes = [n for n, attr in self.graph.nodes(data=True) if attr.get('type') == 'process']
-        resource_nodes = [n for n, attr in self.graph.nodes(data=True) if attr.get('type') == 'resource']
-        
-        # Draw non-cycle nodes normally
-        nx.draw_networkx_nodes(self.graph, pos, nodelist=[n for n in process_nodes if n not in cycle_nodes], 
-                              node_color='skyblue', node_size=800, ax=self.ax)
-        nx.draw_networkx_nodes(self.graph, pos, nodelist=[n for n in resource_nodes if n not in cycle_nodes], 
-                              node_color='lightgreen', node_size=800, ax=self.ax)
-        
-        # Highlight cycle nodes
-        nx.draw_networkx_nodes(self.graph, pos, nodelist=[n for n in process_nodes if n in cycle_nodes], 
-                              node_color='red', node_size=1000, ax=self.ax)
-        nx.draw_networkx_nodes(self.graph, pos, nodelist=[n for n in resource_nodes if n in cycle_nodes], 
-                              node_color='red', node_size=1000, ax=self.ax)
-        
-        # Draw all edges
-        nx.draw_networkx_edges(self.graph, pos, edgelist=[e for e in self.graph.edges() if e not in cycle_edges], 
-                              arrowstyle='->', arrowsize=20, ax=self.ax)
-        
-        # Highlight cycle edges
-        nx.draw_networkx_edges(self.graph, pos, edgelist=[e for e in self.graph.edges() if e in cycle_edges], 
-                              edge_color='red', width=3, arrowstyle='->', arrowsize=20, ax=self.ax)
-        
-        nx.draw_networkx_labels(self.graph, pos, ax=self.ax)
-        self.ax.set_title("Resource Allocation Graph (Deadlock Detected)")
-        self.ax.axis('off')
-        self.figure.tight_layout()
-        self.canvas.draw()
+        # Paint the processes of a wait-for cycle and the RAG edges linking them
+        nodes = {edge[0] for edge in cycle}
+        self.highlight_deadlock(nodes, cycle_edges(self.engine, nodes))
+    
+    def highlight_deadlock(self, cycle_nodes, cycle_edges):
+        # On a large graph only the deadlock's surroundings are drawn
+        self.deadlock_seeds = set(cycle_nodes)
+        self.redraw(highlight_nodes=cycle_nodes, highlight_edges=cycle_edges, focus=cycle_nodes,
+                    title="Resource Allocation Graph (Deadlock Detected)")
+    
+    def relayout(self):
+        self.redraw(relayout=True)
+    
+    def change_layout(self, mode):
+        self.view_layout.set_mode(mode)
+        self.redraw(mode=mode)
+    
+    def change_view(self, mode):
+        self.view_layout.clear()
+        self.draw_graph()
+    
+    def focused_graph(self, focus=None):
+        # The region to draw instead of the whole graph, or None for all of it.
+        # Regions are found from the adjacency of a few nodes, so this costs
+        # the size of the view, not of the graph
+        mode = self.view_var.get()
+        if mode == 'neighborhood':
+            center = self.focus_entry.get().strip()
+            if center not in self.graph:
+                return None
+            try:
+                hops = self.read_count(self.hops_entry)
+            except ValueError:
+                hops = 2
+            region = views.neighborhood(self.graph, [center], hops)
+        elif mode == 'deadlock':
+            if self.detector is not None:
+                seeds = {p for cycle in self.detector.cycles() for p, _ in cycle}
+            else:
+                seeds = self.deadlock_seeds
+            region = views.deadlock_region(self.graph, seeds)
+        elif mode == 'contention':
+            region = views.contention_region(self.graph, self.contention.most_contended(VIEW_RESOURCES))
+        elif focus and len(self.graph) > BACKGROUND_NODES:
+            region = views.neighborhood(self.graph, focus, hops=1)
+        else:
+            return None
+        return views.focus(self.graph, region, VIEW_NODES)
+    
+    def load_scenario(self):
+        path = filedialog.askopenfilename(filetypes=[("Scenario", "*.rag"), ("Snapshot", "*" + columnar.SUFFIX),
+                                                     ("All files", "*")])
+        if not path:
+            return
+        try:
+            # Replace the current graph in one transaction, then redraw once
+            if path.endswith(columnar.SUFFIX):
+                with columnar.load(path) as snap:
+                    snap.populate(self.engine)
+            else:
+                with self.engine.transaction():
+                    self.engine.remove_all()
+                    scenario.load(self.engine, path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Could not load scenario: {e}")
+            return
+        self.draw_graph()
+        if self.detector is not None and self.detector.deadlocked:
+            messagebox.showwarning("Deadlock Detected", "The loaded scenario is deadlocked")
+    
+    def save_scenario(self):
+        path = filedialog.asksaveasfilename(defaultextension=".rag", filetypes=[("Scenario", "*.rag"),
+                                                                                ("Snapshot", "*" + columnar.SUFFIX)])
+        if not path:
+            return
+        try:
+            if path.endswith(columnar.SUFFIX):
+                columnar.save(self.engine, path)
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    scenario.dump(self.engine, f)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save scenario: {e}")
     
     def remove_all(self):
         if messagebox.askyesno("Confirm", "Are you sure you want to remove all nodes and edges?"):
-            self.graph.clear()
+            if self.avoidance is not None:
+                self.avoidance.clear()
+            else:
+                self.engine.remove_all()
             self.draw_graph()
     
-    def draw_graph(self):
-        self.ax.clear()
-        if not self.graph.nodes():
-            self.ax.text(0.5, 0.5, "Add processes and resources to begin", ha='center', va='center', fontsize=12)
-            self.canvas.draw()
+    def draw_graph(self, supersede=True):
+        self.redraw(supersede=supersede)
+    
+    def redraw(self, supersede=True, focus=None, **view):
+        # Small graphs and focused views are drawn here; large graphs are
+        # copied and handed to the worker. Only the worker touches
+        # self.layout while it is busy. A redraw that does not supersede
+        # waits for the running job instead of cancelling it, so a steady
+        # stream of updates cannot starve it
+        focused = self.focused_graph(focus)
+        if focused is not None:
+            if self.worker.busy:
+                if not supersede:
+                    self._deferred = dict(view, focus=focus)
+                    self.watch_worker()
+                    return
+                self.worker.cancel()
+            self.render_view(focused, progress=None, layout=self.view_layout, **view)
+            self.show_canvas()
             return
-        
-        pos = nx.spring_layout(self.graph, k=0.5, iterations=50)
-        process_nodes = [n for n, attr in self.graph.nodes(data=True) if attr.get('type') == 'process']
-        resource_nodes = [n for n, attr in self.graph.nodes(data=True) if attr.get('type') == 'resource']
-        
-        # Draw nodes
-        nx.draw_networkx_nodes(self.graph, pos, nodelist=process_nodes, node_color='skyblue', node_size=800, ax=self.ax)
-        nx.draw_networkx_nodes(self.graph, pos, nodelist=resource_nodes, node_color='lightgreen', node_size=800, ax=self.ax)
-        
-        # Draw edges with different styles for request and allocation
-        request_edges = [(u, v) for u, v, d in self.graph.edges(data=True) if d.get('type') == 'request']
-        allocation_edges = [(u, v) for u, v, d in self.graph.edges(data=True) if d.get('type') == 'allocation']
-        
-        nx.draw_networkx_edges(self.graph, pos, edgelist=request_edges, edge_color='orange', 
-                              style='dashed', arrowstyle='->', arrowsize=20, ax=self.ax)
-        nx.draw_networkx_edges(self.graph, pos, edgelist=allocation_edges, edge_color='green', 
-                              arrowstyle='->', arrowsize=20, ax=self.ax)
-        
-        # Draw labels
-        nx.draw_networkx_labels(self.graph, pos, ax=self.ax)
-        
-        # Add legend
-        self.ax.plot([], [], color='orange', linestyle='dashed', label='Request Edge')
-        self.ax.plot([], [], color='green', label='Allocation Edge')
-        self.ax.legend(loc='upper right')
-        
-        self.ax.set_title("Resource Allocation Graph")
-        self.ax.axis('off')
-        self.figure.tight_layout()
-        self.canvas.draw()
+        if len(self.graph) <= BACKGROUND_NODES and not self.worker.busy:
+            self.render_view(self.graph, progress=None, **view)
+            self.show_canvas()
+            return
+        if self.worker.busy and not supersede:
+            self._deferred = view
+            self.watch_worker()
+            return
+        self._deferred = None
+        width, height = self.canvas.get_width_height()
+        self.worker.submit(self._render_snapshot, snapshot(self.engine), width, height, view,
+                           on_done=self.show_image, on_error=self.background_failed)
+        self.watch_worker()
+    
+    def render_view(self, graph, progress, highlight_nodes=(), highlight_edges=(),
+                    title="Resource Allocation Graph", relayout=False, mode=None, size=None, layout=None):
+        # Lay out and draw graph, on the Tk canvas or (with size) offscreen
+        layout = layout or self.layout
+        with self.metrics.timed('layout'):
+            if mode is not None:
+                layout.set_mode(mode)
+            if relayout:
+                layout.relayout(graph)
+            pos = layout.update(graph)
+        if progress is not None:
+            progress(0.6, "Rendering")
+        with self.metrics.timed('render'):
+            if size is None:
+                return self.renderer.render(graph, pos, highlight_nodes, highlight_edges, title)
+            if self.offscreen is None:
+                self.offscreen = OffscreenRenderer(*size, dpi=self.figure.dpi)
+            self.offscreen.resize(*size)
+            return self.offscreen.render(graph, pos, highlight_nodes, highlight_edges, title)
+    
+    def _render_snapshot(self, snap, width, height, view, progress):
+        # Runs on the worker thread
+        progress(0.1, "Copying graph")
+        graph = snapshot_graph(snap)
+        progress(0.3, "Layout")
+        return self.render_view(graph, progress, size=(width, height), **view)
+    
+    def show_canvas(self):
+        if self.image_ax.get_visible():
+            self.image_ax.set_visible(False)
+            self.ax.set_visible(True)
+            self.canvas.draw_idle()
+    
+    def show_image(self, rgba):
+        self.image.set_data(rgba)
+        self.image_ax.set_visible(True)
+        self.ax.set_visible(False)
+        self.canvas.draw_idle()
+    
+    def watch_worker(self):
+        if not self._watching:
+            self._watching = True
+            self.root.after(50, self.poll_worker)
+    
+    def poll_worker(self):
+        # Delivers worker results on the Tk thread and shows progress
+        status = self.worker.poll()
+        if status is None and self._deferred is not None and not self.worker.busy:
+            view, self._deferred = self._deferred, None
+            self.redraw(**view)
+            status = self.worker.poll()
+        if status is None and not self.worker.busy:
+            self._watching = False
+            self.progress['value'] = 0
+            self.progress_label.config(text="")
+            return
+        if status is not None:
+            fraction, message = status
+            self.progress['value'] = fraction
+            self.progress_label.config(text=message)
+        self.root.after(50, self.poll_worker)
 
-root = tk.Tk()
-app = ResourceAllocationGraph(root)
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = ResourceAllocationGraph(root)
+    root.mainloop()